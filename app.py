@@ -1,91 +1,189 @@
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Blueprint, Response, render_template, jsonify, request, g, current_app
+from flask.json.provider import DefaultJSONProvider
 from dotenv import load_dotenv
 import os
-import requests
-import json
-from pymongo import MongoClient
+import time
 import logging
-import certifi
 from datetime import datetime, timedelta
-import yfinance as yf
+from quote_service import get_quotes, cache_stats, QUOTE_FETCH_TIMEOUT
+from price_stream import PriceBroadcaster
+from history_store import history_store, format_timestamps, validate_symbol
+from graph_snapshots import dashboard_snapshot, build_dashboard_graphs
+from price_repository import latest_prices, last_price
+from rollups import query_range
+from downsample import lttb_indices
+from wire_format import COLUMNS_MEDIA_TYPE, wants_columns, encode_columns
+from symbol_directory import symbol_directory, SEARCH_DEFAULT_LIMIT
+from fanout import Deadline, gather, DEADLINE_EXCEEDED
+from circuit_breaker import breaker_stats
+from upstream_gateway import upstream_gateway
+from job_executor import read_job_stats
+from metrics import REGISTRY, CONTENT_TYPE, HTTP_LATENCY, HTTP_REQUESTS, METRICS_MULTIPROC_DIR
+from mongo_pool import get_db, get_collection, pool_stats
+from lottery import GAMES as LOTTERY_GAMES, lottery_archive, process_lottery_data, format_lottery_number
+from ticket_checker import ticket_checker
+import profiling
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
+class TracedJSONProvider(DefaultJSONProvider):
+    """Records JSON encoding as a serialization span of the request"""
+
+    def dumps(self, obj, **kwargs):
+        with profiling.span('serialize', 'json'):
+            return super().dumps(obj, **kwargs)
+
+# Routes live on a blueprint so create_app() can build the app in each worker
+bp = Blueprint('stockstream', __name__)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# MongoDB setup
-MONGODB_URI = os.getenv('MONGODB_URI')
-try:
-    client = MongoClient(MONGODB_URI, tlsCAFile=certifi.where())
-    db = client.stockstream
-    lottery_collection = db.lottery_results
-    prices_collection = db.prices
-    logger.info("Successfully connected to MongoDB Atlas")
-except Exception as e:
-    logger.error(f"Error connecting to MongoDB Atlas: {str(e)}")
-    db = None
+# MongoDB setup: every request thread shares the process's connection pool
+# (see mongo_pool), created on first use rather than at import
+def get_prices_collection():
+    """Return the price collection, or None if MongoDB is not configured"""
+    try:
+        return get_collection()
+    except Exception as e:
+        logger.error(f"Error connecting to MongoDB: {str(e)}")
+        return None
 
 # Market data endpoints
 STOCKS = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'NVDA']  # Top 5 stocks
 CRYPTO = ['BTC-USD', 'ETH-USD', 'BNB-USD', 'SOL-USD', 'XRP-USD']  # Top 5 cryptos
 
-@app.route('/api/market/summary')
+# Oldest stored price served in place of a quote upstream cannot provide
+STORED_QUOTE_MAX_AGE = int(os.getenv('STORED_QUOTE_MAX_AGE', str(24 * 3600)))
+
+# Seconds browsers may reuse the dashboard graphs before revalidating
+DASHBOARD_MAX_AGE = int(os.getenv('DASHBOARD_MAX_AGE', '60'))
+
+# One shared producer feeds every /api/stream/prices subscriber
+price_broadcaster = PriceBroadcaster(STOCKS + CRYPTO)
+
+@bp.before_app_request
+def start_timer():
+    g.started = time.perf_counter()
+    # Every request collects spans in case it turns out slow; only chosen ones are sampled
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.trace = profiling.begin(f"{request.method} {route}", profiling.should_profile(request.headers))
+
+@bp.after_app_request
+def record_request(response):
+    # Label by route pattern so /api/historical/<symbol> is one series
+    started = g.get('started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        HTTP_LATENCY.labels(route, request.method).observe(time.perf_counter() - started)
+        HTTP_REQUESTS.labels(route, request.method, str(response.status_code)).inc()
+    trace = g.get('trace')
+    if trace is not None and profiling.finish(trace):
+        response.headers['X-Profile-Id'] = trace.id
+    return response
+
+@bp.before_app_request
+def start_deadline():
+    # Every upstream call a request makes shares one time budget
+    g.deadline = Deadline()
+    g.partial = []
+
+@bp.after_app_request
+def report_partial(response):
+    # Name the parts of a response left out because their upstream failed
+    partial = g.get('partial')
+    if partial:
+        response.headers['X-Partial'] = ','.join(dict.fromkeys(partial))
+    return response
+
+def fetch_quotes(symbols, deadline=None):
+    """Fetch quotes for all symbols in one batch under a deadline, logging the ones that failed
+
+    Defaults to the current request's deadline, in which case the failed
+    symbols are also reported in the response's X-Partial header.
+    """
+    in_request = deadline is None
+    deadline = deadline or g.deadline
+    remaining = deadline.remaining()
+    quotes, errors = get_quotes(symbols, min(QUOTE_FETCH_TIMEOUT, remaining), remaining, serve_stale=True)
+    for symbol, error in errors.items():
+        logger.error(f"Error fetching data for {symbol}: {error}")
+    
+    # Fall back to the collector's last stored price
+    if errors:
+        stored = stored_quotes(errors)
+        quotes = {symbol: quotes.get(symbol) or stored.get(symbol) for symbol in symbols
+                  if symbol in quotes or symbol in stored}
+        errors = [symbol for symbol in errors if symbol not in stored]
+    if in_request:
+        g.partial.extend(errors)
+    return quotes
+
+def stored_quotes(symbols):
+    """Return the last stored price of each symbol as a quote tagged stale with its age"""
+    prices_collection = get_prices_collection()
+    if prices_collection is None:
+        return {}
+    now = datetime.utcnow()
+    since = now - timedelta(seconds=STORED_QUOTE_MAX_AGE)
+    quotes = {}
+    for symbol in symbols:
+        try:
+            row = last_price(prices_collection, symbol, since)
+        except Exception as e:
+            logger.error(f"Error reading stored price for {symbol}: {str(e)}")
+            continue
+        if row is not None:
+            quotes[symbol] = {
+                'symbol': symbol,
+                'price': row['price'],
+                'previous_close': row['price'],
+                'change': 0,
+                'volume': row.get('volume', 0),
+                'stale': True,
+                'age': round((now - row['timestamp']).total_seconds(), 1)
+            }
+    return quotes
+
+def freshness(quote):
+    """Staleness fields to add to a response item built from quote"""
+    return {'stale': True, 'age': quote['age']} if quote.get('stale') else {}
+
+@bp.route('/api/market/summary')
 def get_market_summary():
     try:
         # Fetch data for major indices and BTC
         symbols = ['^GSPC', '^IXIC', 'BTC-USD']
         data = {}
+        quotes = fetch_quotes(symbols)
         
         for symbol in symbols:
-            try:
-                ticker = yf.Ticker(symbol)
-                info = ticker.fast_info  # Use fast_info instead of info
-                current = float(info.last_price if hasattr(info, 'last_price') else 0)
-                prev_close = float(info.previous_close if hasattr(info, 'previous_close') else current)
-                change = ((current - prev_close) / prev_close * 100) if prev_close else 0
-                
-                data[symbol] = {
-                    'price': current,
-                    'change': round(change, 2)
-                }
-            except Exception as e:
-                logger.error(f"Error fetching data for {symbol}: {str(e)}")
-                data[symbol] = {
-                    'price': 0,
-                    'change': 0
-                }
+            quote = quotes.get(symbol, {'price': 0, 'change': 0})
+            data[symbol] = {
+                'price': quote['price'],
+                'change': quote['change'],
+                **freshness(quote)
+            }
         
         return jsonify(data)
     except Exception as e:
         logger.error(f"Error fetching market summary: {str(e)}")
         return jsonify({'error': 'Failed to fetch market data'}), 500
 
-@app.route('/api/market/movers')
+@bp.route('/api/market/movers')
 def get_market_movers():
     try:
         # List of popular stocks to track
         symbols = STOCKS
         movers = []
         
-        for symbol in symbols:
-            try:
-                ticker = yf.Ticker(symbol)
-                info = ticker.fast_info  # Use fast_info instead of info
-                current = float(info.last_price if hasattr(info, 'last_price') else 0)
-                prev_close = float(info.previous_close if hasattr(info, 'previous_close') else current)
-                change = ((current - prev_close) / prev_close * 100) if prev_close else 0
-                
-                movers.append({
-                    'symbol': symbol,
-                    'price': current,
-                    'change': round(change, 2)
-                })
-            except Exception as e:
-                logger.error(f"Error fetching data for {symbol}: {str(e)}")
-                continue
+        for symbol, quote in fetch_quotes(symbols).items():
+            movers.append({
+                'symbol': symbol,
+                'price': quote['price'],
+                'change': quote['change'],
+                **freshness(quote)
+            })
         
         # Sort by absolute change percentage
         movers.sort(key=lambda x: abs(x['change']), reverse=True)
@@ -94,7 +192,95 @@ def get_market_movers():
         logger.error(f"Error fetching market movers: {str(e)}")
         return jsonify({'error': 'Failed to fetch market movers'}), 500
 
-@app.route('/api/historical/<symbol>')
+@bp.route('/api/quotes/stats')
+def get_quote_cache_stats():
+    return jsonify(cache_stats())
+
+@bp.route('/api/upstreams')
+def get_upstream_health():
+    return jsonify({
+        'circuits': breaker_stats(),
+        'gateway': upstream_gateway.stats(),
+        'mongo': pool_stats()
+    })
+
+def stats_metrics():
+    """Report the counters kept by the caches, breakers and upstream gateway as metrics"""
+    quotes = cache_stats()
+    cache_requests = [
+        ([('cache', 'quote'), ('result', 'hit')], quotes['hits']),
+        ([('cache', 'quote'), ('result', 'coalesced')], quotes['coalesced']),
+        ([('cache', 'quote'), ('result', 'miss')], quotes['misses']),
+    ]
+    hit_ratio = [([('cache', 'quote')], quotes['hit_ratio'])]
+    shared = quotes.get('shared')
+    if shared:
+        cache_requests += [
+            ([('cache', 'shared'), ('result', 'hit')], shared['hits']),
+            ([('cache', 'shared'), ('result', 'miss')], shared['loads']),
+        ]
+        lookups = shared['hits'] + shared['loads']
+        hit_ratio.append(([('cache', 'shared')], shared['hits'] / lookups if lookups else 0))
+    history = history_store.stats()
+    cache_requests += [
+        ([('cache', 'history'), ('result', 'hit')], history['hits']),
+        ([('cache', 'history'), ('result', 'miss')], history['refreshes']),
+        ([('cache', 'history'), ('result', 'stale')], history['stale_serves']),
+    ]
+    lookups = history['hits'] + history['refreshes']
+    hit_ratio.append(([('cache', 'history')], history['hits'] / lookups if lookups else 0))
+
+    families = [
+        ('stockstream_cache_requests_total', 'counter', 'Cache lookups by outcome',
+         [('stockstream_cache_requests_total', labels, value) for labels, value in cache_requests]),
+        ('stockstream_cache_hit_ratio', 'gauge', 'Share of cache lookups served without an upstream call',
+         [('stockstream_cache_hit_ratio', labels, value) for labels, value in hit_ratio]),
+    ]
+
+    circuits = breaker_stats()
+    families += [
+        ('stockstream_circuit_open', 'gauge', 'Whether an upstream circuit breaker is open or half-open',
+         [('stockstream_circuit_open', [('upstream', name)], int(stats['state'] != 'closed'))
+          for name, stats in circuits.items()]),
+        ('stockstream_circuit_rejected_total', 'counter', 'Calls turned away by an open circuit breaker',
+         [('stockstream_circuit_rejected_total', [('upstream', name)], stats['rejected'])
+          for name, stats in circuits.items()]),
+    ]
+
+    gateway = upstream_gateway.stats()
+    waits = gateway['waits'].items()
+    families += [
+        ('stockstream_upstream_queued', 'gauge', 'Upstream calls waiting for a rate limit token',
+         [('stockstream_upstream_queued', [], gateway['queued'])]),
+        ('stockstream_upstream_coalesced_total', 'counter', 'Upstream calls shared with an identical queued call',
+         [('stockstream_upstream_coalesced_total', [], gateway['coalesced'])]),
+        ('stockstream_upstream_queue_wait_seconds', 'summary', 'Time upstream calls waited for a token',
+         [sample for priority, wait in waits for sample in (
+             ('stockstream_upstream_queue_wait_seconds_sum', [('priority', priority)], wait['avg_seconds'] * wait['count']),
+             ('stockstream_upstream_queue_wait_seconds_count', [('priority', priority)], wait['count']))]),
+    ]
+
+    return families
+
+REGISTRY.add_collector(stats_metrics)
+
+# gunicorn workers each count their own requests; with --preload they all
+# write to one directory and a scrape of any of them reports every worker
+if METRICS_MULTIPROC_DIR:
+    REGISTRY.share(METRICS_MULTIPROC_DIR)
+
+@bp.route('/metrics')
+def get_metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+@bp.route('/api/scheduler/jobs')
+def get_scheduler_jobs():
+    stats = read_job_stats()
+    if stats is None:
+        return jsonify({'error': 'Scheduler has not published job stats'}), 503
+    return jsonify(stats)
+
+@bp.route('/api/historical/<symbol>')
 def get_historical_data(symbol):
     try:
         timeframe = request.args.get('timeframe', '1d')
@@ -108,112 +294,119 @@ def get_historical_data(symbol):
         }
         
         interval, period = intervals.get(timeframe, ('5m', '1d'))
+        max_points = request.args.get('max_points', type=int)
         
-        # Fetch historical data
-        ticker = yf.Ticker(symbol)
-        history = ticker.history(period=period, interval=interval)
+        # Serve from the local history store; only missing bars are fetched,
+        # and a backfill that outlasts the request finishes in the background
+        symbol = validate_symbol(symbol)
+        results, errors = gather({'history': lambda: history_store.get(symbol, interval, period)}, g.deadline)
+        if 'history' in errors:
+            logger.error(f"Error fetching historical data for {symbol}: {errors['history']}")
+            g.partial.append(symbol)
+            if errors['history'] == DEADLINE_EXCEEDED:
+                return jsonify({'error': 'Historical data is still loading, try again shortly'}), 504
+            return jsonify({'error': 'Failed to fetch historical data'}), 500
+        bars, tz = results['history']
         
-        # Convert timestamps to string format and ensure all values are JSON serializable
-        data = {
-            'timestamps': [ts.strftime('%Y-%m-%d %H:%M:%S') for ts in history.index],
-            'prices': [float(price) for price in history['Close'].tolist()]
-        }
+        # Keep the chart's shape while dropping points it cannot display
+        if max_points:
+            bars = bars[lttb_indices(bars['ts'], bars['close'], max_points)]
         
-        return jsonify(data)
+        # Columnar clients get packed epoch deltas and prices instead of strings
+        if wants_columns(request):
+            with profiling.span('serialize', 'columns'):
+                body = encode_columns(bars['ts'], bars['close'])
+            response = Response(body, mimetype=COLUMNS_MEDIA_TYPE)
+            response.headers['X-Timezone'] = tz
+        else:
+            # Convert timestamps to string format and ensure all values are JSON serializable
+            response = jsonify({
+                'timestamps': format_timestamps(bars['ts'], tz),
+                'prices': bars['close'].tolist()
+            })
+        response.vary.add('Accept')
+        return response
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error fetching historical data: {str(e)}")
         return jsonify({'error': 'Failed to fetch historical data'}), 500
 
-@app.route('/api/stocks/search')
+@bp.route('/api/series/<symbol>')
+def get_stored_series(symbol):
+    try:
+        # Span of stored OHLCV buckets to return, newest last
+        ranges = {
+            '1d': timedelta(days=1),
+            '1w': timedelta(weeks=1),
+            '1m': timedelta(days=31),
+            '1y': timedelta(days=366),
+            '5y': timedelta(days=5 * 366)
+        }
+        span = ranges.get(request.args.get('range', '1d'), ranges['1d'])
+        end = datetime.utcnow()
+        
+        # The rollup resolution is picked so the bucket count stays bounded
+        resolution, buckets = query_range(get_db(), symbol, end - span, end)
+        
+        return jsonify({
+            'symbol': symbol,
+            'resolution': resolution,
+            'timestamps': [bucket['timestamp'].strftime('%Y-%m-%d %H:%M:%S') for bucket in buckets],
+            'open': [bucket['open'] for bucket in buckets],
+            'high': [bucket['high'] for bucket in buckets],
+            'low': [bucket['low'] for bucket in buckets],
+            'close': [bucket['close'] for bucket in buckets],
+            'volume': [bucket['volume'] for bucket in buckets]
+        })
+    except Exception as e:
+        logger.error(f"Error fetching stored series: {str(e)}")
+        return jsonify({'error': 'Failed to fetch stored series'}), 500
+
+@bp.route('/api/stocks/search')
 def stocks_search():
     try:
-        query = request.args.get('q', '').upper()
+        query = request.args.get('q', '')
+        limit = request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int)
         if not query:
             return jsonify([])
         
-        # List of major stocks for demo
-        demo_stocks = {
-            'AAPL': 'Apple Inc.',
-            'MSFT': 'Microsoft Corporation',
-            'GOOGL': 'Alphabet Inc.',
-            'AMZN': 'Amazon.com Inc.',
-            'TSLA': 'Tesla Inc.',
-            'META': 'Meta Platforms Inc.',
-            'NVDA': 'NVIDIA Corporation'
-        }
-        
-        # Filter stocks based on query
-        matching_symbols = [
-            {'symbol': symbol, 'name': name}
-            for symbol, name in demo_stocks.items()
-            if query in symbol or query.lower() in name.lower()
-        ]
-        
-        return jsonify(matching_symbols)
+        # Ranked prefix, name and typo matches from the symbol listing
+        return jsonify(symbol_directory.search(query, 'stock', limit))
     except Exception as e:
         logger.error(f"Error searching stocks: {str(e)}")
         return jsonify({'error': 'Failed to search stocks'}), 500
 
-@app.route('/api/crypto/search')
+@bp.route('/api/crypto/search')
 def crypto_search():
     try:
-        query = request.args.get('q', '').upper()
+        query = request.args.get('q', '')
+        limit = request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int)
         if not query:
             return jsonify([])
         
-        # Demo list of cryptocurrencies
-        demo_crypto = {
-            'BTC-USD': 'Bitcoin',
-            'ETH-USD': 'Ethereum',
-            'DOGE-USD': 'Dogecoin',
-            'ADA-USD': 'Cardano',
-            'SOL-USD': 'Solana'
-        }
-        
-        # Filter crypto based on query
-        matching_symbols = [
-            {'symbol': symbol, 'name': name}
-            for symbol, name in demo_crypto.items()
-            if query in symbol or query.lower() in name.lower()
-        ]
-        
-        return jsonify(matching_symbols)
+        # Ranked prefix, name and typo matches from the symbol listing
+        return jsonify(symbol_directory.search(query, 'crypto', limit))
     except Exception as e:
         logger.error(f"Error searching cryptocurrencies: {str(e)}")
         return jsonify({'error': 'Failed to search cryptocurrencies'}), 500
 
-@app.route('/api/lottery/latest')
+@bp.route('/api/lottery/latest')
 def get_lottery_results():
     try:
-        current_date = datetime(2024, 12, 7, 13, 56, 23)  # Using the provided time
-        mock_data = {
-            'powerball': {
-                'old_draw_date': '2024-12-04',  # Previous Wednesday
-                'old_numbers': '02 11 22 35 60',
-                'old_powerball': '23',
-                'latest_draw_date': '2024-12-06',  # Latest Friday
-                'latest_numbers': '12 24 36 48 60',
-                'latest_powerball': '15',
-                'next_draw_date': '2024-12-09',  # Next Monday
-                'estimated_jackpot': '$815 Million'
-            },
-            'mega_millions': {
-                'old_draw_date': '2024-12-03',  # Previous Tuesday
-                'old_numbers': '15 28 37 49 65',
-                'old_mega_ball': '12',
-                'latest_draw_date': '2024-12-06',  # Latest Friday
-                'latest_numbers': '07 15 29 38 42',
-                'latest_mega_ball': '18',
-                'next_draw_date': '2024-12-10',  # Next Tuesday
-                'estimated_jackpot': '$415 Million'
-            }
-        }
-        return jsonify(mock_data)
+        # Served from the in-memory draw archive; the scheduler appends new draws
+        results = {game: lottery_archive.latest(game) for game in LOTTERY_GAMES}
+        missing = [game for game, latest in results.items() if latest is None]
+        if len(missing) == len(results):
+            return jsonify({'error': 'Lottery results have not been archived yet'}), 503
+        g.partial.extend(missing)
+        return jsonify(results)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        logger.error(f"Error loading lottery results: {str(e)}")
+        return jsonify({'error': 'Failed to load lottery results'}), 503
 
 # Price data routes
-@app.route('/api/current_prices')
+@bp.route('/api/current_prices')
 def get_current_prices():
     try:
         asset_type = request.args.get('type', 'stock')
@@ -234,27 +427,18 @@ def get_current_prices():
         }
         
         assets = []
-        for symbol in symbols:
-            try:
-                ticker = yf.Ticker(symbol)
-                info = ticker.fast_info
-                current = float(info.last_price if hasattr(info, 'last_price') else 0)
-                prev_close = float(info.previous_close if hasattr(info, 'previous_close') else current)
-                change = ((current - prev_close) / prev_close * 100) if prev_close else 0
-                
-                if current == 0:
-                    logger.error(f"Got zero price for {symbol}, skipping")
-                    continue
-                    
-                assets.append({
-                    'symbol': symbol,
-                    'name': asset_names.get(symbol, symbol),
-                    'price': current,
-                    'change': round(change, 2)
-                })
-            except Exception as e:
-                logger.error(f"Error fetching data for {symbol}: {str(e)}")
+        for symbol, quote in fetch_quotes(symbols).items():
+            if quote['price'] == 0:
+                logger.error(f"Got zero price for {symbol}, skipping")
                 continue
+                
+            assets.append({
+                'symbol': symbol,
+                'name': asset_names.get(symbol, symbol),
+                'price': quote['price'],
+                'change': quote['change'],
+                **freshness(quote)
+            })
         
         if not assets:
             return jsonify({'error': 'No asset data available'}), 500
@@ -264,131 +448,76 @@ def get_current_prices():
         logger.error(f"Error fetching current prices: {str(e)}")
         return jsonify({'error': 'Failed to fetch current prices'}), 500
 
-@app.route('/api/dashboard/graphs')
+@bp.route('/api/stream/prices')
+def stream_prices():
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    return Response(
+        price_broadcaster.stream(last_event_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@bp.route('/api/dashboard/graphs')
 def get_dashboard_graphs():
     try:
-        # Get historical data for stocks
-        stock_data = []
-        for symbol in STOCKS[:5]:  # Only top 5 stocks
-            try:
-                ticker = yf.Ticker(symbol)
-                history = ticker.history(period='1d', interval='5m')
-                if not history.empty:
-                    stock_data.append({
-                        'x': [ts.strftime('%H:%M') for ts in history.index],
-                        'y': [float(price) for price in history['Close'].tolist()],
-                        'name': symbol,
-                        'type': 'scatter',
-                        'mode': 'lines+markers'
-                    })
-            except Exception as e:
-                logger.error(f"Error fetching stock data for {symbol}: {str(e)}")
-                continue
+        max_points = request.args.get('max_points', type=int)
         
-        # Get historical data for crypto
-        crypto_data = []
-        for symbol in CRYPTO[:5]:  # Only top 5 cryptos
-            try:
-                ticker = yf.Ticker(symbol)
-                history = ticker.history(period='1d', interval='5m')
-                if not history.empty:
-                    crypto_data.append({
-                        'x': [ts.strftime('%H:%M') for ts in history.index],
-                        'y': [float(price) for price in history['Close'].tolist()],
-                        'name': symbol,
-                        'type': 'scatter',
-                        'mode': 'lines+markers'
-                    })
-            except Exception as e:
-                logger.error(f"Error fetching crypto data for {symbol}: {str(e)}")
-                continue
-        
-        # Check if we have any data
-        if not stock_data and not crypto_data:
-            return jsonify({'error': 'No historical data available'}), 500
-
-        # Create graph configurations
-        stocks_layout = {
-            'title': 'Stock Performance (24h)',
-            'xaxis': {'title': 'Time'},
-            'yaxis': {'title': 'Price ($)'},
-            'showlegend': True,
-            'legend': {'orientation': 'h', 'y': -0.2},
-            'margin': {'l': 60, 'r': 30, 't': 40, 'b': 80},
-            'height': 500,  # Make it taller
-            'plot_bgcolor': '#ffffff',
-            'paper_bgcolor': '#ffffff',
-            'hovermode': 'x unified'  # Show all values at the same x position
-        }
-
-        crypto_layout = {
-            'title': 'Cryptocurrency Performance (24h)',
-            'xaxis': {'title': 'Time'},
-            'yaxis': {'title': 'Price ($)'},
-            'showlegend': True,
-            'legend': {'orientation': 'h', 'y': -0.2},
-            'margin': {'l': 60, 'r': 30, 't': 40, 'b': 80},
-            'height': 500,  # Make it taller
-            'plot_bgcolor': '#ffffff',
-            'paper_bgcolor': '#ffffff',
-            'hovermode': 'x unified'  # Show all values at the same x position
-        }
+        # Serve the snapshot precomputed by the scheduler
+        snapshot = dashboard_snapshot.variant(max_points)
+        if snapshot is None:
+            # None yet, or the scheduler has stopped publishing: one request rebuilds it
+            dashboard_snapshot.rebuild_if_stale(lambda: build_dashboard_graphs(STOCKS[:5], CRYPTO[:5]))
+            snapshot = dashboard_snapshot.variant(max_points)
+        if snapshot is None:
+            # The rebuild found no data; an expired snapshot beats none
+            snapshot = dashboard_snapshot.variant(max_points, fresh=False)
+            if snapshot is None:
+                return jsonify({'error': 'No historical data available'}), 500
+            g.partial.append('dashboard_graphs')
 
-        return jsonify({
-            'stocks': {
-                'data': stock_data,
-                'layout': stocks_layout
-            },
-            'crypto': {
-                'data': crypto_data,
-                'layout': crypto_layout
-            }
-        })
+        body, version = snapshot
+        response = current_app.response_class(body, mimetype='application/json')
+        response.set_etag(version)
+        response.cache_control.public = True
+        response.cache_control.max_age = DASHBOARD_MAX_AGE
+        return response.make_conditional(request)
     except Exception as e:
         logger.error(f"Error generating dashboard graphs: {str(e)}")
         return jsonify({'error': 'Failed to generate graphs'}), 500
 
-@app.route('/api/dashboard/summary')
+@bp.route('/api/dashboard/summary')
 def get_dashboard_summary():
     try:
         # Get market summary data
         indices = {'^GSPC': 'S&P 500', '^IXIC': 'NASDAQ'}
-        market_data = {}
-        
-        for symbol, name in indices.items():
-            try:
-                ticker = yf.Ticker(symbol)
-                info = ticker.fast_info
-                current = float(info.last_price if hasattr(info, 'last_price') else 0)
-                prev_close = float(info.previous_close if hasattr(info, 'previous_close') else current)
-                change = ((current - prev_close) / prev_close * 100) if prev_close else 0
-                
-                market_data[name] = {
-                    'price': current,
-                    'change': round(change, 2)
-                }
-            except Exception as e:
-                logger.error(f"Error fetching data for {symbol}: {str(e)}")
-        
-        # Get top stocks and crypto from MongoDB
         cutoff_time = datetime.utcnow() - timedelta(hours=24)
+        deadline = g.deadline
+        prices_collection = get_prices_collection()
         
-        # Get latest stock data
-        stocks = list(prices_collection.find({
-            'type': 'stock',
-            'timestamp': {'$gte': cutoff_time}
-        }).sort('timestamp', -1).limit(5))
+        # Quotes and the latest stored stock and crypto prices load concurrently
+        results, errors = gather({
+            'market_indices': lambda: fetch_quotes(list(indices), deadline.nested()),
+            'top_stocks': lambda: latest_prices(prices_collection, 'stock', cutoff_time, limit=5),
+            'top_crypto': lambda: latest_prices(prices_collection, 'crypto', cutoff_time, limit=5)
+        }, deadline)
+        for name, error in errors.items():
+            logger.error(f"Error loading dashboard {name}: {error}")
         
-        # Get latest crypto data
-        crypto = list(prices_collection.find({
-            'type': 'crypto',
-            'timestamp': {'$gte': cutoff_time}
-        }).sort('timestamp', -1).limit(5))
+        market_data = {}
+        quotes = results.get('market_indices', {})
+        for symbol, quote in quotes.items():
+            market_data[indices[symbol]] = {
+                'price': quote['price'],
+                'change': quote['change'],
+                **freshness(quote)
+            }
+        g.partial.extend(symbol for symbol in indices if symbol not in quotes)
+        g.partial.extend(name for name in errors if name != 'market_indices')
         
         return jsonify({
             'market_indices': market_data,
-            'top_stocks': stocks,
-            'top_crypto': crypto
+            'top_stocks': results.get('top_stocks', []),
+            'top_crypto': results.get('top_crypto', [])
         })
         
     except Exception as e:
@@ -396,81 +525,90 @@ def get_dashboard_summary():
         return jsonify({'error': 'Failed to fetch dashboard data'}), 500
 
 # Add routes for dedicated views
-@app.route('/stocks')
+@bp.route('/stocks')
 def stocks_view():
     # Get user's saved stocks
     saved_stocks = STOCKS  # Default list for now
     
     # Fetch current data for saved stocks
     stocks_data = []
-    for symbol in saved_stocks:
-        try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.fast_info
-            current = float(info.last_price if hasattr(info, 'last_price') else 0)
-            prev_close = float(info.previous_close if hasattr(info, 'previous_close') else current)
-            change = ((current - prev_close) / prev_close * 100) if prev_close else 0
-            
-            stocks_data.append({
-                'symbol': symbol,
-                'price': current,
-                'change': round(change, 2)
-            })
-        except Exception as e:
-            logger.error(f"Error fetching data for {symbol}: {str(e)}")
-            continue
+    for symbol, quote in fetch_quotes(saved_stocks).items():
+        stocks_data.append({
+            'symbol': symbol,
+            'price': quote['price'],
+            'change': quote['change'],
+            **freshness(quote)
+        })
     
     return jsonify(stocks_data)
 
-@app.route('/crypto')
+@bp.route('/crypto')
 def crypto_view():
     # Get user's saved cryptocurrencies
     saved_crypto = CRYPTO  # Default list for now
     
     # Fetch current data for saved cryptocurrencies
     crypto_data = []
-    for symbol in saved_crypto:
-        try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.fast_info
-            current = float(info.last_price if hasattr(info, 'last_price') else 0)
-            prev_close = float(info.previous_close if hasattr(info, 'previous_close') else current)
-            change = ((current - prev_close) / prev_close * 100) if prev_close else 0
-            
-            crypto_data.append({
-                'symbol': symbol,
-                'price': current,
-                'change': round(change, 2)
-            })
-        except Exception as e:
-            logger.error(f"Error fetching data for {symbol}: {str(e)}")
-            continue
+    for symbol, quote in fetch_quotes(saved_crypto).items():
+        crypto_data.append({
+            'symbol': symbol,
+            'price': quote['price'],
+            'change': quote['change'],
+            **freshness(quote)
+        })
     
     return jsonify(crypto_data)
 
-@app.route('/lottery/saved')
+# Numbers shown on the lottery page until tickets can be saved per user
+SAVED_TICKETS = {
+    'powerball': [{'numbers': [5, 12, 23, 34, 45], 'powerball': 6}],
+    'mega_millions': [{'numbers': [8, 15, 27, 36, 49], 'mega_ball': 12}],
+}
+
+@bp.route('/lottery/saved')
 def lottery_saved():
     try:
-        # Get saved lottery numbers from MongoDB
-        saved_numbers = {
-            'powerball': {
-                'numbers': ['05', '12', '23', '34', '45'],  # Default numbers for now
-                'powerball': '06'
-            },
-            'mega_millions': {
-                'numbers': ['08', '15', '27', '36', '49'],  # Default numbers for now
-                'mega_ball': '12'
-            }
-        }
-        
-        return jsonify(saved_numbers)
+        # Each saved ticket is scored against every archived draw of its game
+        return jsonify({game: ticket_checker.check(game, tickets) for game, tickets in SAVED_TICKETS.items()})
     except Exception as e:
         logger.error(f"Error fetching saved lottery numbers: {str(e)}")
         return jsonify({'error': 'Failed to fetch saved lottery numbers'}), 500
 
-@app.route('/')
+@bp.route('/api/lottery/check', methods=['POST'])
+def check_lottery_tickets():
+    """Score posted tickets: {"game": "powerball", "tickets": [{"numbers": [...], "powerball": 6}]}"""
+    body = request.get_json(silent=True) or {}
+    game = body.get('game')
+    tickets = body.get('tickets')
+    if game not in LOTTERY_GAMES or not isinstance(tickets, list):
+        return jsonify({'error': f"Expected a game ({', '.join(LOTTERY_GAMES)}) and a list of tickets"}), 400
+    try:
+        return jsonify(ticket_checker.check(game, tickets))
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({'error': f"Invalid ticket: {str(e)}"}), 400
+
+@bp.route('/api/lottery/frequency/<game>')
+def get_lottery_frequency(game):
+    if game not in LOTTERY_GAMES:
+        return jsonify({'error': f"Unknown game {game}"}), 404
+    return jsonify(ticket_checker.frequencies(game))
+
+@bp.route('/')
 def index():
     return render_template('index.html')
 
+def create_app():
+    """Build the Flask app
+
+    Cheap by design: market data libraries (yfinance, pandas) are imported
+    and MongoDB is connected on first use, in the worker that uses them.
+    """
+    app = Flask(__name__)
+    app.json = TracedJSONProvider(app)
+    app.register_blueprint(bp)
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,443 @@
+"""Offline benchmark of the web routes and scheduler jobs
+
+Replays recorded yfinance responses and runs MongoDB queries against the
+in-memory stand-in, so it needs neither network access nor Atlas:
+
+    python benchmark.py record                 # capture fixtures once, online
+    python benchmark.py run --concurrency 1,8,32 --json results.json
+    python benchmark.py run --baseline results.json  # exit 1 on a regression
+    python benchmark.py startup --runs 10      # cold start of a worker
+
+Without a fixtures file, deterministic synthetic ones are generated.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import shutil
+import tempfile
+import threading
+import logging
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BENCH_FIXTURES_PATH = os.getenv('BENCH_FIXTURES_PATH', os.path.join(os.path.dirname(__file__), 'data', 'bench', 'fixtures.json'))
+
+STOCKS = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'NVDA']
+CRYPTO = ['BTC-USD', 'ETH-USD', 'BNB-USD', 'SOL-USD', 'XRP-USD']
+INDICES = ['^GSPC', '^IXIC']
+
+# Each interval is recorded for the longest period a route asks it for
+FIXTURE_SERIES = {'5m': '1d', '15m': '1wk', '1d': '1y'}
+INTERVAL_SECONDS = {'5m': 300, '15m': 900, '1d': 86400}
+
+ROUTES = [
+    '/api/current_prices?type=stock',
+    '/api/current_prices?type=crypto',
+    '/api/market/summary',
+    '/api/market/movers',
+    '/api/dashboard/summary',
+    '/api/dashboard/graphs',
+    '/api/dashboard/graphs?max_points=100',
+    '/api/historical/AAPL?timeframe=1d',
+    '/api/historical/AAPL?timeframe=1y&format=columns',
+    '/api/series/BTC-USD?range=1d',
+    '/api/stocks/search?q=app',
+    '/metrics',
+]
+
+PERCENTILES = (50, 95, 99)
+
+# Modules a worker should not need to import before its first market data request
+HEAVY_MODULES = ['yfinance', 'pandas', 'matplotlib', 'requests']
+
+# Run in a fresh interpreter per measurement. The SRV URI cannot resolve, so
+# any connection attempted at import shows up as a DNS wait.
+STARTUP_SCRIPT = """
+import sys, time, json
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app()
+created = time.perf_counter()
+application.test_client().get('/')
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'ready_ms': (served - started) * 1000,
+    'heavy_modules': [name for name in %r if name in sys.modules]
+}))
+""" % (HEAVY_MODULES,)
+
+
+def summarize(latencies, elapsed):
+    """Return p50/p95/p99 latency in milliseconds and throughput of a run"""
+    latencies = np.asarray(latencies, dtype='f8') * 1000
+    p50, p95, p99 = np.percentile(latencies, PERCENTILES) if len(latencies) else (0, 0, 0)
+    return {
+        'count': len(latencies),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'per_second': round(len(latencies) / elapsed, 1) if elapsed else 0
+    }
+
+
+# Recording and replaying upstream responses
+
+def record_fixtures(path=BENCH_FIXTURES_PATH, symbols=STOCKS + CRYPTO + INDICES):
+    """Fetch fast_info and history of symbols from yfinance and save them as fixtures"""
+    import yfinance as yf
+
+    fixtures = {'recorded_at': time.time(), 'fast_info': {}, 'history': {}}
+    for symbol in symbols:
+        ticker = yf.Ticker(symbol)
+        info = ticker.fast_info
+        fixtures['fast_info'][symbol] = {
+            'last_price': float(info.last_price),
+            'previous_close': float(info.previous_close),
+            'volume': float(info.volume or 0)
+        }
+        fixtures['history'][symbol] = {}
+        for interval, period in FIXTURE_SERIES.items():
+            frame = ticker.history(period=period, interval=interval)
+            fixtures['history'][symbol][interval] = {
+                'tz': str(frame.index.tz or 'UTC'),
+                'bars': [[int(ts.timestamp()), *map(float, row)] for ts, row in
+                         zip(frame.index, frame[['Open', 'High', 'Low', 'Close', 'Volume']].itertuples(index=False))]
+            }
+        logger.info(f"Recorded {symbol}")
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(fixtures, f)
+    return fixtures
+
+
+def synthetic_fixtures(symbols=STOCKS + CRYPTO + INDICES, seed=0):
+    """Deterministic random-walk fixtures with the shape of recorded ones"""
+    rng = np.random.default_rng(seed)
+    now = int(time.time())
+    fixtures = {'recorded_at': now, 'fast_info': {}, 'history': {}}
+    for symbol in symbols:
+        base = float(rng.uniform(1, 500)) * (100 if symbol.startswith('^') or symbol == 'BTC-USD' else 1)
+        tz = 'UTC' if symbol.endswith('-USD') else 'America/New_York'
+        fixtures['history'][symbol] = {}
+        for interval, period in FIXTURE_SERIES.items():
+            step = INTERVAL_SECONDS[interval]
+            count = {'1d': 288, '1wk': 672, '1y': 365}[period]
+            close = base * np.exp(np.cumsum(rng.normal(0, 0.002 * np.sqrt(step / 300), count)))
+            start = now - now % step - count * step
+            fixtures['history'][symbol][interval] = {
+                'tz': tz,
+                'bars': [[start + i * step, c, c * 1.001, c * 0.999, c, float(rng.integers(1000, 100000))]
+                         for i, c in enumerate(close.tolist())]
+            }
+        last = fixtures['history'][symbol]['5m']['bars']
+        fixtures['fast_info'][symbol] = {
+            'last_price': last[-1][4],
+            'previous_close': last[0][4],
+            'volume': float(sum(bar[5] for bar in last))
+        }
+    return fixtures
+
+
+def load_fixtures(path=BENCH_FIXTURES_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        logger.warning(f"No fixtures at {path}; using synthetic ones (run `benchmark.py record` to capture real data)")
+        return synthetic_fixtures()
+
+
+class ReplayTicker:
+    """Stands in for yfinance.Ticker, answering from recorded fixtures
+
+    Bars are shifted forward by whole intervals so the newest recorded bar
+    is the current one, as if the fixtures had just been recorded.
+    """
+
+    def __init__(self, fixtures, symbol, latency=0.0):
+        self._fixtures = fixtures
+        self._symbol = symbol
+        self._latency = latency
+
+    @property
+    def fast_info(self):
+        if self._latency:
+            time.sleep(self._latency)
+        info = self._fixtures['fast_info'].get(self._symbol, {})
+        return SimpleNamespace(last_price=info.get('last_price', 0),
+                               previous_close=info.get('previous_close', 0),
+                               volume=info.get('volume', 0))
+
+    def history(self, period=None, interval='1d', start=None):
+        if self._latency:
+            time.sleep(self._latency)
+        from history_store import PERIOD_SECONDS
+
+        series = self._fixtures['history'].get(self._symbol, {}).get(interval)
+        columns = ['Open', 'High', 'Low', 'Close', 'Volume']
+        if not series or not series['bars']:
+            return pd.DataFrame(columns=columns, index=pd.DatetimeIndex([], tz='UTC'))
+
+        bars = np.asarray(series['bars'], dtype='f8')
+        step = INTERVAL_SECONDS.get(interval, 60)
+        now = time.time()
+        bars[:, 0] += (now - bars[-1, 0]) // step * step
+        if start is not None:
+            since = start.timestamp() if isinstance(start, datetime) else float(start)
+        else:
+            since = bars[-1, 0] - PERIOD_SECONDS.get(period, PERIOD_SECONDS['1y'])
+        bars = bars[bars[:, 0] >= since]
+        index = pd.to_datetime(bars[:, 0].astype('i8'), unit='s', utc=True).tz_convert(series['tz'])
+        return pd.DataFrame(bars[:, 1:], index=index, columns=columns)
+
+
+# Offline environment
+
+def prepare_environment(fixtures, workdir, upstream_latency=0.0, mongo_latency=0.0):
+    """Point every store at workdir, MongoDB at the stand-in and yfinance at the fixtures
+
+    Must run before app, data_collector or graph_generator are imported.
+    """
+    os.environ.update({
+        'MONGODB_URI': 'memory://benchmark',
+        'HISTORY_DIR': os.path.join(workdir, 'history'),
+        'SHARED_CACHE_PATH': os.path.join(workdir, 'cache', 'shared.sqlite'),
+        'GRAPH_STATE_PATH': os.path.join(workdir, 'graphs', 'render_state.json'),
+        'DASHBOARD_SNAPSHOT_PATH': os.path.join(workdir, 'snapshots', 'dashboard_graphs.json'),
+        'SCHEDULER_STATS_PATH': os.path.join(workdir, 'scheduler', 'jobs.json'),
+    })
+
+    import pymongo
+    import yfinance
+    import mongo_standin
+
+    mongo_standin.OPERATION_LATENCY = mongo_latency
+    pymongo.MongoClient = mongo_standin.MemoryClient
+    yfinance.Ticker = lambda symbol, *args, **kwargs: ReplayTicker(fixtures, symbol, upstream_latency)
+
+    seed_database(mongo_standin.MemoryClient('memory://benchmark').stockstream, fixtures)
+
+
+def seed_database(db, fixtures):
+    """Fill the price and hourly rollup collections from the 5 minute fixture bars"""
+    now = time.time()
+    ticks, hourly = [], {}
+    for symbols, asset_type in ((STOCKS, 'stock'), (CRYPTO, 'crypto')):
+        for symbol in symbols:
+            bars = fixtures['history'].get(symbol, {}).get('5m', {}).get('bars', [])
+            shift = (now - bars[-1][0]) // 300 * 300 if bars else 0
+            for ts, open_, high, low, close, volume in bars:
+                when = datetime.fromtimestamp(ts + shift, tz=timezone.utc).replace(tzinfo=None)
+                ticks.append({'timestamp': when, 'meta': {'symbol': symbol, 'type': asset_type},
+                              'price': close, 'volume': volume})
+                hour = when.replace(minute=0, second=0, microsecond=0)
+                bucket = hourly.get((symbol, hour))
+                if bucket is None:
+                    hourly[(symbol, hour)] = {'symbol': symbol, 'type': asset_type, 'timestamp': hour,
+                                              'open': open_, 'high': high, 'low': low,
+                                              'close': close, 'volume': volume}
+                else:
+                    bucket.update(high=max(bucket['high'], high), low=min(bucket['low'], low),
+                                  close=close, volume=bucket['volume'] + volume)
+    db.stock_crypto_prices.insert_many(ticks)
+    db.price_rollups_1h.insert_many(list(hourly.values()))
+    logger.info(f"Seeded {len(ticks)} ticks and {len(hourly)} hourly buckets")
+
+
+# Measurements
+
+def bench_route(app, route, concurrency, requests):
+    """Issue requests GETs of route from concurrency threads"""
+    local = threading.local()
+
+    def issue(_):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        started = time.perf_counter()
+        response = client.get(route)
+        response.get_data()
+        return time.perf_counter() - started, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(issue, range(requests)))
+    elapsed = time.perf_counter() - started
+
+    stats = summarize([latency for latency, _ in results], elapsed)
+    stats['errors'] = sum(1 for _, status in results if status >= 500)
+    return stats
+
+
+def bench_job(func, runs):
+    """Run a job runs times back to back"""
+    latencies = []
+    failures = 0
+    started = time.perf_counter()
+    for _ in range(runs):
+        run_started = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            logger.error(f"Benchmark job failed: {str(e)}")
+            failures += 1
+        latencies.append(time.perf_counter() - run_started)
+    stats = summarize(latencies, time.perf_counter() - started)
+    stats['errors'] = failures
+    return stats
+
+
+def run_benchmark(fixtures, concurrency_levels, requests, job_runs, upstream_latency, mongo_latency):
+    workdir = tempfile.mkdtemp(prefix='stockstream-bench-')
+    try:
+        return _run_benchmark(fixtures, workdir, concurrency_levels, requests, job_runs, upstream_latency, mongo_latency)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _run_benchmark(fixtures, workdir, concurrency_levels, requests, job_runs, upstream_latency, mongo_latency):
+    prepare_environment(fixtures, workdir, upstream_latency, mongo_latency)
+
+    import app as web
+    import data_collector
+    import graph_generator
+    from graph_snapshots import refresh_dashboard_snapshot
+
+    graph_generator.GRAPHS_DIR = os.path.join(workdir, 'graphs')
+
+    results = {'routes': {}, 'jobs': {}}
+
+    def collect():
+        data_collector.fetch_and_store_prices()
+        data_collector.flush_prices()
+
+    # Jobs first: they publish the snapshot and history the routes serve
+    jobs = {
+        'collect_prices': collect,
+        'dashboard_snapshot': lambda: refresh_dashboard_snapshot(STOCKS, CRYPTO),
+        'update_graphs': graph_generator.update_all_graphs,
+    }
+    for name, func in jobs.items():
+        results['jobs'][name] = bench_job(func, job_runs)
+
+    # One untimed pass warms caches and history files, as a running server would have
+    client = web.app.test_client()
+    for route in ROUTES:
+        client.get(route)
+
+    for route in ROUTES:
+        results['routes'][route] = {
+            str(concurrency): bench_route(web.app, route, concurrency, requests)
+            for concurrency in concurrency_levels
+        }
+    return results
+
+
+def bench_startup(runs):
+    """Median cold-start timings of a worker over runs fresh interpreters"""
+    env = dict(os.environ, MONGODB_URI='mongodb+srv://startup.invalid/stockstream')
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                env=env, capture_output=True, text=True, check=True).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    result = {key: round(float(np.median([sample[key] for sample in samples])), 1)
+              for key in ('import_ms', 'create_app_ms', 'first_request_ms', 'ready_ms')}
+    result['heavy_modules'] = samples[-1]['heavy_modules']
+    return result
+
+
+def find_regressions(results, baseline, tolerance):
+    """List measurements whose p95 grew by more than tolerance over the baseline"""
+    regressions = []
+    for section in ('routes', 'jobs'):
+        for name, current in results.get(section, {}).items():
+            previous = baseline.get(section, {}).get(name)
+            if previous is None:
+                continue
+            pairs = [(current, previous, name)] if section == 'jobs' else [
+                (current[level], previous[level], f"{name} @{level}") for level in current if level in previous]
+            for now, before, label in pairs:
+                # Sub-millisecond timings are mostly noise
+                if before['p95_ms'] >= 1 and now['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+                    regressions.append(f"{label}: p95 {before['p95_ms']}ms -> {now['p95_ms']}ms")
+    return regressions
+
+
+def print_results(results):
+    header = f"{'':44} {'conc':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'err':>4}"
+    print(header)
+    print('-' * len(header))
+    for name, stats in results['jobs'].items():
+        print(f"{'job ' + name:44} {1:>5} {stats['p50_ms']:>9} {stats['p95_ms']:>9} "
+              f"{stats['p99_ms']:>9} {stats['per_second']:>9} {stats['errors']:>4}")
+    for route, levels in results['routes'].items():
+        for level, stats in levels.items():
+            print(f"{route[:44]:44} {level:>5} {stats['p50_ms']:>9} {stats['p95_ms']:>9} "
+                  f"{stats['p99_ms']:>9} {stats['per_second']:>9} {stats['errors']:>4}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record = commands.add_parser('record', help='capture yfinance responses as fixtures')
+    record.add_argument('--fixtures', default=BENCH_FIXTURES_PATH)
+
+    run = commands.add_parser('run', help='benchmark routes and jobs offline')
+    run.add_argument('--fixtures', default=BENCH_FIXTURES_PATH)
+    run.add_argument('--concurrency', default='1,8,32', help='comma-separated thread counts')
+    run.add_argument('--requests', type=int, default=200, help='requests per route and concurrency level')
+    run.add_argument('--job-runs', type=int, default=5)
+    run.add_argument('--upstream-latency', type=float, default=0.0, help='seconds added to each replayed yfinance call')
+    run.add_argument('--mongo-latency', type=float, default=0.0, help='seconds added to each stand-in MongoDB operation')
+    run.add_argument('--json', help='write the results to this file')
+    run.add_argument('--baseline', help='results file to compare against')
+    run.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 growth over the baseline')
+    startup = commands.add_parser('startup', help='measure worker cold start in fresh interpreters')
+    startup.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    if args.command == 'record':
+        record_fixtures(args.fixtures)
+        return 0
+    if args.command == 'startup':
+        result = bench_startup(args.runs)
+        for key, value in result.items():
+            print(f"{key:18} {value}")
+        return 0
+
+    results = run_benchmark(load_fixtures(args.fixtures), [int(level) for level in args.concurrency.split(',')],
+                            args.requests, args.job_runs, args.upstream_latency, args.mongo_latency)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+import os
+import json
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Processes rendering charts in parallel
+GRAPH_RENDER_WORKERS = int(os.getenv('GRAPH_RENDER_WORKERS', str(min(4, os.cpu_count() or 1))))
+# Content hashes of the inputs each chart was last rendered from
+GRAPH_STATE_PATH = os.getenv('GRAPH_STATE_PATH', os.path.join(os.path.dirname(__file__), 'data', 'graphs', 'render_state.json'))
+# Bump when the drawing code changes so every chart is redrawn once
+RENDER_VERSION = '1'
+
+
+def performance_frame(rows):
+    """Pivot price rows into percentage change per symbol, one column each
+
+    Duplicate (timestamp, symbol) rows keep the last price instead of
+    failing the pivot, and a symbol whose first tick comes late is measured
+    from its own first price.
+    """
+    if not rows:
+        return pd.DataFrame()
+    df = pd.DataFrame(rows)
+    prices = df.pivot_table(index='timestamp', columns='symbol', values='price', aggfunc='last').sort_index()
+    prices = prices.ffill()
+    first = prices.bfill().iloc[0]
+    return (prices - first) / first * 100
+
+
+def frame_digest(frame, title):
+    """Hash everything a chart is drawn from"""
+    digest = hashlib.sha256(f"{RENDER_VERSION}\0{title}\0{','.join(map(str, frame.columns))}".encode())
+    digest.update(np.ascontiguousarray(frame.index.values.astype('datetime64[ns]').view('i8')).tobytes())
+    digest.update(np.ascontiguousarray(frame.to_numpy(dtype='f8')).tobytes())
+    return digest.hexdigest()
+
+
+def render_chart(path, title, frame):
+    """Draw a percentage-change chart and atomically replace the PNG at path
+
+    Uses a standalone Figure on the Agg canvas, so no pyplot global state is
+    shared between concurrent renders.
+    """
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(12, 6))
+    ax = fig.add_subplot()
+    for column in frame.columns:
+        ax.plot(frame.index, frame[column], label=column, linewidth=2)
+
+    ax.set_title(title)
+    ax.set_xlabel('Time (UTC)')
+    ax.set_ylabel('Percentage Change (%)')
+    ax.grid(True, linestyle='--', alpha=0.7)
+    ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+    fig.tight_layout()
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fig.savefig(tmp_path, format='png')
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_state(path=GRAPH_STATE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_state(state, path=GRAPH_STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def render_charts(charts, state_path=GRAPH_STATE_PATH, workers=GRAPH_RENDER_WORKERS):
+    """Render the charts whose inputs changed since their PNG was last written
+
+    charts is a list of dicts with path, title and frame. Charts are drawn
+    in parallel worker processes; a single chart is drawn in-process to skip
+    the pool's startup cost. Returns {path: 'rendered' | 'unchanged' |
+    'empty' | 'failed'}.
+    """
+    state = load_state(state_path)
+    results = {}
+    jobs = []
+    for chart in charts:
+        path, frame = chart['path'], chart['frame']
+        if frame.empty:
+            logger.warning(f"No data found for {os.path.basename(path)}")
+            results[path] = 'empty'
+            continue
+        digest = frame_digest(frame, chart['title'])
+        if state.get(path) == digest and os.path.exists(path):
+            results[path] = 'unchanged'
+            continue
+        jobs.append((path, chart['title'], frame, digest))
+
+    if len(jobs) == 1 or workers <= 1:
+        for path, title, frame, digest in jobs:
+            results[path] = _render_one(state, path, title, frame, digest)
+    elif jobs:
+        # Spawned workers import only this module, not the caller's database setup
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), mp_context=context) as pool:
+            futures = [(pool.submit(render_chart, path, title, frame), path, digest)
+                       for path, title, frame, digest in jobs]
+            for future, path, digest in futures:
+                try:
+                    future.result()
+                    state[path] = digest
+                    results[path] = 'rendered'
+                except Exception as e:
+                    logger.error(f"Error rendering {os.path.basename(path)}: {str(e)}")
+                    results[path] = 'failed'
+
+    if jobs:
+        save_state(state, state_path)
+    return results
+
+
+def _render_one(state, path, title, frame, digest):
+    try:
+        render_chart(path, title, frame)
+    except Exception as e:
+        logger.error(f"Error rendering {os.path.basename(path)}: {str(e)}")
+        return 'failed'
+    state[path] = digest
+    return 'rendered'
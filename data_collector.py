@@ -1,10 +1,12 @@
-from pymongo import MongoClient
-import yfinance as yf
-from datetime import datetime, timedelta
+from quote_service import get_quotes
+from upstream_gateway import upstream_priority, PRIORITY_BACKGROUND
+from write_buffer import WriteBehindBuffer
+from mongo_pool import get_collection, ping
+from datetime import datetime
 import os
 from dotenv import load_dotenv
-import certifi
 import logging
+import threading
 from time import sleep
 
 # Setup logging
@@ -14,95 +16,78 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-# MongoDB setup
-MONGODB_URI = os.getenv('MONGODB_URI')
-if not MONGODB_URI:
-    raise ValueError("MongoDB URI not found in environment variables")
+# MongoDB setup: writes go through the process's shared connection pool (see
+# mongo_pool), so importing this module (e.g. from the scheduler) neither
+# blocks on the network nor fails offline
+_price_buffer = None
+_setup_lock = threading.Lock()
 
-try:
-    client = MongoClient(MONGODB_URI, tlsCAFile=certifi.where())
-    # Test the connection
-    client.admin.command('ping')
-    db = client.stockstream
-    prices_collection = db.stock_crypto_prices
-    logger.info("Successfully connected to MongoDB")
-except Exception as e:
-    logger.error(f"Error connecting to MongoDB: {str(e)}")
-    raise
+def get_price_buffer():
+    """Return the write-behind buffer price documents are written in bulk through"""
+    global _price_buffer
+    if _price_buffer is None:
+        collection = get_collection()
+        with _setup_lock:
+            if _price_buffer is None:
+                _price_buffer = WriteBehindBuffer(collection)
+    return _price_buffer
 
 # List of assets to track (top 5 only)
 STOCKS = ['AAPL', 'MSFT', 'GOOGL', 'AMZN', 'NVDA']  # Top 5 tech stocks
 CRYPTO = ['BTC-USD', 'ETH-USD', 'BNB-USD', 'SOL-USD', 'XRP-USD']  # Top 5 cryptocurrencies
 
+# Seconds between collections when running the collector standalone
+COLLECT_INTERVAL = float(os.getenv('COLLECT_INTERVAL', '3600'))
+
 def fetch_and_store_prices():
     """Fetch current prices and store in MongoDB"""
     timestamp = datetime.utcnow()
     logger.info(f"Fetching prices at {timestamp}")
     
-    # Fetch and store stock prices
-    for symbol in STOCKS:
-        try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.fast_info
-            price = float(info.last_price if hasattr(info, 'last_price') else 0)
-            volume = float(info.volume if hasattr(info, 'volume') else 0)
-            
-            price_data = {
-                'symbol': symbol,
-                'price': price,
-                'volume': volume,
-                'timestamp': timestamp,
-                'type': 'stock'
-            }
-            
-            prices_collection.insert_one(price_data)
-            logger.info(f"Stored stock price for {symbol}: ${price:.2f}")
-            
-        except Exception as e:
-            logger.error(f"Error fetching stock {symbol}: {str(e)}")
+    # Fetch every tracked asset in one concurrent batch
+    quotes, errors = get_quotes(STOCKS + CRYPTO)
+    for symbol, error in errors.items():
+        asset_type = 'stock' if symbol in STOCKS else 'crypto'
+        logger.error(f"Error fetching {asset_type} {symbol}: {error}")
     
-    # Fetch and store crypto prices
-    for symbol in CRYPTO:
-        try:
-            ticker = yf.Ticker(symbol)
-            info = ticker.fast_info
-            price = float(info.last_price if hasattr(info, 'last_price') else 0)
-            volume = float(info.volume if hasattr(info, 'volume') else 0)
-            
-            price_data = {
-                'symbol': symbol,
-                'price': price,
-                'volume': volume,
-                'timestamp': timestamp,
-                'type': 'crypto'
-            }
-            
-            prices_collection.insert_one(price_data)
-            logger.info(f"Stored crypto price for {symbol}: ${price:.2f}")
-            
-        except Exception as e:
-            logger.error(f"Error fetching crypto {symbol}: {str(e)}")
+    # Queue stock and crypto prices for the next bulk write
+    price_buffer = get_price_buffer()
+    for symbol, quote in quotes.items():
+        asset_type = 'stock' if symbol in STOCKS else 'crypto'
+        price_buffer.add({
+            'timestamp': timestamp,
+            'meta': {'symbol': symbol, 'type': asset_type},
+            'price': quote['price'],
+            'volume': quote['volume']
+        })
+        logger.info(f"Queued {asset_type} price for {symbol}: ${quote['price']:.2f}")
 
-def clear_old_data():
-    """Clear data older than 24 hours"""
-    try:
-        cutoff_time = datetime.utcnow() - timedelta(hours=24)
-        result = prices_collection.delete_many({'timestamp': {'$lt': cutoff_time}})
-        logger.info(f"Cleared {result.deleted_count} old price records")
-    except Exception as e:
-        logger.error(f"Error clearing old data: {str(e)}")
+def flush_prices():
+    """Write all buffered price documents to MongoDB now"""
+    if _price_buffer is None:
+        return 0
+    written = _price_buffer.flush()
+    logger.info(f"Flushed {written} price records")
+    return written
 
 def run_collector():
     """Main function to run the data collection process"""
     try:
+        # Fail fast if the database is unreachable
+        ping()
+        logger.info("Successfully connected to MongoDB")
         while True:
-            fetch_and_store_prices()
-            sleep(3600)  # Wait for 1 hour
-            clear_old_data()  # Clear old data after each collection
+            # Collection yields the upstream to user requests
+            with upstream_priority(PRIORITY_BACKGROUND):
+                fetch_and_store_prices()
+            sleep(COLLECT_INTERVAL)
     except KeyboardInterrupt:
         logger.info("Data collection stopped by user")
     except Exception as e:
         logger.error(f"Error in data collection: {str(e)}")
+    finally:
+        if _price_buffer is not None:
+            _price_buffer.close()
 
 if __name__ == "__main__":
     logger.info("Starting price data collection...")
@@ -1,31 +1,63 @@
-from pymongo import MongoClient
-from datetime import datetime
+from pymongo.errors import OperationFailure
+from datetime import datetime, timedelta
 import os
+import sys
+import logging
 from dotenv import load_dotenv
+from mongo_pool import get_db, PRICES_COLLECTION
+from price_repository import ensure_indexes
+from rollups import setup_rollups
 
 load_dotenv()
 
-# MongoDB connection
-MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017')
-client = MongoClient(MONGO_URI)
-db = client['stockstream']
-collection = db['stock_crypto_prices']
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# The collection the collector writes to and the app reads, through the
+# process's shared connection pool (see mongo_pool)
+COLLECTION_NAME = PRICES_COLLECTION
+
+# Seconds raw price ticks are kept before MongoDB expires them
+PRICE_RETENTION_SECONDS = int(os.getenv('PRICE_RETENTION_SECONDS', str(24 * 3600)))
+
+# Prices are stored as a time series bucketed by {symbol, type}
+TIMESERIES_OPTIONS = {
+    'timeField': 'timestamp',
+    'metaField': 'meta',
+    'granularity': 'seconds'
+}
+
+# Single-field indexes superseded by the compound ones
+LEGACY_INDEXES = ['symbol_1', 'timestamp_-1', 'type_1', 'meta.symbol_1', 'meta.type_1']
 
 # Create indexes for better query performance
 def setup_indexes():
-    collection.create_index([("symbol", 1)])
-    collection.create_index([("timestamp", -1)])
-    collection.create_index([("type", 1)])  # type: 'stock' or 'crypto'
+    collection = get_db()[COLLECTION_NAME]
+    ensure_indexes(collection)
+    existing = collection.index_information()
+    for name in LEGACY_INDEXES:
+        if name in existing:
+            collection.drop_index(name)
 
 # Schema validation
 price_schema = {
     "$jsonSchema": {
         "bsonType": "object",
-        "required": ["symbol", "price", "timestamp", "type"],
+        "required": ["meta", "price", "timestamp"],
         "properties": {
-            "symbol": {
-                "bsonType": "string",
-                "description": "Stock/Crypto symbol - required"
+            "meta": {
+                "bsonType": "object",
+                "required": ["symbol", "type"],
+                "properties": {
+                    "symbol": {
+                        "bsonType": "string",
+                        "description": "Stock/Crypto symbol - required"
+                    },
+                    "type": {
+                        "enum": ["stock", "crypto"],
+                        "description": "Type of asset - required"
+                    }
+                }
             },
             "price": {
                 "bsonType": "double",
@@ -35,10 +67,6 @@ price_schema = {
                 "bsonType": "date",
                 "description": "Timestamp of the price - required"
             },
-            "type": {
-                "enum": ["stock", "crypto"],
-                "description": "Type of asset - required"
-            },
             "volume": {
                 "bsonType": "double",
                 "description": "Trading volume - optional"
@@ -51,12 +79,84 @@ price_schema = {
     }
 }
 
-def setup_database():
+def collection_options(name=COLLECTION_NAME):
+    """Return the options of a collection, or None if it does not exist"""
+    for info in get_db().list_collections(filter={'name': name}):
+        return info.get('options', {})
+    return None
+
+def create_price_collection(name=COLLECTION_NAME):
+    """Create the time-series price collection with native TTL expiry"""
+    db = get_db()
     try:
-        db.command("collMod", "stock_crypto_prices", validator=price_schema)
-    except Exception:
-        db.create_collection("stock_crypto_prices", validator=price_schema)
+        db.create_collection(
+            name,
+            timeseries=TIMESERIES_OPTIONS,
+            expireAfterSeconds=PRICE_RETENTION_SECONDS,
+            validator=price_schema
+        )
+    except OperationFailure as e:
+        # Older servers reject validators on time-series collections
+        logger.warning(f"Creating {name} without schema validation: {str(e)}")
+        db.create_collection(name, timeseries=TIMESERIES_OPTIONS, expireAfterSeconds=PRICE_RETENTION_SECONDS)
+    logger.info(f"Created time-series collection {name} (retention {PRICE_RETENTION_SECONDS}s)")
+
+def migrate_to_timeseries(batch_size=1000, drop_legacy=False):
+    """Move a plain price collection into a new time-series collection
+
+    The old collection is renamed, a time-series collection is created in its
+    place and documents still inside the retention window are copied over in
+    the new {meta: {symbol, type}} shape. The renamed collection is kept for
+    inspection unless drop_legacy is set. Stop the collector while this runs,
+    otherwise its inserts recreate a plain collection under the old name.
+    """
+    db = get_db()
+    collection = db[COLLECTION_NAME]
+    legacy_name = f"{COLLECTION_NAME}_legacy_{datetime.utcnow():%Y%m%d%H%M%S}"
+    db[COLLECTION_NAME].rename(legacy_name)
+    logger.info(f"Renamed {COLLECTION_NAME} to {legacy_name}")
+    create_price_collection()
+
+    cutoff_time = datetime.utcnow() - timedelta(seconds=PRICE_RETENTION_SECONDS)
+    cursor = db[legacy_name].aggregate([
+        {'$match': {'timestamp': {'$gte': cutoff_time}, 'symbol': {'$type': 'string'}}},
+        {'$project': {
+            '_id': 0,
+            'timestamp': 1,
+            'meta': {'symbol': '$symbol', 'type': '$type'},
+            'price': {'$toDouble': '$price'},
+            'volume': {'$toDouble': {'$ifNull': ['$volume', 0]}}
+        }}
+    ], allowDiskUse=True)
+
+    copied = 0
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            copied += len(collection.insert_many(batch, ordered=False).inserted_ids)
+            batch = []
+    if batch:
+        copied += len(collection.insert_many(batch, ordered=False).inserted_ids)
+    logger.info(f"Copied {copied} price records into time-series collection")
+
+    if drop_legacy:
+        db[legacy_name].drop()
+        logger.info(f"Dropped {legacy_name}")
+    return copied
+
+def setup_database(drop_legacy=False):
+    db = get_db()
+    options = collection_options()
+    if options is None:
+        create_price_collection()
+    elif 'timeseries' not in options:
+        migrate_to_timeseries(drop_legacy=drop_legacy)
+    else:
+        # Keep retention in sync with the configuration
+        db.command("collMod", COLLECTION_NAME, expireAfterSeconds=PRICE_RETENTION_SECONDS)
     setup_indexes()
+    setup_rollups(db)
 
 if __name__ == "__main__":
-    setup_database()
+    setup_database(drop_legacy='--drop-legacy' in sys.argv)
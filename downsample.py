@@ -0,0 +1,56 @@
+import numpy as np
+
+
+def lttb_indices(x, y, max_points):
+    """Return the indices of the points Largest-Triangle-Three-Buckets keeps
+
+    The first and last points are always kept. The points in between are
+    split into max_points - 2 equal buckets and from each bucket the point
+    forming the largest triangle with the previously kept point and the
+    average of the next bucket is chosen. Bucket bounds and averages are
+    computed for all buckets at once; only the choice within each bucket,
+    which depends on the previous one, runs per bucket.
+    """
+    n = len(y)
+    if max_points is None or max_points >= n or n < 3:
+        return np.arange(n)
+    if max_points < 3:
+        return np.array([0, n - 1])
+
+    x = np.asarray(x, dtype='f8')
+    y = np.asarray(y, dtype='f8')
+    buckets = max_points - 2
+
+    # Bucket b covers [edges[b], edges[b + 1]) of the interior points 1..n-2
+    edges = np.floor(np.linspace(1, n - 1, buckets + 1)).astype(np.int64)
+    counts = np.diff(edges)
+    x_avg = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    y_avg = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+    # The "next bucket" of the last bucket is the final point
+    next_x = np.append(x_avg[1:], x[-1])
+    next_y = np.append(y_avg[1:], y[-1])
+
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for b in range(buckets):
+        start, end = edges[b], edges[b + 1]
+        ax, ay = x[a], y[a]
+        # Twice the triangle area for every candidate in the bucket
+        area = np.abs((ax - next_x[b]) * (y[start:end] - ay) - (ax - x[start:end]) * (next_y[b] - ay))
+        a = start + int(np.argmax(area))
+        selected[b + 1] = a
+    return selected
+
+
+def downsample_trace(x, y, max_points):
+    """Downsample parallel x/y lists, using positions when x is not numeric"""
+    if max_points is None or len(y) <= max_points:
+        return x, y
+    try:
+        positions = np.asarray(x, dtype='f8')
+    except (TypeError, ValueError):
+        positions = np.arange(len(y), dtype='f8')
+    keep = lttb_indices(positions, y, max_points)
+    return [x[i] for i in keep], [y[i] for i in keep]
@@ -0,0 +1,67 @@
+import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from upstream_gateway import with_priority
+from profiling import traced
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds an API request may spend waiting on upstream calls
+REQUEST_DEADLINE = float(os.getenv('REQUEST_DEADLINE', '4'))
+# Threads shared by every request's concurrent upstream calls
+FANOUT_WORKERS = int(os.getenv('FANOUT_WORKERS', '32'))
+# Seconds a nested call's deadline is moved forward so its partial results
+# reach the enclosing gather before that gives up on it
+NESTED_DEADLINE_MARGIN = 0.1
+# Error gather() reports for calls still running at the deadline
+DEADLINE_EXCEEDED = 'request deadline exceeded'
+
+
+class Deadline:
+    """A point in time a request must answer by"""
+
+    def __init__(self, seconds=REQUEST_DEADLINE):
+        self.expires_at = time.monotonic() + seconds
+
+    def nested(self, margin=NESTED_DEADLINE_MARGIN):
+        """Return a deadline for a call made inside gather() under this one"""
+        return Deadline(self.remaining() - margin)
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+
+fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix='fanout')
+
+
+def gather(calls, deadline, executor=fanout_executor):
+    """Run named zero-argument calls concurrently until the deadline
+
+    Returns a (results, errors) pair of dicts keyed by name. Calls still
+    running at the deadline are reported as timed out and left to finish in
+    the background, so one slow upstream costs the request at most the
+    remaining budget instead of adding to the others' latency.
+    """
+    futures = {executor.submit(with_priority(traced(call))): name for name, call in calls.items()}
+    done, not_done = wait(futures, timeout=deadline.remaining())
+
+    results = {}
+    errors = {}
+    for future in done:
+        name = futures[future]
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            errors[name] = str(e)
+    for future in not_done:
+        future.cancel()
+        errors[futures[future]] = DEADLINE_EXCEEDED
+    return results, errors
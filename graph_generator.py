@@ -1,76 +1,48 @@
-import matplotlib.pyplot as plt
-import pandas as pd
 from datetime import datetime, timedelta
-from pymongo import MongoClient
+from concurrent.futures import ThreadPoolExecutor
 import os
-import certifi
 import logging
+from price_repository import type_series
+from chart_renderer import performance_frame, render_charts
+from mongo_pool import get_collection
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# MongoDB setup
-MONGODB_URI = os.getenv('MONGODB_URI')
-client = MongoClient(MONGODB_URI, tlsCAFile=certifi.where())
-db = client.stockstream
-prices_collection = db.stock_crypto_prices
+GRAPHS_DIR = os.path.join(os.path.dirname(__file__), 'static', 'graphs')
 
-def generate_performance_graph(asset_type, save_path):
-    """Generate performance graph for top 5 assets of given type"""
-    try:
-        # Get data for the last 24 hours
-        cutoff_time = datetime.utcnow() - timedelta(hours=24)
-        data = list(prices_collection.find({
-            'type': asset_type,
-            'timestamp': {'$gte': cutoff_time}
-        }).sort('timestamp', 1))
+# Charts written to static/graphs; add entries here for more variants
+GRAPH_VARIANTS = [
+    {'file': 'stocks_performance.png', 'asset_type': 'stock', 'hours': 24},
+    {'file': 'crypto_performance.png', 'asset_type': 'crypto', 'hours': 24},
+]
 
-        if not data:
-            logger.warning(f"No data found for {asset_type}")
-            return
+def load_performance(asset_type, hours):
+    """Return the percentage change per symbol of one asset type over the last hours"""
+    cutoff_time = datetime.utcnow() - timedelta(hours=hours)
+    return performance_frame(type_series(get_collection(), asset_type, cutoff_time))
 
-        # Convert to DataFrame
-        df = pd.DataFrame(data)
-        
-        # Pivot the data for plotting
-        pivot_df = df.pivot(index='timestamp', columns='symbol', values='price')
-        
-        # Calculate percentage change
-        pct_change = ((pivot_df - pivot_df.iloc[0]) / pivot_df.iloc[0]) * 100
-        
-        # Create the plot
-        plt.figure(figsize=(12, 6))
-        for column in pct_change.columns:
-            plt.plot(pct_change.index, pct_change[column], label=column, linewidth=2)
-        
-        plt.title(f'Top 5 {asset_type.capitalize()}s Performance (24h)')
-        plt.xlabel('Time (UTC)')
-        plt.ylabel('Percentage Change (%)')
-        plt.grid(True, linestyle='--', alpha=0.7)
-        plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        plt.tight_layout()
-        
-        # Save the plot
-        plt.savefig(save_path)
-        plt.close()
-        
-        logger.info(f"Generated {asset_type} performance graph")
-    except Exception as e:
-        logger.error(f"Error generating {asset_type} graph: {str(e)}")
-
-def update_all_graphs():
-    """Update all performance graphs"""
+def update_all_graphs(variants=GRAPH_VARIANTS):
+    """Update all performance graphs, redrawing only those whose data changed"""
     try:
         # Ensure static/graphs directory exists
-        graphs_dir = os.path.join(os.path.dirname(__file__), 'static', 'graphs')
-        os.makedirs(graphs_dir, exist_ok=True)
-        
-        # Generate graphs for stocks and crypto
-        generate_performance_graph('stock', os.path.join(graphs_dir, 'stocks_performance.png'))
-        generate_performance_graph('crypto', os.path.join(graphs_dir, 'crypto_performance.png'))
-        
-        logger.info("All graphs updated successfully")
+        os.makedirs(GRAPHS_DIR, exist_ok=True)
+        
+        # Each distinct series is read from MongoDB once, concurrently
+        keys = list(dict.fromkeys((variant['asset_type'], variant['hours']) for variant in variants))
+        with ThreadPoolExecutor(max_workers=max(len(keys), 1)) as executor:
+            frames = dict(zip(keys, executor.map(lambda key: load_performance(*key), keys)))
+        
+        charts = [{
+            'path': os.path.join(GRAPHS_DIR, variant['file']),
+            'title': f"Top 5 {variant['asset_type'].capitalize()}s Performance ({variant['hours']}h)",
+            'frame': frames[(variant['asset_type'], variant['hours'])]
+        } for variant in variants]
+        results = render_charts(charts)
+        
+        logger.info(f"Graphs updated: {results}")
+        return results
     except Exception as e:
         logger.error(f"Error updating graphs: {str(e)}")
 
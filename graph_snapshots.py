@@ -0,0 +1,214 @@
+import os
+import json
+import fcntl
+import hashlib
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from history_store import history_store, format_timestamps
+from downsample import downsample_trace
+from upstream_gateway import with_priority
+from profiling import traced
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Where the scheduler publishes the dashboard graph payload
+SNAPSHOT_PATH = os.getenv('DASHBOARD_SNAPSHOT_PATH', os.path.join(os.path.dirname(__file__), 'data', 'snapshots', 'dashboard_graphs.json'))
+# Seconds between scheduler rebuilds of the snapshot
+SNAPSHOT_INTERVAL = float(os.getenv('DASHBOARD_SNAPSHOT_INTERVAL', '300'))
+# Age after which a snapshot counts as missing, e.g. because no scheduler is running
+SNAPSHOT_MAX_AGE = float(os.getenv('DASHBOARD_SNAPSHOT_MAX_AGE', str(2 * SNAPSHOT_INTERVAL)))
+# Seconds between checks of the snapshot file for a newer version
+SNAPSHOT_CHECK_INTERVAL = float(os.getenv('DASHBOARD_SNAPSHOT_CHECK_INTERVAL', '1'))
+# Downsampled variants kept per snapshot version
+SNAPSHOT_VARIANTS = 8
+
+
+def graph_layout(title):
+    """Return the Plotly layout shared by the dashboard graphs"""
+    return {
+        'title': title,
+        'xaxis': {'title': 'Time'},
+        'yaxis': {'title': 'Price ($)'},
+        'showlegend': True,
+        'legend': {'orientation': 'h', 'y': -0.2},
+        'margin': {'l': 60, 'r': 30, 't': 40, 'b': 80},
+        'height': 500,  # Make it taller
+        'plot_bgcolor': '#ffffff',
+        'paper_bgcolor': '#ffffff',
+        'hovermode': 'x unified'  # Show all values at the same x position
+    }
+
+
+def build_traces(symbols):
+    """Build one Plotly trace per symbol from today's 5 minute bars"""
+    def load(symbol):
+        try:
+            return symbol, history_store.get(symbol, '5m', '1d')
+        except Exception as e:
+            logger.error(f"Error fetching history for {symbol}: {str(e)}")
+            return symbol, None
+
+    traces = []
+    with ThreadPoolExecutor(max_workers=max(len(symbols), 1)) as executor:
+        for symbol, result in executor.map(with_priority(traced(load)), symbols):
+            if result is None or not len(result[0]):
+                continue
+            bars, tz = result
+            traces.append({
+                'x': format_timestamps(bars['ts'], tz, '%H:%M'),
+                'y': bars['close'].tolist(),
+                'name': symbol,
+                'type': 'scatter',
+                'mode': 'lines+markers'
+            })
+    return traces
+
+
+def build_dashboard_graphs(stocks, crypto):
+    """Build the /api/dashboard/graphs payload for the given symbols"""
+    return {
+        'stocks': {
+            'data': build_traces(stocks),
+            'layout': graph_layout('Stock Performance (24h)')
+        },
+        'crypto': {
+            'data': build_traces(crypto),
+            'layout': graph_layout('Cryptocurrency Performance (24h)')
+        }
+    }
+
+
+def has_data(payload):
+    """Return True if a dashboard payload has at least one trace"""
+    return bool(payload['stocks']['data'] or payload['crypto']['data'])
+
+
+def publish_snapshot(payload, path=SNAPSHOT_PATH):
+    """Serialize payload and atomically replace the published snapshot; returns its version"""
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    version = hashlib.sha256(body).hexdigest()[:32]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+    logger.info(f"Published dashboard snapshot {version}")
+    return version
+
+
+class SnapshotReader:
+    """Keeps the latest published snapshot in memory
+
+    The file is only re-read when its modification time changes, and its
+    modification time is checked at most every check_interval seconds. The
+    modification time is also the publish time: a snapshot older than
+    max_age is reported as missing, so a stopped scheduler cannot leave the
+    dashboard frozen.
+    """
+
+    def __init__(self, path=SNAPSHOT_PATH, check_interval=SNAPSHOT_CHECK_INTERVAL, max_age=SNAPSHOT_MAX_AGE,
+                 clock=time.time):
+        self.path = path
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._clock = clock
+        self._snapshot = None  # (body, version)
+        self._variants = {}  # max_points -> (body, etag) for the current version
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+
+    def current(self, fresh=True):
+        """Return (body bytes, version) of the latest snapshot, or None if none exists
+
+        With fresh, a snapshot published more than max_age seconds ago
+        counts as missing too.
+        """
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval:
+            with self._lock:
+                self._checked_at = now
+                try:
+                    mtime = os.stat(self.path).st_mtime_ns
+                except FileNotFoundError:
+                    mtime = self._mtime
+                if mtime != self._mtime:
+                    with open(self.path, 'rb') as f:
+                        body = f.read()
+                    self._snapshot = (body, hashlib.sha256(body).hexdigest()[:32])
+                    self._variants = {}
+                    self._mtime = mtime
+
+        snapshot, mtime = self._snapshot, self._mtime
+        if fresh and snapshot is not None and self._clock() - mtime / 1e9 > self.max_age:
+            return None
+        return snapshot
+
+    def rebuild_if_stale(self, build):
+        """Publish build()'s payload if there is no fresh snapshot; returns True if it did
+
+        One thread per process, and one process per node, rebuilds at a
+        time; the others wait for it and then find its snapshot fresh.
+        """
+        with self._rebuild_lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + '.lock', 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self.refresh()
+                if self.current() is not None:
+                    return False
+                payload = build()
+                if not has_data(payload):
+                    logger.warning("No historical data available to rebuild the dashboard snapshot")
+                    return False
+                publish_snapshot(payload, self.path)
+                self.refresh()
+                return True
+
+    def variant(self, max_points, fresh=True):
+        """Return (body, etag) of the current snapshot downsampled to max_points per trace"""
+        snapshot = self.current(fresh)
+        if snapshot is None or max_points is None:
+            return snapshot
+
+        body, version = snapshot
+        with self._lock:
+            cached = self._variants.get(max_points)
+            if cached is not None and cached[2] == version:
+                return cached[:2]
+
+        payload = json.loads(body)
+        for graph in payload.values():
+            for trace in graph['data']:
+                trace['x'], trace['y'] = downsample_trace(trace['x'], trace['y'], max_points)
+        result = (json.dumps(payload, separators=(',', ':')).encode(), f"{version}-{max_points}")
+
+        with self._lock:
+            if len(self._variants) >= SNAPSHOT_VARIANTS:
+                self._variants.pop(next(iter(self._variants)))
+            self._variants[max_points] = result + (version,)
+        return result
+
+    def refresh(self):
+        """Force the next call to current() to check the file"""
+        self._checked_at = 0.0
+
+
+dashboard_snapshot = SnapshotReader()
+
+
+def refresh_dashboard_snapshot(stocks, crypto):
+    """Rebuild and publish the dashboard graphs; returns the payload"""
+    payload = build_dashboard_graphs(stocks, crypto)
+    if has_data(payload):
+        publish_snapshot(payload)
+        dashboard_snapshot.refresh()
+    else:
+        logger.warning("No historical data available, keeping previous dashboard snapshot")
+    return payload
@@ -0,0 +1,315 @@
+import os
+import re
+import json
+import threading
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import numpy as np
+
+from circuit_breaker import CircuitOpenError, get_breaker
+from upstream_gateway import upstream_gateway
+from metrics import upstream_call
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Where bar files are kept
+HISTORY_DIR = os.getenv('HISTORY_DIR', os.path.join(os.path.dirname(__file__), 'data', 'history'))
+# Upper bound on how long a series is served without asking upstream for new bars
+HISTORY_REFRESH_SECONDS = float(os.getenv('HISTORY_REFRESH_SECONDS', '300'))
+# Series kept in memory; the least recently used are dropped (their files stay)
+HISTORY_MAX_SERIES = int(os.getenv('HISTORY_MAX_SERIES', '256'))
+
+# Symbols a series may be stored under (tickers, indices, pairs, futures)
+SYMBOL_PATTERN = re.compile(r'[A-Z0-9.^=-]{1,15}')
+
+# One fixed-width record per bar; files are a plain array of these
+BAR_DTYPE = np.dtype([
+    ('ts', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('volume', '<f8'),
+])
+
+INTERVAL_SECONDS = {
+    '1m': 60,
+    '5m': 300,
+    '15m': 900,
+    '30m': 1800,
+    '1h': 3600,
+    '1d': 86400,
+    '1wk': 604800,
+}
+
+PERIOD_SECONDS = {
+    '1d': 86400,
+    '5d': 5 * 86400,
+    '1wk': 7 * 86400,
+    '1mo': 31 * 86400,
+    '3mo': 92 * 86400,
+    '6mo': 183 * 86400,
+    '1y': 366 * 86400,
+    '2y': 731 * 86400,
+    '5y': 1827 * 86400,
+}
+
+
+def fetch_bars(symbol, interval, period=None, start=None):
+    """Fetch OHLCV bars from yfinance, either for a period or since start (epoch seconds)"""
+    # Imported on first use: yfinance and the pandas it loads dominate startup time
+    import yfinance as yf
+
+    with upstream_call('history', symbol):
+        ticker = yf.Ticker(symbol)
+        if start is not None:
+            return ticker.history(start=datetime.fromtimestamp(start, tz=timezone.utc), interval=interval)
+        return ticker.history(period=period, interval=interval)
+
+
+def gated_fetch_bars(symbol, interval, period=None, start=None):
+    """Fetch bars through the rate-limited upstream gateway"""
+    return upstream_gateway.call(('history', symbol, interval, period, start),
+                                 lambda: fetch_bars(symbol, interval, period=period, start=start))
+
+
+def frame_to_bars(frame):
+    """Convert a yfinance history DataFrame to a BAR_DTYPE array"""
+    bars = np.empty(len(frame), dtype=BAR_DTYPE)
+    if not len(frame):
+        return bars
+    index = frame.index
+    if index.tz is None:
+        index = index.tz_localize('UTC')
+    bars['ts'] = index.as_unit('s').asi8
+    bars['open'] = frame['Open'].to_numpy(dtype='f8')
+    bars['high'] = frame['High'].to_numpy(dtype='f8')
+    bars['low'] = frame['Low'].to_numpy(dtype='f8')
+    bars['close'] = frame['Close'].to_numpy(dtype='f8')
+    bars['volume'] = frame['Volume'].to_numpy(dtype='f8') if 'Volume' in frame else 0
+    return bars
+
+
+def frame_timezone(frame):
+    """Return the timezone name of a history DataFrame's index"""
+    return str(frame.index.tz) if getattr(frame.index, 'tz', None) is not None else 'UTC'
+
+
+def validate_symbol(symbol):
+    """Return symbol normalised to upper case, raising ValueError unless it looks like a ticker"""
+    normalised = symbol.strip().upper()
+    if not SYMBOL_PATTERN.fullmatch(normalised):
+        raise ValueError(f"Invalid symbol {symbol!r}")
+    return normalised
+
+
+class _Series:
+    """In-memory state of one (symbol, interval) series"""
+
+    def __init__(self):
+        self.bars = np.empty(0, dtype=BAR_DTYPE)  # closed bars, mirrors the file
+        self.tail = np.empty(0, dtype=BAR_DTYPE)  # bars still forming, never persisted
+        self.covered_from = None  # earliest time the stored bars are complete from
+        self.tz = 'UTC'
+        self.checked_at = 0.0  # monotonic time of the last upstream check
+        self.lock = threading.Lock()
+
+
+class HistoryStore:
+    """Local append-only OHLCV store keyed by symbol and interval
+
+    Closed bars are appended to one binary file per series and are never
+    fetched again; each refresh only asks upstream for bars after the last
+    stored one. The still-forming latest bar is kept in memory only. A series
+    is re-checked upstream at most once per refresh window, so repeated loads
+    are served entirely from memory.
+    """
+
+    def __init__(self, directory=HISTORY_DIR, fetch=None, refresh_seconds=HISTORY_REFRESH_SECONDS, breaker=None,
+                 max_series=HISTORY_MAX_SERIES):
+        self.directory = directory
+        self._fetch = fetch or gated_fetch_bars
+        self.refresh_seconds = refresh_seconds
+        self.breaker = breaker or get_breaker('yfinance-history')
+        self.max_series = max_series
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.refreshes = 0
+        self.stale_serves = 0
+
+    def get(self, symbol, interval, period):
+        """Return (bars, timezone name) of symbol covering period, fetching only what is missing
+
+        Raises ValueError for a symbol that does not look like a ticker, so
+        arbitrary URLs cannot create series in memory or files on disk.
+        """
+        symbol = validate_symbol(symbol)
+        series = self._load(symbol, interval)
+        step = INTERVAL_SECONDS[interval]
+        span = PERIOD_SECONDS[period]
+
+        with series.lock:
+            now = time.time()
+            wanted_from = int(now) - span
+            if series.covered_from is None or wanted_from < series.covered_from:
+                self._refresh(symbol, interval, series, self._backfill, symbol, interval, period, series, now)
+            elif time.monotonic() - series.checked_at >= min(step, self.refresh_seconds):
+                self._refresh(symbol, interval, series, self._update, symbol, interval, series, now)
+            else:
+                self._count('hits')
+
+            bars = np.concatenate([series.bars, series.tail]) if len(series.tail) else series.bars
+            tz = series.tz
+
+        if not len(bars):
+            return bars, tz
+        # Anchor on the latest bar so closed markets still show their last session
+        cutoff = bars['ts'][-1] - span
+        return bars[np.searchsorted(bars['ts'], cutoff, side='right'):], tz
+
+    def _refresh(self, symbol, interval, series, refresh, *args):
+        """Run an upstream refresh through the breaker
+
+        When the breaker is open or the refresh fails, a series that already
+        has bars keeps serving them until its next refresh window; only an
+        empty series surfaces the error.
+        """
+        has_bars = bool(len(series.bars) or len(series.tail))
+        if not self.breaker.allow():
+            if has_bars:
+                self._count('stale_serves')
+                return
+            raise CircuitOpenError(f"{self.breaker.name} circuit is open")
+        self._count('refreshes')
+        try:
+            refresh(*args)
+        except Exception as e:
+            self.breaker.record_failure()
+            if not has_bars:
+                raise
+            logger.warning(f"Serving stored {interval} bars for {symbol}: {str(e)}")
+            self._count('stale_serves')
+            series.checked_at = time.monotonic()
+            return
+        self.breaker.record_success()
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        """Return how many loads were served from memory, refreshed upstream or served stale"""
+        with self._lock:
+            return {'hits': self.hits, 'refreshes': self.refreshes, 'stale_serves': self.stale_serves,
+                    'series': len(self._series)}
+
+    def _backfill(self, symbol, interval, period, series, now):
+        """Fetch the whole period and rewrite the series file"""
+        frame = self._fetch(symbol, interval, period=period)
+        bars = frame_to_bars(frame)
+        series.tz = frame_timezone(frame) if len(frame) else series.tz
+        if len(series.bars):
+            # Keep stored bars newer than what upstream returned
+            bars = np.concatenate([bars, series.bars[series.bars['ts'] > bars['ts'][-1]]]) if len(bars) else series.bars
+
+        closed, tail = self._split_closed(bars, interval, now)
+        series.bars = closed
+        series.tail = tail
+        series.covered_from = int(now) - PERIOD_SECONDS[period]
+        series.checked_at = time.monotonic()
+        if not len(closed) and not len(tail):
+            # Nothing upstream (e.g. an unknown symbol): keep it off disk
+            return
+        self._write(symbol, interval, series)
+        logger.info(f"Backfilled {len(closed)} {interval} bars for {symbol}")
+
+    def _update(self, symbol, interval, series, now):
+        """Fetch bars after the last closed one and append those that have closed"""
+        last_ts = int(series.bars['ts'][-1]) if len(series.bars) else series.covered_from
+        frame = self._fetch(symbol, interval, start=last_ts + 1)
+        bars = frame_to_bars(frame)
+        bars = bars[bars['ts'] > last_ts]
+        if len(frame):
+            series.tz = frame_timezone(frame)
+
+        closed, tail = self._split_closed(bars, interval, now)
+        if len(closed):
+            self._append(symbol, interval, closed)
+            series.bars = np.concatenate([series.bars, closed])
+        series.tail = tail
+        series.checked_at = time.monotonic()
+
+    def _split_closed(self, bars, interval, now):
+        """Split bars into those whose interval has ended and those still forming"""
+        step = INTERVAL_SECONDS[interval]
+        cut = np.searchsorted(bars['ts'] + step, now, side='right')
+        return bars[:cut], bars[cut:]
+
+    def _path(self, symbol, interval):
+        safe = symbol.replace('/', '_').replace('^', 'IDX_')
+        return os.path.join(self.directory, f"{safe}_{interval}")
+
+    def _load(self, symbol, interval):
+        """Return the series for a key, reading its file on first use"""
+        key = (symbol, interval)
+        with self._lock:
+            series = self._series.get(key)
+            if series is not None:
+                self._series.move_to_end(key)
+                return series
+            series = self._series[key] = _Series()
+            while len(self._series) > self.max_series:
+                self._series.popitem(last=False)
+            # Hold the series until its file is read so nobody sees it empty
+            series.lock.acquire()
+
+        try:
+            path = self._path(symbol, interval)
+            try:
+                with open(path + '.json') as f:
+                    meta = json.load(f)
+                series.bars = np.fromfile(path + '.bin', dtype=BAR_DTYPE)
+                series.covered_from = meta['covered_from']
+                series.tz = meta.get('tz', 'UTC')
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"Error reading history for {symbol} {interval}: {str(e)}")
+        finally:
+            series.lock.release()
+        return series
+
+    def _write(self, symbol, interval, series):
+        """Atomically replace a series' bar and metadata files"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(symbol, interval)
+        series.bars.tofile(path + '.bin.tmp')
+        os.replace(path + '.bin.tmp', path + '.bin')
+        self._write_meta(path, series)
+
+    def _append(self, symbol, interval, bars):
+        """Append closed bars to a series file"""
+        path = self._path(symbol, interval)
+        with open(path + '.bin', 'ab') as f:
+            bars.tofile(f)
+
+    def _write_meta(self, path, series):
+        with open(path + '.json.tmp', 'w') as f:
+            json.dump({'covered_from': series.covered_from, 'tz': series.tz}, f)
+        os.replace(path + '.json.tmp', path + '.json')
+
+
+def format_timestamps(ts, tz, fmt='%Y-%m-%d %H:%M:%S'):
+    """Format epoch seconds in the exchange timezone, vectorized"""
+    import pandas as pd
+
+    return pd.to_datetime(ts, unit='s', utc=True).tz_convert(tz).strftime(fmt).tolist()
+
+
+history_store = HistoryStore()
@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import random
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import JOB_LATENCY, JOB_FAILURES, JOB_TIMEOUTS, JOB_MISSED
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Threads available to scheduled jobs; 0 gives every registered job its own
+# thread plus SCHEDULER_SPARE_WORKERS
+SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', '0'))
+# Threads beyond one per job when the pool is sized automatically
+SCHEDULER_SPARE_WORKERS = int(os.getenv('SCHEDULER_SPARE_WORKERS', '2'))
+# Where per-job statistics are published for the web app
+SCHEDULER_STATS_PATH = os.getenv('SCHEDULER_STATS_PATH', os.path.join(os.path.dirname(__file__), 'data', 'scheduler', 'jobs.json'))
+
+# What to do about runs whose time passed while the executor was busy
+MISFIRE_COALESCE = 'coalesce'  # run once, late, for all missed slots
+MISFIRE_CATCH_UP = 'catch_up'  # run once for every missed slot
+MISFIRE_SKIP = 'skip'  # drop slots missed by more than the grace period
+
+
+class Job:
+    """A function run every interval seconds plus its run statistics"""
+
+    def __init__(self, name, func, interval, offset=0.0, jitter=0.0, timeout=None,
+                 misfire=MISFIRE_COALESCE, grace=None, run_immediately=False):
+        if misfire not in (MISFIRE_COALESCE, MISFIRE_CATCH_UP, MISFIRE_SKIP):
+            raise ValueError(f"Unknown misfire policy {misfire!r}")
+        self.name = name
+        self.func = func
+        self.interval = float(interval)
+        self.offset = float(offset)
+        self.jitter = float(jitter)
+        self.timeout = timeout
+        self.misfire = misfire
+        self.grace = self.interval / 2 if grace is None else grace
+        self.run_immediately = run_immediately
+
+        self.slot = None  # wall-clock time of the next scheduled run, before jitter
+        self.next_run = None
+        self.running_since = None
+        self.timed_out = False
+        self.runs = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.overlaps = 0
+        self.missed = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.last_seconds = None
+        self.last_started = None
+        self.last_error = None
+
+    def schedule_after(self, now):
+        """Set the next run to the first aligned slot after now"""
+        base = (now - self.offset) // self.interval * self.interval + self.offset
+        self.slot = base + self.interval if base <= now else base
+        self.next_run = self.slot + random.uniform(0, self.jitter)
+
+    def advance(self):
+        """Move to the slot after the current one"""
+        self.slot += self.interval
+        self.next_run = self.slot + random.uniform(0, self.jitter)
+
+    def miss(self, slots):
+        """Count slots that passed without a run of their own"""
+        if slots:
+            self.missed += slots
+            JOB_MISSED.labels(self.name).inc(slots)
+
+    def stats(self, now):
+        return {
+            'interval': self.interval,
+            'misfire': self.misfire,
+            'running': self.running_since is not None,
+            'running_for': round(now - self.running_since, 3) if self.running_since is not None else None,
+            'runs': self.runs,
+            'failures': self.failures,
+            'timeouts': self.timeouts,
+            'overlaps': self.overlaps,
+            'missed': self.missed,
+            'last_seconds': round(self.last_seconds, 3) if self.last_seconds is not None else None,
+            'total_seconds': round(self.total_seconds, 3),
+            'avg_seconds': round(self.total_seconds / self.runs, 3) if self.runs else None,
+            'max_seconds': round(self.max_seconds, 3),
+            'last_started': self.last_started,
+            'next_run': self.next_run,
+            'last_error': self.last_error
+        }
+
+
+class JobExecutor:
+    """Runs interval jobs concurrently on a bounded thread pool
+
+    A job never overlaps itself: when its slot comes while the previous run
+    is still going, the overlap is counted and the misfire policy decides
+    whether it runs once the previous run ends. Slots are aligned to the
+    wall clock (plus the job's offset) and each run is delayed by up to
+    `jitter` seconds. A run exceeding its timeout is reported; threads
+    cannot be interrupted, so it keeps its pool slot until it returns, and
+    no new run of that job starts before then whatever its misfire policy.
+    Since a job holds at most one thread, a pool sized to the number of jobs
+    (the default, sized when the first job is dispatched) means a hung job
+    never holds back the others.
+    """
+
+    def __init__(self, max_workers=SCHEDULER_WORKERS, stats_path=SCHEDULER_STATS_PATH, clock=time.time):
+        self.stats_path = stats_path
+        self._clock = clock
+        self._jobs = {}
+        self.max_workers = max_workers
+        self._pool = None
+        self._lock = threading.Lock()
+        # Jobs finishing together publish one at a time, so the newest stats are written last
+        self._publish_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def add_job(self, name, func, interval, **options):
+        job = Job(name, func, interval, **options)
+        now = self._clock()
+        if job.run_immediately:
+            job.slot = job.next_run = now
+        else:
+            job.schedule_after(now)
+        with self._lock:
+            self._jobs[name] = job
+        self._wake.set()
+        return job
+
+    def run_pending(self):
+        """Start every due job; returns the seconds until the next one is due"""
+        now = self._clock()
+        with self._lock:
+            for job in self._jobs.values():
+                self._check_timeout(job, now)
+                if now >= job.next_run:
+                    self._dispatch(job, now)
+            upcoming = [job.next_run for job in self._jobs.values() if job.running_since is None]
+        return max(0.0, min(upcoming) - now) if upcoming else 1.0
+
+    def _dispatch(self, job, now):
+        if job.running_since is not None:
+            if job.timed_out:
+                # A hung run keeps its thread; more runs would only pile up behind it
+                logger.warning(f"Not starting {job.name}: the previous run is past its {job.timeout:g}s timeout")
+            if job.timed_out or job.misfire == MISFIRE_SKIP:
+                job.overlaps += 1
+                job.miss(1)
+                job.schedule_after(now)
+            # Otherwise the job stays due and starts when the running one ends
+            return
+
+        late = now - job.slot
+        if job.misfire == MISFIRE_CATCH_UP:
+            job.advance()
+        else:
+            missed = int(late // job.interval)
+            if job.misfire == MISFIRE_SKIP and late > job.grace:
+                job.miss(missed + 1)
+                logger.warning(f"Skipping {job.name}: {late:.1f}s late")
+                job.schedule_after(now)
+                return
+            job.miss(missed)
+            job.schedule_after(now)
+
+        job.running_since = now
+        job.timed_out = False
+        job.last_started = now
+        if self._pool is None:
+            workers = self.max_workers or len(self._jobs) + SCHEDULER_SPARE_WORKERS
+            self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._pool.submit(self._run, job)
+
+    def _check_timeout(self, job, now):
+        if (job.timeout is not None and job.running_since is not None and not job.timed_out
+                and now - job.running_since > job.timeout):
+            job.timed_out = True
+            job.timeouts += 1
+            JOB_TIMEOUTS.labels(job.name).inc()
+            logger.error(f"Job {job.name} has been running for more than {job.timeout:g}s")
+
+    def _run(self, job):
+        started = time.perf_counter()
+        error = None
+        try:
+            job.func()
+        except Exception as e:
+            error = str(e)
+            logger.error(f"Error in job {job.name}: {error}")
+        elapsed = time.perf_counter() - started
+        JOB_LATENCY.labels(job.name).observe(elapsed)
+        if error is not None:
+            JOB_FAILURES.labels(job.name).inc()
+
+        with self._lock:
+            job.running_since = None
+            job.runs += 1
+            job.total_seconds += elapsed
+            job.max_seconds = max(job.max_seconds, elapsed)
+            job.last_seconds = elapsed
+            if error is not None:
+                job.failures += 1
+                job.last_error = error
+        self._wake.set()
+        self.publish_stats()
+
+    def stats(self):
+        """Return run statistics of every job keyed by name"""
+        now = self._clock()
+        with self._lock:
+            return {name: job.stats(now) for name, job in self._jobs.items()}
+
+    def publish_stats(self):
+        """Atomically write the job statistics to stats_path"""
+        if not self.stats_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.stats_path), exist_ok=True)
+            tmp_path = f"{self.stats_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with self._publish_lock:
+                with open(tmp_path, 'w') as f:
+                    json.dump({'updated_at': self._clock(), 'jobs': self.stats()}, f)
+                os.replace(tmp_path, self.stats_path)
+        except Exception as e:
+            logger.error(f"Error publishing job stats: {str(e)}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run_forever, name='job-executor', daemon=True)
+            self._thread.start()
+
+    def run_forever(self):
+        """Dispatch due jobs until stop() is called"""
+        while not self._stop.is_set():
+            try:
+                delay = self.run_pending()
+            except Exception as e:
+                logger.error(f"Error in job executor: {str(e)}")
+                delay = 1.0
+            self._wake.clear()
+            # Wake up for the next slot, a finished run or a new job
+            self._wake.wait(min(delay, 1.0))
+
+    def stop(self, wait=True):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait)
+
+
+def read_job_stats(path=SCHEDULER_STATS_PATH):
+    """Return the statistics last published by the scheduler, or None"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
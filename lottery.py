@@ -0,0 +1,289 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import threading
+import logging
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from circuit_breaker import CircuitOpenError, get_breaker
+from metrics import upstream_call
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Where the draw archives are kept
+LOTTERY_DIR = os.getenv('LOTTERY_DIR', os.path.join(os.path.dirname(__file__), 'data', 'lottery'))
+# Recorded data.ny.gov responses replayed instead of the live API (offline runs and tests)
+LOTTERY_FIXTURE_PATH = os.getenv('LOTTERY_FIXTURE_PATH', '')
+# Seconds between checks for newly published draws
+LOTTERY_REFRESH_SECONDS = float(os.getenv('LOTTERY_REFRESH_SECONDS', '3600'))
+# Seconds a web worker serves its in-memory draws before looking for new ones on disk
+LOTTERY_RELOAD_SECONDS = float(os.getenv('LOTTERY_RELOAD_SECONDS', '60'))
+# Rows requested per page of the Socrata API
+LOTTERY_PAGE_SIZE = 5000
+# Seconds to wait for each page
+LOTTERY_FETCH_TIMEOUT = 10
+
+# One fixed-width record per draw (11 bytes); archives are a plain array of these
+DRAW_DTYPE = np.dtype([
+    ('day', '<i4'),            # days since 1970-01-01
+    ('numbers', 'u1', (5,)),   # main numbers, ascending
+    ('special', 'u1'),         # Powerball or Mega Ball
+    ('multiplier', 'u1'),      # Power Play / Megaplier, 0 if none
+])
+
+GAMES = {
+    'powerball': {
+        'url': 'https://data.ny.gov/resource/d6yy-54nr.json',
+        'special': 'powerball',
+        'draw_days': (0, 2, 5),  # Monday, Wednesday, Saturday
+        'main_max': 69,  # current matrix: 5 of 1-69, Powerball 1-26
+        'special_max': 26,
+    },
+    'mega_millions': {
+        'url': 'https://data.ny.gov/resource/5xaw-6ayf.json',
+        'special': 'mega_ball',
+        'draw_days': (1, 4),  # Tuesday, Friday
+        'main_max': 70,  # current matrix: 5 of 1-70, Mega Ball 1-24
+        'special_max': 24,
+    },
+}
+
+EPOCH = date(1970, 1, 1)
+
+
+def format_lottery_number(number):
+    """Zero-pad a drawn number to two digits; None and '' pass through"""
+    if not number:
+        return number
+    return str(number).zfill(2)
+
+
+def parse_draws(rows, game):
+    """Convert data.ny.gov rows of a game to a DRAW_DTYPE array sorted by date
+
+    Powerball rows carry the Powerball as the sixth winning number; Mega
+    Millions rows carry the Mega Ball in its own field.
+    """
+    special_field = GAMES[game]['special']
+    draws = np.zeros(len(rows), dtype=DRAW_DTYPE)
+    kept = 0
+    for row in rows:
+        try:
+            numbers = [int(n) for n in row['winning_numbers'].split()]
+            special = numbers.pop(5) if len(numbers) == 6 else int(row[special_field])
+            if len(numbers) != 5:
+                raise ValueError(f"expected 5 main numbers, got {len(numbers)}")
+            drawn = datetime.strptime(row['draw_date'][:10], '%Y-%m-%d').date()
+            draws[kept] = ((drawn - EPOCH).days, sorted(numbers), special, int(row.get('multiplier') or 0))
+            kept += 1
+        except (KeyError, ValueError, TypeError) as e:
+            logger.warning(f"Skipping malformed {game} draw {row}: {str(e)}")
+    draws = draws[:kept]
+    return draws[np.argsort(draws['day'], kind='stable')]
+
+
+def draw_date(day):
+    return (EPOCH + timedelta(days=int(day))).isoformat()
+
+
+def format_draw(draw, game):
+    """Return one archived draw as the JSON the lottery pages show"""
+    return {
+        'draw_date': draw_date(draw['day']),
+        'winning_numbers': [format_lottery_number(n) for n in draw['numbers']],
+        GAMES[game]['special']: format_lottery_number(draw['special']),
+        'multiplier': str(draw['multiplier']) if draw['multiplier'] else None,
+    }
+
+
+def process_lottery_data(rows, game):
+    """Return data.ny.gov rows of a game as formatted draws, oldest first"""
+    return [format_draw(draw, game) for draw in parse_draws(rows, game)]
+
+
+def next_draw_date(game, after, today=None):
+    """Return the first scheduled draw date after the latest draw, and not before today"""
+    day = max(after + timedelta(days=1), today or date.today())
+    while day.weekday() not in GAMES[game]['draw_days']:
+        day += timedelta(days=1)
+    return day.isoformat()
+
+
+def fetch_draws(game, since=None, page_size=LOTTERY_PAGE_SIZE):
+    """Fetch every draw of a game after since (a date), oldest first, from data.ny.gov"""
+    # Imported on first use to keep it out of the web workers' startup
+    import requests
+
+    rows = []
+    while True:
+        params = {'$order': 'draw_date ASC', '$limit': page_size, '$offset': len(rows)}
+        if since is not None:
+            params['$where'] = f"draw_date > '{since.isoformat()}T23:59:59'"
+        with upstream_call('draws', game, upstream='data.ny.gov'):
+            response = requests.get(GAMES[game]['url'], params=params, timeout=LOTTERY_FETCH_TIMEOUT)
+            response.raise_for_status()
+            page = response.json()
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+
+
+def fixture_fetch(path):
+    """Return a fetch function replaying recorded rows ({game: [row, ...]}) from path"""
+    with open(path) as f:
+        recorded = json.load(f)
+
+    def fetch(game, since=None):
+        rows = sorted(recorded.get(game, []), key=lambda row: row['draw_date'])
+        if since is not None:
+            rows = [row for row in rows if row['draw_date'][:10] > since.isoformat()]
+        return rows
+    return fetch
+
+
+class _Archive:
+    """In-memory copy of one game's archive file"""
+
+    def __init__(self):
+        self.draws = np.empty(0, dtype=DRAW_DTYPE)
+        self.checked_at = None  # monotonic time the file was last looked at
+        self.latest = None  # cached /api/lottery/latest payload for these draws
+        self.lock = threading.Lock()
+
+
+class LotteryArchive:
+    """Append-only local archive of lottery draws, one fixed-width file per game
+
+    refresh() asks data.ny.gov only for draws newer than the last archived
+    one and appends them. Readers keep the draws in memory and look at the
+    file again at most once per reload window, reading just the records
+    appended since, so requests never wait on the upstream.
+    """
+
+    def __init__(self, directory=LOTTERY_DIR, fetch=None, reload_seconds=LOTTERY_RELOAD_SECONDS, breaker=None):
+        self.directory = directory
+        self._fetch = fetch or fetch_draws
+        self.reload_seconds = reload_seconds
+        self.breaker = breaker or get_breaker('data.ny.gov')
+        self._archives = {game: _Archive() for game in GAMES}
+
+    def _path(self, game):
+        return os.path.join(self.directory, f"{game}.bin")
+
+    def _reload(self, game, archive, force=False):
+        """Read records appended to a game's file since it was last read"""
+        now = time.monotonic()
+        if not force and archive.checked_at is not None and now - archive.checked_at < self.reload_seconds:
+            return
+        archive.checked_at = now
+        path = self._path(game)
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return
+        loaded = len(archive.draws)
+        # A record still being appended by another process is picked up next time
+        complete = size // DRAW_DTYPE.itemsize
+        if complete > loaded:
+            appended = np.fromfile(path, dtype=DRAW_DTYPE, count=complete - loaded, offset=loaded * DRAW_DTYPE.itemsize)
+            archive.draws = np.concatenate([archive.draws, appended])
+            archive.latest = None
+
+    def draws(self, game):
+        """Return every archived draw of a game, oldest first"""
+        archive = self._archives[game]
+        with archive.lock:
+            self._reload(game, archive)
+            return archive.draws
+
+    def refresh(self, game):
+        """Fetch and append draws newer than the last archived one; returns how many"""
+        archive = self._archives[game]
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"{self.breaker.name} circuit is open")
+        os.makedirs(self.directory, exist_ok=True)
+        with archive.lock, open(self._path(game) + '.lock', 'w') as lock_file:
+            # Another process may append too; the file lock keeps their records from interleaving
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._reload(game, archive, force=True)
+            since = EPOCH + timedelta(days=int(archive.draws['day'][-1])) if len(archive.draws) else None
+            try:
+                draws = parse_draws(self._fetch(game, since=since), game)
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            if since is not None:
+                draws = draws[draws['day'] > archive.draws['day'][-1]]
+            if len(draws):
+                with open(self._path(game), 'ab') as f:
+                    draws.tofile(f)
+                archive.draws = np.concatenate([archive.draws, draws])
+                archive.latest = None
+        logger.info(f"Archived {len(draws)} new {game} draws ({len(archive.draws)} total)")
+        return len(draws)
+
+    def refresh_all(self):
+        """Refresh every game, logging failures; returns new draws per game"""
+        added = {}
+        for game in GAMES:
+            try:
+                added[game] = self.refresh(game)
+            except Exception as e:
+                logger.error(f"Error refreshing {game} draws: {str(e)}")
+        return added
+
+    def latest(self, game, today=None):
+        """Return the latest and previous draw of a game and its next draw date
+
+        Serves only what is archived: returns None until the scheduler's
+        first refresh of the game has landed, so requests never wait on
+        data.ny.gov.
+        """
+        archive = self._archives[game]
+        with archive.lock:
+            self._reload(game, archive)
+            if archive.latest is None and len(archive.draws):
+                draws = archive.draws
+                payload = format_draw(draws[-1], game)
+                payload['previous'] = format_draw(draws[-2], game) if len(draws) > 1 else None
+                last = EPOCH + timedelta(days=int(draws['day'][-1]))
+                payload['next_draw_date'] = next_draw_date(game, last, today)
+                payload['draws_archived'] = len(draws)
+                archive.latest = payload
+            return archive.latest
+
+    def stats(self):
+        return {game: {'draws': len(archive.draws),
+                       'latest': draw_date(archive.draws['day'][-1]) if len(archive.draws) else None}
+                for game, archive in self._archives.items()}
+
+
+def record_fixture(path, limit=20):
+    """Save the latest limit rows of each game from data.ny.gov for offline replay"""
+    import requests
+
+    recorded = {}
+    for game, spec in GAMES.items():
+        response = requests.get(spec['url'], params={'$order': 'draw_date DESC', '$limit': limit},
+                                timeout=LOTTERY_FETCH_TIMEOUT)
+        response.raise_for_status()
+        recorded[game] = response.json()
+    with open(path, 'w') as f:
+        json.dump(recorded, f, indent=1)
+    logger.info(f"Recorded {sum(map(len, recorded.values()))} draws to {path}")
+
+
+lottery_archive = LotteryArchive(fetch=fixture_fetch(LOTTERY_FIXTURE_PATH) if LOTTERY_FIXTURE_PATH else None)
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['record']:
+        record_fixture(sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.dirname(__file__), 'data', 'lottery_fixture.json'))
+    else:
+        print(json.dumps(lottery_archive.refresh_all()))
@@ -0,0 +1,518 @@
+import os
+import json
+import glob
+import time
+import bisect
+import threading
+import logging
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pymongo import monitoring
+
+from profiling import span, record_span
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Directory where the worker processes of the web server write their
+# metrics, so scraping any one of them reports all of them; empty disables
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR', os.path.join(os.path.dirname(__file__), 'data', 'metrics'))
+# Seconds between writes of a process's metrics to that directory
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '5'))
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if value == float('-inf'):
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Registry:
+    """The metrics of one process, rendered in the Prometheus text format
+
+    Besides metrics updated as things happen, collectors are called at
+    scrape time to report counters kept elsewhere (cache hit counts,
+    breaker states) without touching the hot path.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+        self._shared = None  # (directory, group pid, flush interval)
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """Register a function returning [(name, type, help, samples), ...]
+
+        where samples is a list of (sample name, [(label, value), ...], value).
+        """
+        with self._lock:
+            self._collectors.append(collector)
+        return collector
+
+    def collect(self):
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+        families = [metric.collect() for metric in metrics]
+        for collector in collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                logger.error(f"Error collecting metrics from {collector.__name__}: {str(e)}")
+        return families
+
+    def share(self, directory, flush_interval=METRICS_FLUSH_INTERVAL):
+        """Report the metrics of this process and every process forked from it together
+
+        Each process writes what it collects to <directory>/<group>-<pid>.json
+        every flush_interval seconds and whenever it is scraped, and render()
+        merges the group's files. Counters, histograms and summaries are
+        summed over every process, including exited ones, so their totals
+        never go back; gauges get a pid label and are kept for live processes
+        only. Call it before the workers fork (gunicorn --preload) so they
+        all join this process's group; forked children start from zero.
+        """
+        if self._shared is not None:
+            return
+        os.makedirs(directory, exist_ok=True)
+        group = os.getpid()
+        # Files of servers that have since exited would otherwise be summed in
+        for path in glob.glob(os.path.join(directory, '*-*.json')):
+            try:
+                owner = int(os.path.basename(path).split('-')[0])
+            except ValueError:
+                continue
+            if owner != group and not pid_alive(owner):
+                os.remove(path)
+        self._shared = (directory, group, flush_interval)
+        self._start_flusher()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            metric.reset()
+        self._start_flusher()
+
+    def _start_flusher(self):
+        threading.Thread(target=self._flush_forever, name='metrics-flush', daemon=True).start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(self._shared[2])
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error writing metrics: {str(e)}")
+
+    def flush(self):
+        """Write this process's metrics to the shared directory"""
+        directory, group, _ = self._shared
+        path = os.path.join(directory, f"{group}-{os.getpid()}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'pid': os.getpid(), 'families': self.collect()}, f)
+        os.replace(tmp_path, path)
+
+    def collect_shared(self):
+        """Return the families of every process of the group, merged"""
+        directory, group, _ = self._shared
+        self.flush()
+        merged = {}  # name -> (kind, documentation, {(sample name, labels): value})
+        for path in sorted(glob.glob(os.path.join(directory, f"{group}-*.json"))):
+            try:
+                with open(path) as f:
+                    published = json.load(f)
+            except (OSError, ValueError):
+                continue
+            pid = published['pid']
+            alive = pid_alive(pid)
+            for name, kind, documentation, samples in published['families']:
+                if kind == 'gauge' and not alive:
+                    continue
+                family = merged.setdefault(name, (kind, documentation, {}))
+                for sample_name, labels, value in samples:
+                    labels = tuple(tuple(label) for label in labels)
+                    if kind == 'gauge':
+                        labels += (('pid', str(pid)),)
+                    key = (sample_name, labels)
+                    family[2][key] = family[2].get(key, 0) + value
+        return [(name, kind, documentation, [(sample_name, list(labels), value)
+                                             for (sample_name, labels), value in samples.items()])
+                for name, (kind, documentation, samples) in merged.items()]
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        lines = []
+        families = self.collect_shared() if self._shared is not None else self.collect()
+        for name, kind, documentation, samples in families:
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample_name, labels, value in samples:
+                lines.append(f"{sample_name}{format_labels(labels)} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def reset(self):
+        """Drop every series, e.g. the copies a forked process inherited"""
+        self._lock = threading.Lock()
+        self._children = {}
+
+    def labels(self, *values):
+        """Return the series for one combination of label values"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} takes labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def collect(self):
+        with self._lock:
+            children = list(self._children.items())
+        samples = []
+        for values, child in sorted(children, key=lambda item: tuple(map(str, item[0]))):
+            samples.extend(child.samples(self.name, list(zip(self.labelnames, values))))
+        return self.name, self.kind, self.documentation, samples
+
+
+class _CounterChild:
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def samples(self, name, labels):
+        return [(name, labels, self._value)]
+
+
+class Counter(_Metric):
+    """A monotonically increasing count; name it with a _total suffix"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _CounterChild()
+
+
+class _HistogramChild:
+    def __init__(self, bounds):
+        self._bounds = bounds
+        self._counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self._bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self._bounds + (float('inf'),), counts):
+            cumulative += count
+            samples.append((f"{name}_bucket", labels + [('le', format_value(float(bound)))], cumulative))
+        samples.append((f"{name}_sum", labels, total))
+        samples.append((f"{name}_count", labels, cumulative))
+        return samples
+
+
+class Histogram(_Metric):
+    """Counts observations (e.g. latencies) in cumulative buckets"""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS, registry=REGISTRY):
+        self.buckets = tuple(float(bound) for bound in sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+
+@contextmanager
+def timed(histogram, errors, *labels):
+    """Observe the duration of the enclosed block, counting it in errors if it raises"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        errors.labels(*labels).inc()
+        raise
+    finally:
+        histogram.labels(*labels).observe(time.perf_counter() - started)
+
+
+# Flask requests, by route pattern rather than URL to keep the series bounded
+HTTP_LATENCY = Histogram('stockstream_http_request_seconds', 'Latency of HTTP requests', ('route', 'method'))
+HTTP_REQUESTS = Counter('stockstream_http_requests_total', 'HTTP responses sent', ('route', 'method', 'status'))
+
+# Calls to market data upstreams, by endpoint and symbol. Only the tracked
+# stocks and crypto, the market indices and the lottery games keep their own
+# label; any other symbol a user looks up is counted as 'other' so the
+# number of series stays bounded.
+LABELLED_SYMBOLS = frozenset([
+    'AAPL', 'MSFT', 'GOOGL', 'AMZN', 'NVDA',
+    'BTC-USD', 'ETH-USD', 'BNB-USD', 'SOL-USD', 'XRP-USD',
+    '^GSPC', '^IXIC',
+    'powerball', 'mega_millions',
+])
+UPSTREAM_LATENCY = Histogram('stockstream_upstream_request_seconds', 'Latency of upstream market data calls',
+                             ('upstream', 'endpoint', 'symbol'))
+UPSTREAM_ERRORS = Counter('stockstream_upstream_errors_total', 'Upstream market data calls that failed',
+                          ('upstream', 'endpoint', 'symbol'))
+
+# Scheduler job runs, by job name
+JOB_LATENCY = Histogram('stockstream_job_seconds', 'Duration of scheduler job runs', ('job',),
+                        buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600))
+JOB_FAILURES = Counter('stockstream_job_failures_total', 'Scheduler job runs that raised', ('job',))
+JOB_TIMEOUTS = Counter('stockstream_job_timeouts_total', 'Scheduler job runs that exceeded their timeout', ('job',))
+JOB_MISSED = Counter('stockstream_job_missed_total', 'Scheduler job slots skipped or coalesced', ('job',))
+
+# MongoDB commands, by client, command and collection
+MONGO_LATENCY = Histogram('stockstream_mongo_command_seconds', 'Latency of MongoDB commands',
+                          ('client', 'command', 'collection'))
+MONGO_ERRORS = Counter('stockstream_mongo_command_errors_total', 'MongoDB commands that failed',
+                       ('client', 'command', 'collection'))
+# Buffered documents MongoDB rejected for good, by collection and error code
+MONGO_WRITES_REJECTED = Counter('stockstream_mongo_writes_rejected_total',
+                                'Buffered documents dropped because MongoDB rejected them', ('collection', 'code'))
+
+# Waits for a connection from the MongoDB pool, by server
+MONGO_POOL_WAIT = Histogram('stockstream_mongo_pool_wait_seconds', 'Time spent waiting to check out a MongoDB connection',
+                            ('server',), buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+MONGO_POOL_FAILURES = Counter('stockstream_mongo_pool_checkout_failures_total', 'MongoDB connection checkouts that failed',
+                              ('server', 'reason'))
+
+
+@contextmanager
+def upstream_call(endpoint, symbol, upstream='yfinance'):
+    """Time one upstream call: `with upstream_call('fast_info', symbol): ...`
+
+    Also recorded as a span of the current request, which keeps the real
+    symbol; the metrics label it 'other' unless it is in LABELLED_SYMBOLS.
+    """
+    label = symbol if symbol in LABELLED_SYMBOLS else 'other'
+    with span('upstream', f"{endpoint} {symbol}"), timed(UPSTREAM_LATENCY, UPSTREAM_ERRORS, upstream, endpoint, label):
+        yield
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Records the latency and failures of every command a MongoClient runs
+
+    Pass one per client: MongoClient(uri, event_listeners=[MongoCommandMetrics('app')]).
+    """
+
+    def __init__(self, client_name):
+        self.client_name = client_name
+        self._collections = {}  # (connection, request id) -> collection of a running command
+
+    def started(self, event):
+        # Most commands name their collection in their first field, getMore in 'collection'
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            target = event.command.get('collection')
+        if isinstance(target, str):
+            self._collections[(event.connection_id, event.request_id)] = target
+
+    def _labels(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), '')
+        return self.client_name, event.command_name, collection
+
+    def _record(self, labels, event):
+        # Listeners run on the thread that issued the command, so it lands in that request's trace
+        seconds = event.duration_micros / 1e6
+        MONGO_LATENCY.labels(*labels).observe(seconds)
+        record_span('mongo', f"{labels[1]} {labels[2]}".strip(), time.perf_counter() - seconds, seconds)
+
+    def succeeded(self, event):
+        self._record(self._labels(event), event)
+
+    def failed(self, event):
+        labels = self._labels(event)
+        self._record(labels, event)
+        MONGO_ERRORS.labels(*labels).inc()
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Tracks the connections of a MongoClient's pools and how long checkouts wait
+
+    Checkout events are published on the thread waiting for the connection,
+    so the wait is timed per thread and also lands in that request's trace.
+    """
+
+    def __init__(self):
+        self._servers = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @staticmethod
+    def _server_name(address):
+        return f"{address[0]}:{address[1]}" if isinstance(address, tuple) else str(address)
+
+    def _server(self, address):
+        name = self._server_name(address)
+        with self._lock:
+            if name not in self._servers:
+                self._servers[name] = {'open': 0, 'in_use': 0, 'checkouts': 0, 'failures': 0,
+                                       'wait_seconds': 0.0, 'max_wait_seconds': 0.0}
+        return name
+
+    def _update(self, address, **changes):
+        name = self._server(address)
+        with self._lock:
+            stats = self._servers[name]
+            for key, change in changes.items():
+                stats[key] += change
+
+    def _waited(self, address):
+        """Observe how long this thread's checkout from address waited; returns (server, seconds)"""
+        started = getattr(self._local, 'started', {}).pop(address, None)
+        seconds = time.perf_counter() - started if started is not None else 0.0
+        name = self._server(address)
+        MONGO_POOL_WAIT.labels(name).observe(seconds)
+        if started is not None:
+            record_span('mongo_wait', name, started, seconds)
+        return name, seconds
+
+    def connection_check_out_started(self, event):
+        if not hasattr(self._local, 'started'):
+            self._local.started = {}
+        self._local.started[event.address] = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        name, seconds = self._waited(event.address)
+        with self._lock:
+            stats = self._servers[name]
+            stats['in_use'] += 1
+            stats['checkouts'] += 1
+            stats['wait_seconds'] += seconds
+            stats['max_wait_seconds'] = max(stats['max_wait_seconds'], seconds)
+
+    def connection_check_out_failed(self, event):
+        name, _ = self._waited(event.address)
+        MONGO_POOL_FAILURES.labels(name, str(event.reason)).inc()
+        self._update(event.address, failures=1)
+
+    def connection_checked_in(self, event):
+        self._update(event.address, in_use=-1)
+
+    def connection_created(self, event):
+        self._update(event.address, open=1)
+
+    def connection_closed(self, event):
+        self._update(event.address, open=-1)
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        self._server(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._servers.pop(self._server_name(event.address), None)
+
+    def stats(self):
+        """Return per server counts, with the average and longest checkout wait"""
+        with self._lock:
+            servers = {name: dict(stats) for name, stats in self._servers.items()}
+        for stats in servers.values():
+            waited = stats.pop('wait_seconds')
+            stats['avg_wait_seconds'] = round(waited / stats['checkouts'], 6) if stats['checkouts'] else 0.0
+            stats['max_wait_seconds'] = round(stats['max_wait_seconds'], 6)
+        return servers
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port, host='0.0.0.0', registry=REGISTRY):
+    """Serve /metrics from a background thread, for processes without a Flask app"""
+    handler = type('MetricsHandler', (_MetricsHandler,), {'registry': registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logger.info(f"Serving metrics on port {server.server_address[1]}")
+    return server
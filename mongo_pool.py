@@ -0,0 +1,146 @@
+import os
+import threading
+import logging
+import certifi
+import pymongo
+from dotenv import load_dotenv
+from metrics import REGISTRY, MongoCommandMetrics, MongoPoolMetrics
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# The one MongoDB client of a process. The web app, the collector, the graph
+# generator and database setup all share its connection pool, which is
+# created on first use so importing a module (or gunicorn --preload) opens
+# no connection that a forked worker would inherit.
+
+# Connection string; MONGO_URI is the name older deployments used
+MONGODB_URI = os.getenv('MONGODB_URI') or os.getenv('MONGO_URI', '')
+# Database every collection lives in
+MONGO_DB_NAME = os.getenv('MONGO_DB_NAME', 'stockstream')
+# Raw price ticks, written by the collector and read by the web app
+PRICES_COLLECTION = 'stock_crypto_prices'
+
+# Connections per server the pool may open; threads beyond it queue for one
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '20'))
+# Connections kept open even when idle
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+# Seconds an idle connection is kept before it is closed
+MONGO_MAX_IDLE_SECONDS = float(os.getenv('MONGO_MAX_IDLE_SECONDS', '300'))
+# Seconds a thread waits for a free connection before the operation fails
+MONGO_WAIT_QUEUE_TIMEOUT = float(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT', '2'))
+# Seconds to open a connection, and to find a suitable server
+MONGO_CONNECT_TIMEOUT = float(os.getenv('MONGO_CONNECT_TIMEOUT', '5'))
+MONGO_SERVER_SELECTION_TIMEOUT = float(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT', '5'))
+# Seconds a single read or write on a connection may take
+MONGO_SOCKET_TIMEOUT = float(os.getenv('MONGO_SOCKET_TIMEOUT', '20'))
+# primary, primaryPreferred, secondary, secondaryPreferred or nearest
+MONGO_READ_PREFERENCE = os.getenv('MONGO_READ_PREFERENCE', 'primaryPreferred')
+# Write acknowledgement: a number of members or 'majority'
+MONGO_WRITE_CONCERN = os.getenv('MONGO_WRITE_CONCERN', 'majority')
+# Seconds a write waits for that acknowledgement
+MONGO_WRITE_TIMEOUT = float(os.getenv('MONGO_WRITE_TIMEOUT', '5'))
+# Name the connections report to the server (and label the command metrics)
+MONGO_APP_NAME = os.getenv('MONGO_APP_NAME', 'stockstream')
+
+_client = None
+_client_pid = None
+_pool_listener = None
+_client_lock = threading.Lock()
+
+
+def client_options(uri=None):
+    """Return the MongoClient keyword arguments the configuration asks for"""
+    uri = MONGODB_URI if uri is None else uri
+    write_concern = MONGO_WRITE_CONCERN
+    options = {
+        'appname': MONGO_APP_NAME,
+        'maxPoolSize': MONGO_MAX_POOL_SIZE,
+        'minPoolSize': MONGO_MIN_POOL_SIZE,
+        'maxIdleTimeMS': int(MONGO_MAX_IDLE_SECONDS * 1000),
+        'waitQueueTimeoutMS': int(MONGO_WAIT_QUEUE_TIMEOUT * 1000),
+        'connectTimeoutMS': int(MONGO_CONNECT_TIMEOUT * 1000),
+        'serverSelectionTimeoutMS': int(MONGO_SERVER_SELECTION_TIMEOUT * 1000),
+        'socketTimeoutMS': int(MONGO_SOCKET_TIMEOUT * 1000),
+        'readPreference': MONGO_READ_PREFERENCE,
+        'w': int(write_concern) if write_concern.isdigit() else write_concern,
+        'wTimeoutMS': int(MONGO_WRITE_TIMEOUT * 1000),
+    }
+    # Atlas needs certifi's CA bundle; a local server runs without TLS
+    lowered = uri.lower()
+    if lowered.startswith('mongodb+srv') or 'tls=true' in lowered or 'ssl=true' in lowered:
+        options['tlsCAFile'] = certifi.where()
+    return options
+
+
+def get_client():
+    """Return this process's MongoClient, creating it on first use
+
+    Creating the client does not wait for the server; the first operation does.
+    """
+    global _client, _client_pid, _pool_listener
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                if not MONGODB_URI:
+                    raise ValueError("MongoDB URI not found in environment variables")
+                listener = MongoPoolMetrics()
+                _client = pymongo.MongoClient(
+                    MONGODB_URI,
+                    event_listeners=[MongoCommandMetrics(MONGO_APP_NAME), listener],
+                    **client_options()
+                )
+                _pool_listener = listener
+                _client_pid = os.getpid()
+                logger.info(f"Created MongoDB client (pool of {MONGO_MAX_POOL_SIZE} per server)")
+    return _client
+
+
+def get_db():
+    """Return the stockstream database"""
+    return get_client()[MONGO_DB_NAME]
+
+
+def get_collection(name=PRICES_COLLECTION):
+    return get_db()[name]
+
+
+def ping():
+    """Round-trip to the server, raising if it cannot be reached"""
+    get_client().admin.command('ping')
+
+
+def close_client():
+    """Close this process's client; the next get_client() creates a new one"""
+    global _client, _client_pid, _pool_listener
+    with _client_lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = _client_pid = _pool_listener = None
+
+
+def pool_stats():
+    """Return connection counts and checkout waits per server of this process's pool"""
+    listener = _pool_listener if _client_pid == os.getpid() else None
+    return {
+        'max_pool_size': MONGO_MAX_POOL_SIZE,
+        'servers': listener.stats() if listener is not None else {}
+    }
+
+
+def pool_metrics():
+    """Report the open and checked out connections of the pool as metrics"""
+    servers = pool_stats()['servers']
+    return [
+        ('stockstream_mongo_pool_connections', 'gauge', 'MongoDB connections open in the pool, and checked out of it',
+         [('stockstream_mongo_pool_connections', [('server', server), ('state', state)], stats[state])
+          for server, stats in servers.items() for state in ('open', 'in_use')]),
+        ('stockstream_mongo_pool_max_size', 'gauge', 'Connections per server the MongoDB pool may open',
+         [('stockstream_mongo_pool_max_size', [], MONGO_MAX_POOL_SIZE)]),
+    ]
+
+REGISTRY.add_collector(pool_metrics)
@@ -0,0 +1,226 @@
+import time
+import threading
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo import ASCENDING
+
+# In-memory MongoDB stand-in for running the app offline (see benchmark.py).
+# It covers what price_repository, rollups.query_range and the write buffer
+# use: find with equality and range filters, projections with $field
+# aliases, sort, limit and insert_many. Clients created with the same URI
+# share data, as they would on a real server.
+
+# Seconds added to every read and write to approximate a remote database
+OPERATION_LATENCY = 0.0
+
+RANGE_OPERATORS = {
+    '$eq': lambda value, arg: value == arg,
+    '$ne': lambda value, arg: value != arg,
+    '$gt': lambda value, arg: value is not None and value > arg,
+    '$gte': lambda value, arg: value is not None and value >= arg,
+    '$lt': lambda value, arg: value is not None and value < arg,
+    '$lte': lambda value, arg: value is not None and value <= arg,
+    '$in': lambda value, arg: value in arg,
+    '$nin': lambda value, arg: value not in arg,
+}
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def get_path(doc, path):
+    """Return the value at a dotted path of doc, or None"""
+    for part in path.split('.'):
+        if not isinstance(doc, dict):
+            return None
+        doc = doc.get(part)
+    return doc
+
+
+def matches(doc, query):
+    """Return True if doc satisfies a filter of field equalities and range operators"""
+    for path, condition in (query or {}).items():
+        value = get_path(doc, path)
+        if isinstance(condition, dict) and condition and all(key.startswith('$') for key in condition):
+            for operator, arg in condition.items():
+                if operator not in RANGE_OPERATORS:
+                    raise NotImplementedError(f"Stand-in does not support {operator}")
+                if not RANGE_OPERATORS[operator](value, arg):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def project(doc, projection):
+    """Apply an inclusion projection (fields, '$path' aliases) or an exclusion one"""
+    if not projection:
+        return dict(doc)
+    include = {key: spec for key, spec in projection.items() if spec}
+    if not include:
+        return {key: value for key, value in doc.items() if key not in projection}
+    result = {}
+    if projection.get('_id', 1) and '_id' in doc:
+        result['_id'] = doc['_id']
+    for key, spec in include.items():
+        if isinstance(spec, str) and spec.startswith('$'):
+            result[key] = get_path(doc, spec[1:])
+        elif get_path(doc, key) is not None:
+            result[key] = get_path(doc, key)
+    return result
+
+
+class MemoryCursor:
+    def __init__(self, collection, query, projection):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = []
+        self._limit = 0
+
+    def sort(self, key, direction=ASCENDING):
+        self._sort = [(key, direction)] if isinstance(key, str) else list(key)
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def __iter__(self):
+        docs = [doc for doc in self._collection._snapshot() if matches(doc, self._query)]
+        # Stable sorts applied from the least to the most significant key
+        for key, direction in reversed(self._sort):
+            docs.sort(key=lambda doc: get_path(doc, key), reverse=direction != ASCENDING)
+        if self._limit:
+            docs = docs[:self._limit]
+        return iter([project(doc, self._projection) for doc in docs])
+
+
+class MemoryCollection:
+    def __init__(self, name, latency=0.0):
+        self.name = name
+        self.latency = latency
+        self._docs = []
+        self._indexes = {'_id_': {'key': [('_id', 1)]}}
+        self._lock = threading.Lock()
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _snapshot(self):
+        self._wait()
+        with self._lock:
+            return list(self._docs)
+
+    def find(self, filter=None, projection=None):
+        return MemoryCursor(self, filter, projection)
+
+    def find_one(self, filter=None, projection=None):
+        return next(iter(self.find(filter, projection).limit(1)), None)
+
+    def count_documents(self, filter):
+        return sum(1 for doc in self._snapshot() if matches(doc, filter))
+
+    def insert_one(self, doc):
+        return SimpleNamespace(inserted_id=self.insert_many([doc]).inserted_ids[0])
+
+    def insert_many(self, docs, ordered=True):
+        self._wait()
+        docs = list(docs)
+        for doc in docs:
+            doc.setdefault('_id', ObjectId())
+        with self._lock:
+            self._docs.extend(dict(doc) for doc in docs)
+        return SimpleNamespace(inserted_ids=[doc['_id'] for doc in docs])
+
+    def delete_many(self, filter):
+        with self._lock:
+            kept = [doc for doc in self._docs if not matches(doc, filter)]
+            deleted, self._docs = len(self._docs) - len(kept), kept
+        return SimpleNamespace(deleted_count=deleted)
+
+    def create_index(self, keys, **options):
+        keys = [(keys, ASCENDING)] if isinstance(keys, str) else list(keys)
+        name = '_'.join(f"{key}_{direction}" for key, direction in keys)
+        self._indexes[name] = dict(options, key=keys)
+        return name
+
+    def index_information(self):
+        return dict(self._indexes)
+
+    def drop_index(self, name):
+        self._indexes.pop(name, None)
+
+    def aggregate(self, pipeline, **options):
+        raise NotImplementedError("The MongoDB stand-in does not run aggregation pipelines")
+
+
+class MemoryDatabase:
+    def __init__(self, name, latency=0.0):
+        self.name = name
+        self.latency = latency
+        self._collections = {}
+        self._options = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self._lock:
+            collection = self._collections.get(name)
+            if collection is None:
+                collection = self._collections[name] = MemoryCollection(name, self.latency)
+            return collection
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def create_collection(self, name, **options):
+        self._options[name] = options
+        return self[name]
+
+    def list_collections(self, filter=None):
+        with self._lock:
+            names = list(self._collections)
+        return [{'name': name, 'options': self._options.get(name, {})}
+                for name in names if matches({'name': name}, filter)]
+
+    def list_collection_names(self):
+        with self._lock:
+            return list(self._collections)
+
+    def command(self, name, *args, **kwargs):
+        return {'ok': 1.0}
+
+
+class MemoryClient:
+    """Drop-in for pymongo.MongoClient that keeps every database in memory"""
+
+    def __init__(self, host=None, latency=None, **kwargs):
+        self.host = host
+        self.latency = OPERATION_LATENCY if latency is None else latency
+        with _servers_lock:
+            self._databases = _servers.setdefault(host, {})
+
+    def __getitem__(self, name):
+        with _servers_lock:
+            database = self._databases.get(name)
+            if database is None:
+                database = self._databases[name] = MemoryDatabase(name, self.latency)
+            return database
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self[name]
+
+    def close(self):
+        pass
+
+
+def reset(host=None):
+    """Drop every database of the stand-in server at host"""
+    with _servers_lock:
+        _servers.pop(host, None)
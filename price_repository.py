@@ -0,0 +1,112 @@
+from pymongo import ASCENDING, DESCENDING
+
+# Every query against stock_crypto_prices lives in this module. Each one is
+# served by one of these compound indexes (equality on a meta field, then the
+# time range) so it needs no in-memory sort, and returns flat, JSON-ready
+# documents without _id.
+INDEXES = [
+    [('meta.type', ASCENDING), ('timestamp', DESCENDING)],
+    [('meta.symbol', ASCENDING), ('timestamp', DESCENDING)],
+]
+
+# Rollup collections are keyed by symbol and bucket start
+ROLLUP_INDEXES = [
+    [('symbol', ASCENDING), ('timestamp', DESCENDING)],
+]
+
+# Fields returned by every price query
+PRICE_PROJECTION = {
+    '_id': 0,
+    'symbol': '$meta.symbol',
+    'type': '$meta.type',
+    'price': 1,
+    'volume': 1,
+    'timestamp': 1
+}
+
+
+# Fields returned by rollup queries
+ROLLUP_PROJECTION = {
+    '_id': 0,
+    'symbol': 1,
+    'timestamp': 1,
+    'open': 1,
+    'high': 1,
+    'low': 1,
+    'close': 1,
+    'volume': 1
+}
+
+
+def ensure_indexes(collection):
+    """Create the compound indexes the price queries rely on"""
+    for keys in INDEXES:
+        collection.create_index(keys)
+
+
+def latest_prices_query(collection, asset_type, since, limit):
+    """Cursor over the newest ticks of one asset type since a cutoff"""
+    return collection.find(
+        {'meta.type': asset_type, 'timestamp': {'$gte': since}},
+        PRICE_PROJECTION
+    ).sort('timestamp', DESCENDING).limit(limit)
+
+
+def type_series_query(collection, asset_type, since):
+    """Cursor over every tick of one asset type since a cutoff, oldest first"""
+    return collection.find(
+        {'meta.type': asset_type, 'timestamp': {'$gte': since}},
+        PRICE_PROJECTION
+    ).sort('timestamp', ASCENDING)
+
+
+def symbol_series_query(collection, symbol, since, until=None):
+    """Cursor over the ticks of one symbol in [since, until), oldest first"""
+    time_range = {'$gte': since}
+    if until is not None:
+        time_range['$lt'] = until
+    return collection.find(
+        {'meta.symbol': symbol, 'timestamp': time_range},
+        PRICE_PROJECTION
+    ).sort('timestamp', ASCENDING)
+
+
+def last_price_query(collection, symbol, since):
+    """Cursor over the newest tick of one symbol since a cutoff"""
+    return collection.find(
+        {'meta.symbol': symbol, 'timestamp': {'$gte': since}},
+        PRICE_PROJECTION
+    ).sort('timestamp', DESCENDING).limit(1)
+
+
+def rollup_series_query(collection, symbol, since, until):
+    """Cursor over one symbol's OHLCV buckets in [since, until), oldest first"""
+    return collection.find(
+        {'symbol': symbol, 'timestamp': {'$gte': since, '$lt': until}},
+        ROLLUP_PROJECTION
+    ).sort('timestamp', ASCENDING)
+
+
+def latest_prices(collection, asset_type, since, limit=5):
+    """Return the newest ticks of one asset type since a cutoff"""
+    return list(latest_prices_query(collection, asset_type, since, limit))
+
+
+def type_series(collection, asset_type, since):
+    """Return every tick of one asset type since a cutoff, oldest first"""
+    return list(type_series_query(collection, asset_type, since))
+
+
+def symbol_series(collection, symbol, since, until=None):
+    """Return the ticks of one symbol in [since, until), oldest first"""
+    return list(symbol_series_query(collection, symbol, since, until))
+
+
+def last_price(collection, symbol, since):
+    """Return the newest tick of one symbol since a cutoff, or None"""
+    return next(iter(last_price_query(collection, symbol, since)), None)
+
+
+def rollup_series(collection, symbol, since, until):
+    """Return one symbol's OHLCV buckets in [since, until), oldest first"""
+    return list(rollup_series_query(collection, symbol, since, until))
@@ -0,0 +1,167 @@
+import os
+import json
+import threading
+import time
+import logging
+from collections import deque
+
+from quote_service import get_quotes, asset_class
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds between upstream polls while anyone is subscribed
+PRICE_STREAM_INTERVAL = float(os.getenv('PRICE_STREAM_INTERVAL', '10'))
+# Seconds of silence after which a heartbeat comment is sent
+PRICE_STREAM_HEARTBEAT = float(os.getenv('PRICE_STREAM_HEARTBEAT', '15'))
+# Number of past events kept for Last-Event-ID resume
+PRICE_STREAM_HISTORY = int(os.getenv('PRICE_STREAM_HISTORY', '500'))
+# Milliseconds browsers wait before reconnecting a dropped stream
+PRICE_STREAM_RETRY_MS = int(os.getenv('PRICE_STREAM_RETRY_MS', '5000'))
+
+
+def format_event(event_id, data, event='prices'):
+    """Format one Server-Sent Events message"""
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class PriceBroadcaster:
+    """Polls quotes once for all viewers and pushes changed prices to subscribers
+
+    A single producer thread fetches every symbol each interval while at least
+    one client is subscribed, and records the quotes that changed since the
+    previous poll as a numbered event. Subscribers replay events newer than
+    their Last-Event-ID, or receive a full snapshot when that id has already
+    left the bounded event history.
+    """
+
+    def __init__(self, symbols, fetch=get_quotes, interval=PRICE_STREAM_INTERVAL,
+                 history=PRICE_STREAM_HISTORY, heartbeat=PRICE_STREAM_HEARTBEAT):
+        self.symbols = list(symbols)
+        self._fetch = fetch
+        self.interval = interval
+        self.heartbeat = heartbeat
+        self._latest = {}  # symbol -> last published quote
+        self._events = deque(maxlen=history)  # (event_id, changed quotes)
+        self._last_id = 0
+        self._subscribers = 0
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def poll_once(self):
+        """Fetch all symbols and publish the quotes that changed; returns them"""
+        quotes, errors = self._fetch(self.symbols)
+        for symbol, error in errors.items():
+            logger.error(f"Error fetching data for {symbol}: {error}")
+
+        changed = []
+        for symbol, quote in quotes.items():
+            if quote['price'] == 0:
+                continue
+            payload = {
+                'symbol': symbol,
+                'type': asset_class(symbol),
+                'price': quote['price'],
+                'change': quote['change']
+            }
+            if self._latest.get(symbol) != payload:
+                changed.append(payload)
+
+        if changed:
+            with self._cond:
+                for payload in changed:
+                    self._latest[payload['symbol']] = payload
+                self._last_id += 1
+                self._events.append((self._last_id, changed))
+                self._cond.notify_all()
+        return changed
+
+    def snapshot(self):
+        """Return (last event id, every latest quote)"""
+        with self._cond:
+            return self._last_id, list(self._latest.values())
+
+    def events_since(self, last_event_id):
+        """Return the events a client that saw last_event_id has missed
+
+        Returns None when the id is unknown or too old to replay, in which
+        case the client needs a snapshot instead.
+        """
+        with self._cond:
+            if last_event_id is None or last_event_id > self._last_id:
+                return None
+            if last_event_id == self._last_id:
+                return []
+            if not self._events or self._events[0][0] > last_event_id + 1:
+                return None
+            return [event for event in self._events if event[0] > last_event_id]
+
+    def stream(self, last_event_id=None):
+        """Yield Server-Sent Events for one subscriber until it disconnects"""
+        self._subscribe()
+        try:
+            yield f"retry: {PRICE_STREAM_RETRY_MS}\n\n"
+
+            try:
+                seen = int(last_event_id) if last_event_id else None
+            except ValueError:
+                seen = None
+
+            missed = self.events_since(seen)
+            if missed is None:
+                seen, quotes = self.snapshot()
+                if quotes:
+                    yield format_event(seen, quotes, event='snapshot')
+            else:
+                for event_id, quotes in missed:
+                    yield format_event(event_id, quotes)
+                    seen = event_id
+
+            while True:
+                with self._cond:
+                    if self._last_id == seen:
+                        self._cond.wait(self.heartbeat)
+                    missed = self.events_since(seen)
+                if missed is None:
+                    # Fell behind the event history; start over from a snapshot
+                    seen, quotes = self.snapshot()
+                    yield format_event(seen, quotes, event='snapshot')
+                elif missed:
+                    for event_id, quotes in missed:
+                        yield format_event(event_id, quotes)
+                        seen = event_id
+                else:
+                    yield ": heartbeat\n\n"
+        finally:
+            self._unsubscribe()
+
+    def subscriber_count(self):
+        """Return the number of connected subscribers"""
+        with self._cond:
+            return self._subscribers
+
+    def _subscribe(self):
+        with self._cond:
+            self._subscribers += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='price-stream', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def _unsubscribe(self):
+        with self._cond:
+            self._subscribers -= 1
+
+    def _run(self):
+        """Producer loop; idles while nobody is subscribed"""
+        while True:
+            with self._cond:
+                while self._subscribers == 0:
+                    self._cond.wait()
+            started = time.monotonic()
+            try:
+                self.poll_once()
+            except Exception as e:
+                logger.error(f"Error polling stream prices: {str(e)}")
+            time.sleep(max(self.interval - (time.monotonic() - started), 0))
@@ -0,0 +1,291 @@
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import random
+import itertools
+import threading
+import functools
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Where profiles and slow-request span breakdowns are written
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join(os.path.dirname(__file__), 'data', 'profiles'))
+# Requests carrying `X-Profile: <token>` are profiled; empty disables the header
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+# Share of all requests profiled at random
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+# Seconds between stack samples of a profiled request
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+# Requests slower than this get their span breakdown written; 0 disables it
+SLOW_REQUEST_SECONDS = float(os.getenv('SLOW_REQUEST_SECONDS', '2'))
+# Newest files kept in PROFILE_DIR
+PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', '200'))
+
+PROFILE_HEADER = 'X-Profile'
+
+_local = threading.local()
+_ids = itertools.count(1)
+
+
+class Trace:
+    """Spans of one request, and the threads currently working on it
+
+    Spans are (kind, name, start, seconds) with kind one of 'upstream',
+    'upstream_wait', 'mongo', 'mongo_wait' or 'serialize'; time not covered by any span
+    is reported as 'app'.
+    """
+
+    def __init__(self, name, profile=False):
+        self.id = f"{int(time.time())}-{os.getpid()}-{next(_ids)}"
+        self.name = name
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.spans = []
+        self.threads = {threading.get_ident()}
+        self.samples = Counter() if profile else None
+        self._lock = threading.Lock()
+
+    @property
+    def profiled(self):
+        return self.samples is not None
+
+    def add_span(self, kind, name, started, seconds):
+        with self._lock:
+            self.spans.append((kind, name, started - self.started, seconds))
+
+    def enter(self):
+        with self._lock:
+            self.threads.add(threading.get_ident())
+
+    def leave(self):
+        with self._lock:
+            self.threads.discard(threading.get_ident())
+
+    def breakdown(self):
+        """Return seconds per span kind plus the uncovered remainder as 'app'
+
+        Spans run concurrently on fan-out threads, so each kind counts the
+        union of its spans' intervals rather than their sum.
+        """
+        with self._lock:
+            spans = list(self.spans)
+        totals = {}
+        for kind in dict.fromkeys(span[0] for span in spans):
+            totals[kind] = _covered([(start, start + seconds) for k, _, start, seconds in spans if k == kind])
+        covered = _covered([(start, start + seconds) for _, _, start, seconds in spans])
+        totals['app'] = max(0.0, (self.seconds or 0) - covered)
+        return {kind: round(seconds, 6) for kind, seconds in totals.items()}
+
+    def folded_spans(self):
+        """Spans as collapsed stacks in microseconds, for flamegraph.pl or speedscope"""
+        with self._lock:
+            spans = list(self.spans)
+        weights = Counter()
+        for kind, name, _, seconds in spans:
+            weights[f"{self.name};{kind};{name}"] += seconds
+        weights[f"{self.name};app"] += self.breakdown()['app']
+        return ''.join(f"{stack} {round(seconds * 1e6)}\n" for stack, seconds in weights.items() if seconds > 0)
+
+    def folded_profile(self):
+        with self._lock:
+            samples = list(self.samples.items())
+        return ''.join(f"{self.name};{stack} {count}\n" for stack, count in samples)
+
+
+def _covered(intervals):
+    """Total length of the union of (start, end) intervals"""
+    total = 0.0
+    end = None
+    for start, stop in sorted(intervals):
+        if end is None or start > end:
+            total += stop - start
+            end = stop
+        elif stop > end:
+            total += stop - end
+            end = stop
+    return total
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+def record_span(kind, name, started, seconds):
+    """Add a finished span to the calling thread's trace, if any"""
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.add_span(kind, name, started, seconds)
+
+
+@contextmanager
+def span(kind, name):
+    """Time the enclosed block as a span of the current request"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(kind, name, started, time.perf_counter() - started)
+
+
+def traced(fn):
+    """Wrap fn so spans it records on another thread go to the caller's trace"""
+    trace = current_trace()
+    if trace is None:
+        return fn
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        previous = current_trace()
+        _local.trace = trace
+        trace.enter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            trace.leave()
+            _local.trace = previous
+    return wrapper
+
+
+class Sampler:
+    """One background thread sampling the stacks of every profiled request
+
+    Each tick reads the current frame of the threads working on a profiled
+    trace (the request thread and its fan-out workers) and counts the
+    collapsed stack, so unprofiled requests pay nothing.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self._traces = set()
+        self._lock = threading.Lock()
+        self._active = threading.Condition(self._lock)
+        self._thread = None
+        self._pid = None
+
+    def add(self, trace):
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+                self._thread.start()
+            self._traces.add(trace)
+            self._active.notify()
+
+    def remove(self, trace):
+        with self._lock:
+            self._traces.discard(trace)
+
+    def _run(self):
+        own = threading.get_ident()
+        while True:
+            with self._lock:
+                while not self._traces:
+                    self._active.wait()
+                traces = list(self._traces)
+            frames = sys._current_frames()
+            for trace in traces:
+                with trace._lock:
+                    threads = list(trace.threads)
+                for ident in threads:
+                    frame = frames.get(ident)
+                    if frame is not None and ident != own:
+                        stack = collapse(frame)
+                        with trace._lock:
+                            trace.samples[stack] += 1
+            time.sleep(self.interval)
+
+
+def collapse(frame):
+    """Return a frame's stack, outermost first, as 'func (file:line);...'"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+sampler = Sampler()
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='profile-writer')
+
+
+def should_profile(headers, token=PROFILE_TOKEN, sample_rate=PROFILE_SAMPLE_RATE):
+    """Return True if a request with these headers should be sampled"""
+    supplied = headers.get(PROFILE_HEADER)
+    if token and supplied and hmac.compare_digest(supplied.encode(), token.encode()):
+        return True
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def begin(name, profile=False):
+    """Start the calling thread's trace; profile also samples its stacks"""
+    trace = Trace(name, profile)
+    _local.trace = trace
+    if profile:
+        sampler.add(trace)
+    return trace
+
+
+def finish(trace, directory=PROFILE_DIR, slow_seconds=SLOW_REQUEST_SECONDS):
+    """End a trace and write its files if it was profiled or slow
+
+    Returns True if files are being written, in the background.
+    """
+    trace.seconds = time.perf_counter() - trace.started
+    _local.trace = None
+    if trace.profiled:
+        sampler.remove(trace)
+    slow = bool(slow_seconds) and trace.seconds >= slow_seconds
+    if not (slow or trace.profiled):
+        return False
+    _writer.submit(write_trace, trace, directory)
+    return True
+
+
+def write_trace(trace, directory=PROFILE_DIR):
+    """Write a trace's span breakdown (and profile) as JSON and folded stacks"""
+    try:
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(directory, f"{trace.id}-{re.sub(r'[^A-Za-z0-9]+', '_', trace.name).strip('_')}")
+        files = {
+            '.spans.json': json.dumps({
+                'id': trace.id,
+                'request': trace.name,
+                'seconds': round(trace.seconds, 6),
+                'breakdown': trace.breakdown(),
+                'spans': [{'kind': kind, 'name': name, 'start': round(start, 6), 'seconds': round(seconds, 6)}
+                          for kind, name, start, seconds in sorted(trace.spans, key=lambda span: span[2])]
+            }, indent=2),
+            '.spans.folded': trace.folded_spans(),
+        }
+        if trace.profiled:
+            files['.profile.folded'] = trace.folded_profile()
+        for suffix, content in files.items():
+            with open(base + suffix + '.tmp', 'w') as f:
+                f.write(content)
+            os.replace(base + suffix + '.tmp', base + suffix)
+        prune(directory)
+    except Exception as e:
+        logger.error(f"Error writing trace {trace.id}: {str(e)}")
+
+
+def prune(directory=PROFILE_DIR, keep=PROFILE_MAX_FILES):
+    """Delete all but the newest keep files"""
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if not name.endswith('.tmp')]
+    if len(paths) <= keep:
+        return
+    paths.sort(key=os.path.getmtime)
+    for path in paths[:-keep]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
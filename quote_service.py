@@ -0,0 +1,326 @@
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from circuit_breaker import CLOSED, get_breaker
+from upstream_gateway import upstream_gateway, with_priority
+from shared_cache import shared_cache
+from metrics import upstream_call
+from profiling import traced
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Seconds a cached quote stays fresh, per asset class
+QUOTE_TTLS = {
+    'stock': float(os.getenv('QUOTE_TTL_STOCK', '30')),
+    'crypto': float(os.getenv('QUOTE_TTL_CRYPTO', '15')),
+    'index': float(os.getenv('QUOTE_TTL_INDEX', '30')),
+}
+# Maximum number of symbols kept in the cache
+QUOTE_CACHE_SIZE = int(os.getenv('QUOTE_CACHE_SIZE', '1024'))
+# Upstream fetch pool size and time budgets (seconds) for batched lookups
+QUOTE_FETCH_WORKERS = int(os.getenv('QUOTE_FETCH_WORKERS', '16'))
+QUOTE_FETCH_TIMEOUT = float(os.getenv('QUOTE_FETCH_TIMEOUT', '5'))
+QUOTE_BATCH_DEADLINE = float(os.getenv('QUOTE_BATCH_DEADLINE', '10'))
+
+
+def asset_class(symbol):
+    """Return the asset class ('index', 'crypto' or 'stock') of a symbol"""
+    if symbol.startswith('^'):
+        return 'index'
+    if symbol.endswith('-USD'):
+        return 'crypto'
+    return 'stock'
+
+
+def fetch_quote(symbol):
+    """Fetch a quote for a single symbol from yfinance"""
+    # Imported on first use: yfinance and the pandas it loads dominate startup time
+    import yfinance as yf
+
+    with upstream_call('fast_info', symbol):
+        info = yf.Ticker(symbol).fast_info
+        current = float(info.last_price if hasattr(info, 'last_price') else 0)
+        prev_close = float(info.previous_close if hasattr(info, 'previous_close') else current)
+        volume = float(info.volume if hasattr(info, 'volume') else 0)
+        if not current:
+            # Throttled responses come back without a price; don't cache them as real
+            raise ValueError(f"No price returned for {symbol}")
+    change = ((current - prev_close) / prev_close * 100) if prev_close else 0
+
+    return {
+        'symbol': symbol,
+        'price': current,
+        'previous_close': prev_close,
+        'change': round(change, 2),
+        'volume': volume
+    }
+
+
+def gated_fetch_quote(symbol):
+    """Fetch a quote through the rate-limited upstream gateway"""
+    return upstream_gateway.call(('quote', symbol), lambda: fetch_quote(symbol))
+
+
+def shared_fetch_quote(symbol):
+    """Fetch a quote through the cache shared by every worker on the node
+
+    Returns (quote, seconds it stays fresh) so the in-process cache expires
+    it together with the shared copy.
+    """
+    ttl = QUOTE_TTLS.get(asset_class(symbol), 30)
+    return shared_cache.get_or_load(f'quote:{symbol}', lambda: gated_fetch_quote(symbol), ttl)
+
+
+class QuoteCache:
+    """Bounded LRU cache of quotes with per-asset-class TTLs and single-flight loading
+
+    Concurrent misses for the same symbol share one upstream fetch: the first
+    caller loads the quote while the others wait on its result. fetch
+    returns a quote, or a (quote, ttl) pair when its source knows how long
+    the quote stays fresh. on_coalesce
+    is called with the symbol before a caller starts waiting on another's
+    fetch, e.g. to raise that fetch's priority.
+    """
+
+    def __init__(self, fetch, ttls, max_size, on_coalesce=None):
+        self._fetch = fetch
+        self._on_coalesce = on_coalesce
+        self._ttls = ttls
+        self._max_size = max_size
+        self._entries = OrderedDict()  # symbol -> (expires_at, fetched_at, quote)
+        self._inflight = {}  # symbol -> Future of the running fetch
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def peek(self, symbol):
+        """Return the cached quote for symbol if it is still fresh, otherwise None"""
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(symbol)
+                self.hits += 1
+                return entry[2]
+        return None
+
+    def stale(self, symbol):
+        """Return the last quote fetched for symbol however old, tagged with its age in seconds"""
+        with self._lock:
+            entry = self._entries.get(symbol)
+        if entry is None:
+            return None
+        return dict(entry[2], stale=True, age=round(time.monotonic() - entry[1], 1))
+
+    def get(self, symbol):
+        """Return the quote for symbol, fetching it upstream when missing or expired"""
+        with self._lock:
+            entry = self._entries.get(symbol)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(symbol)
+                self.hits += 1
+                return entry[2]
+
+            flight = self._inflight.get(symbol)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                flight = Future()
+                self._inflight[symbol] = flight
+                self.misses += 1
+                leader = True
+
+        if not leader:
+            if self._on_coalesce is not None:
+                self._on_coalesce(symbol)
+            return flight.result()
+
+        try:
+            result = self._fetch(symbol)
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(symbol, None)
+            flight.set_exception(e)
+            raise
+
+        quote, ttl = result if isinstance(result, tuple) else (result, None)
+        self.put(symbol, quote, ttl)
+        with self._lock:
+            self._inflight.pop(symbol, None)
+        flight.set_result(quote)
+        return quote
+
+    def put(self, symbol, quote, ttl=None):
+        """Store a freshly fetched quote, evicting the least recently used entries"""
+        if ttl is None:
+            ttl = self._ttls.get(asset_class(symbol), 30)
+        now = time.monotonic()
+        with self._lock:
+            self._entries[symbol] = (now + ttl, now, quote)
+            self._entries.move_to_end(symbol)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached quote"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters for the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_size': self._max_size,
+                'hit_ratio': round((self.hits + self.coalesced) / lookups, 4) if lookups else 0
+            }
+
+
+def _probe(cache, executor, breaker, symbols):
+    """Refresh symbols in the background as the probe of a half-open breaker"""
+    try:
+        cache.get(symbols[0])
+    except Exception as e:
+        logger.warning(f"Probe of {breaker.name} failed: {str(e)}")
+        breaker.record_failure()
+        return
+    breaker.record_success()
+    for symbol in symbols[1:]:
+        executor.submit(cache.get, symbol)
+
+
+def fetch_batch(cache, executor, symbols, timeout=QUOTE_FETCH_TIMEOUT, deadline=QUOTE_BATCH_DEADLINE, breaker=None,
+                serve_stale=False):
+    """Fetch quotes for many symbols concurrently through cache
+
+    Cached symbols are answered immediately and the misses are fetched on the
+    bounded executor. A symbol fails with a timeout once its fetch has been
+    running for `timeout` seconds, and every symbol still pending when the
+    overall `deadline` passes is reported as timed out. Abandoned fetches keep
+    running in the background and still populate the cache.
+
+    With a breaker, each fetch's outcome is recorded on it. While it is not
+    closed nothing waits on upstream: misses are refreshed in the background
+    when the breaker admits a probe. With serve_stale, any symbol without a
+    fresh quote is answered with its last known one, tagged stale with its
+    age; otherwise it stays in errors, so callers that store prices never
+    mistake an old quote for a new one.
+
+    Returns a (quotes, errors) pair of dicts keyed by symbol.
+    """
+    quotes = {}
+    errors = {}
+    started = {}
+    pending = {}
+
+    def load(symbol):
+        started[symbol] = time.monotonic()
+        return cache.get(symbol)
+
+    misses = []
+    for symbol in dict.fromkeys(symbols):
+        quote = cache.peek(symbol)
+        if quote is not None:
+            quotes[symbol] = quote
+        else:
+            misses.append(symbol)
+
+    if breaker is not None and misses and breaker.state != CLOSED:
+        if breaker.allow():
+            executor.submit(with_priority(_probe), cache, executor, breaker, misses)
+        for symbol in misses:
+            errors[symbol] = f'{breaker.name} circuit is open'
+        misses = []
+
+    for symbol in misses:
+        pending[executor.submit(with_priority(traced(load)), symbol)] = symbol
+
+    end = time.monotonic() + deadline
+    while pending:
+        now = time.monotonic()
+        if now >= end:
+            break
+        running = [started[s] for s in pending.values() if s in started]
+        wake = min([end] + [t + timeout for t in running])
+        if len(running) < len(pending):
+            # Re-check soon so queued fetches get their timeout once they start
+            wake = min(wake, now + 0.05)
+        done, _ = wait(list(pending), timeout=max(wake - now, 0.01), return_when=FIRST_COMPLETED)
+
+        for future in done:
+            symbol = pending.pop(future)
+            try:
+                quotes[symbol] = future.result()
+                if breaker is not None:
+                    breaker.record_success()
+            except Exception as e:
+                errors[symbol] = str(e)
+                if breaker is not None:
+                    breaker.record_failure()
+
+        now = time.monotonic()
+        for future, symbol in list(pending.items()):
+            if symbol in started and now - started[symbol] >= timeout:
+                errors[symbol] = f'timed out after {timeout:g}s'
+                del pending[future]
+                if breaker is not None:
+                    breaker.record_failure()
+
+    for symbol in pending.values():
+        errors[symbol] = f'batch deadline of {deadline:g}s exceeded'
+        if breaker is not None:
+            breaker.record_failure()
+
+    # Serve the last known quote of anything upstream could not answer
+    for symbol in list(errors) if serve_stale else []:
+        quote = cache.stale(symbol)
+        if quote is not None:
+            quotes[symbol] = quote
+            del errors[symbol]
+
+    # Preserve the caller's symbol order
+    ordered = {symbol: quotes[symbol] for symbol in dict.fromkeys(symbols) if symbol in quotes}
+    return ordered, errors
+
+
+quote_cache = QuoteCache(shared_fetch_quote if shared_cache is not None else gated_fetch_quote,
+                         QUOTE_TTLS, QUOTE_CACHE_SIZE,
+                         on_coalesce=lambda symbol: upstream_gateway.prioritize(('quote', symbol)))
+fetch_executor = ThreadPoolExecutor(max_workers=QUOTE_FETCH_WORKERS, thread_name_prefix='quote-fetch')
+quote_breaker = get_breaker('yfinance-quotes')
+
+
+def get_quote(symbol):
+    """Return the current quote for symbol through the shared cache"""
+    return quote_cache.get(symbol)
+
+
+def get_quotes(symbols, timeout=QUOTE_FETCH_TIMEOUT, deadline=QUOTE_BATCH_DEADLINE, serve_stale=False):
+    """Return current quotes for many symbols as a (quotes, errors) pair
+
+    Pass serve_stale to answer failed symbols with their last known quote
+    (for display only; never store those as new prices).
+    """
+    return fetch_batch(quote_cache, fetch_executor, symbols, timeout, deadline, quote_breaker, serve_stale)
+
+
+def cache_stats():
+    """Return hit/miss counters of the quote cache and the cross-worker cache under it"""
+    stats = quote_cache.stats()
+    if shared_cache is not None:
+        stats['shared'] = shared_cache.stats()
+    return stats
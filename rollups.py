@@ -0,0 +1,164 @@
+import os
+import logging
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+
+from price_repository import ROLLUP_INDEXES, rollup_series
+from write_buffer import WRITE_BUFFER_FLUSH_INTERVAL
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+RAW_COLLECTION = 'stock_crypto_prices'
+STATE_COLLECTION = 'rollup_state'
+
+# Resolutions from finest to coarsest: each is built from the one before it
+# (the first from raw ticks) and kept for its own retention period.
+RESOLUTIONS = [
+    {'name': '1m', 'seconds': 60, 'unit': 'minute',
+     'retention': int(os.getenv('ROLLUP_RETENTION_1M', str(7 * 86400)))},
+    {'name': '1h', 'seconds': 3600, 'unit': 'hour',
+     'retention': int(os.getenv('ROLLUP_RETENTION_1H', str(180 * 86400)))},
+    {'name': '1d', 'seconds': 86400, 'unit': 'day',
+     'retention': int(os.getenv('ROLLUP_RETENTION_1D', str(10 * 366 * 86400)))},
+]
+
+# Most buckets a range query should return before switching to a coarser resolution
+ROLLUP_MAX_POINTS = int(os.getenv('ROLLUP_MAX_POINTS', '500'))
+# Seconds a raw tick may take to reach MongoDB before its minute is rolled up:
+# a collection run can last its 120s timeout, then wait in the write-behind buffer
+ROLLUP_GRACE_SECONDS = float(os.getenv('ROLLUP_GRACE_SECONDS', str(120 + WRITE_BUFFER_FLUSH_INTERVAL)))
+
+
+def rollup_collection_name(resolution):
+    return f"price_rollups_{resolution['name']}"
+
+
+def floor_time(when, seconds):
+    """Round a naive UTC datetime down to a multiple of seconds since the epoch"""
+    epoch = int((when - datetime(1970, 1, 1)).total_seconds())
+    return datetime(1970, 1, 1) + timedelta(seconds=epoch - epoch % seconds)
+
+
+def setup_rollups(db):
+    """Create the per-resolution indexes: range lookups plus TTL retention"""
+    for resolution in RESOLUTIONS:
+        collection = db[rollup_collection_name(resolution)]
+        for keys in ROLLUP_INDEXES:
+            collection.create_index(keys)
+        collection.create_index('timestamp', expireAfterSeconds=resolution['retention'])
+
+
+def rollup_pipeline(resolution, source_is_raw, start, end):
+    """Aggregation pipeline that folds [start, end) of a source into OHLCV buckets"""
+    bucket = {'$dateTrunc': {'date': '$timestamp', 'unit': resolution['unit']}}
+    if source_is_raw:
+        group = {
+            '_id': {'symbol': '$meta.symbol', 'timestamp': bucket},
+            'type': {'$first': '$meta.type'},
+            'open': {'$first': '$price'},
+            'high': {'$max': '$price'},
+            'low': {'$min': '$price'},
+            'close': {'$last': '$price'},
+            # Ticks carry the session's running volume, so the last one wins
+            'volume': {'$last': '$volume'},
+            'count': {'$sum': 1}
+        }
+    else:
+        group = {
+            '_id': {'symbol': '$symbol', 'timestamp': bucket},
+            'type': {'$first': '$type'},
+            'open': {'$first': '$open'},
+            'high': {'$max': '$high'},
+            'low': {'$min': '$low'},
+            'close': {'$last': '$close'},
+            'volume': {'$last': '$volume'},
+            'count': {'$sum': '$count'}
+        }
+
+    return [
+        {'$match': {'timestamp': {'$gte': start, '$lt': end}}},
+        {'$sort': {'timestamp': 1}},
+        {'$group': group},
+        {'$set': {'symbol': '$_id.symbol', 'timestamp': '$_id.timestamp'}},
+        {'$merge': {
+            'into': rollup_collection_name(resolution),
+            'on': '_id',
+            'whenMatched': 'replace',
+            'whenNotMatched': 'insert'
+        }}
+    ]
+
+
+def rollup_window(resolution, watermark, source_watermark, now):
+    """Return the [start, end) span of closed buckets still to process, or None"""
+    if watermark is None or source_watermark is None:
+        return None
+    end = floor_time(min(now, source_watermark), resolution['seconds'])
+    if watermark >= end:
+        return None
+    return watermark, end
+
+
+def run_rollups(db, now=None):
+    """Roll raw ticks up through every resolution, processing only newly closed buckets
+
+    Raw minutes are held back by ROLLUP_GRACE_SECONDS so ticks that are
+    still being collected or buffered land before their bucket is closed.
+    """
+    now = now or datetime.utcnow()
+    state = db[STATE_COLLECTION]
+    source = db[RAW_COLLECTION]
+    source_watermark = now - timedelta(seconds=ROLLUP_GRACE_SECONDS)
+    processed = {}
+
+    for index, resolution in enumerate(RESOLUTIONS):
+        saved = state.find_one({'_id': resolution['name']})
+        watermark = saved['watermark'] if saved else None
+        if watermark is None:
+            # First run: start from the oldest data the source still holds
+            oldest = source.find_one({}, {'timestamp': 1}, sort=[('timestamp', ASCENDING)])
+            if oldest is not None:
+                watermark = floor_time(oldest['timestamp'], resolution['seconds'])
+
+        window = rollup_window(resolution, watermark, source_watermark, now)
+        if window is not None:
+            start, end = window
+            source.aggregate(rollup_pipeline(resolution, index == 0, start, end), allowDiskUse=True)
+            state.update_one({'_id': resolution['name']}, {'$set': {'watermark': end}}, upsert=True)
+            watermark = end
+            processed[resolution['name']] = (start, end)
+            logger.info(f"Rolled up {resolution['name']} buckets from {start} to {end}")
+
+        # Coarser resolutions may only use buckets this one has finished
+        source = db[rollup_collection_name(resolution)]
+        source_watermark = watermark
+
+    return processed
+
+
+def select_resolution(start, end, now=None, max_points=ROLLUP_MAX_POINTS):
+    """Pick the finest resolution that keeps [start, end) within max_points buckets
+
+    Resolutions whose retention no longer reaches back to start are skipped,
+    so long ranges land on coarse buckets and the number of documents read
+    stays bounded whatever the span.
+    """
+    now = now or datetime.utcnow()
+    span = (end - start).total_seconds()
+    for resolution in RESOLUTIONS:
+        if now - timedelta(seconds=resolution['retention']) > start:
+            continue
+        if span / resolution['seconds'] <= max_points:
+            return resolution
+    return RESOLUTIONS[-1]
+
+
+def query_range(db, symbol, start, end=None, max_points=ROLLUP_MAX_POINTS):
+    """Return (resolution name, OHLCV buckets) of symbol between start and end"""
+    end = end or datetime.utcnow()
+    resolution = select_resolution(start, end, max_points=max_points)
+    buckets = rollup_series(db[rollup_collection_name(resolution)], symbol, start, end)
+    return resolution['name'], buckets
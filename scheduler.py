@@ -1,9 +1,17 @@
-import schedule
-import time
-from data_collector import fetch_and_store_prices, clear_old_data
+import os
+import signal
+import threading
+from data_collector import fetch_and_store_prices, flush_prices, STOCKS, CRYPTO, COLLECT_INTERVAL
+from database import setup_database
 from graph_generator import update_all_graphs
+from graph_snapshots import refresh_dashboard_snapshot, SNAPSHOT_INTERVAL
+from job_executor import JobExecutor, MISFIRE_SKIP
+from upstream_gateway import with_priority, PRIORITY_BACKGROUND
+from rollups import run_rollups
+from mongo_pool import get_db
+from lottery import lottery_archive, LOTTERY_REFRESH_SECONDS
+from metrics import start_http_server
 import logging
-from datetime import datetime
 
 # Setup logging with more detailed format
 logging.basicConfig(
@@ -12,51 +20,97 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-def run_hourly_tasks():
-    """Run tasks that need to be executed every hour"""
-    try:
-        logger.info("Starting hourly tasks...")
-        logger.info("Fetching and storing prices...")
-        fetch_and_store_prices()
-        logger.info("Updating graphs...")
-        update_all_graphs()
-        logger.info("Hourly tasks completed successfully")
-    except Exception as e:
-        logger.error(f"Error in hourly tasks: {str(e)}")
+# Port serving the scheduler's own /metrics (jobs, upstream and MongoDB calls); 0 disables it
+SCHEDULER_METRICS_PORT = int(os.getenv('SCHEDULER_METRICS_PORT', '9101'))
 
-def run_daily_tasks():
-    """Run tasks that need to be executed daily at midnight"""
-    try:
-        logger.info("Starting daily cleanup...")
-        clear_old_data()
-        logger.info("Daily tasks completed successfully")
-    except Exception as e:
-        logger.error(f"Error in daily tasks: {str(e)}")
+def run_collect_tasks():
+    """Fetch current prices and write them to MongoDB"""
+    logger.info("Fetching and storing prices...")
+    fetch_and_store_prices()
+    flush_prices()
+
+def run_graph_tasks():
+    """Redraw the static performance graphs"""
+    # Make sure buffered prices are in MongoDB before graphing them
+    flush_prices()
+    logger.info("Updating graphs...")
+    update_all_graphs()
+
+def run_snapshot_tasks():
+    """Precompute the dashboard graphs served by /api/dashboard/graphs"""
+    logger.info("Refreshing dashboard graph snapshot...")
+    refresh_dashboard_snapshot(STOCKS, CRYPTO)
+
+def run_rollup_tasks():
+    """Fold newly closed minutes, hours and days into the rollup collections"""
+    flush_prices()
+    run_rollups(get_db())
+
+def run_lottery_tasks():
+    """Append newly published Powerball and Mega Millions draws to the archive"""
+    lottery_archive.refresh_all()
+
+def background(job):
+    """Run a job's upstream calls behind those of user requests"""
+    return with_priority(job, PRIORITY_BACKGROUND)
+
+def build_executor():
+    """Register every scheduler job on a new executor"""
+    executor = JobExecutor()
+    
+    # Collection cadence is independent of the graphs built from it
+    executor.add_job('collect_prices', background(run_collect_tasks), COLLECT_INTERVAL,
+                     timeout=120, run_immediately=True)
+    
+    # Hourly graphs a minute past the hour, after that hour's collection
+    executor.add_job('update_graphs', background(run_graph_tasks), 3600, offset=60,
+                     timeout=600, run_immediately=True)
+    
+    # Refresh the dashboard graphs as each 5 minute bar closes
+    executor.add_job('dashboard_snapshot', background(run_snapshot_tasks), SNAPSHOT_INTERVAL, offset=5, jitter=5,
+                     timeout=120, run_immediately=True)
+    
+    # Roll up raw ticks every minute; a late run is simply dropped since
+    # the next one covers the same buckets
+    executor.add_job('rollups', background(run_rollup_tasks), 60, offset=2, jitter=2,
+                     timeout=55, misfire=MISFIRE_SKIP)
+    
+    # Only draws newer than the archived ones are fetched, so an hourly check is cheap
+    executor.add_job('lottery', run_lottery_tasks, LOTTERY_REFRESH_SECONDS,
+                     timeout=120, run_immediately=True)
+    return executor
 
 def main():
     logger.info("Starting StockStream scheduler...")
     
-    # Run tasks immediately on startup
-    logger.info("Running initial tasks...")
-    run_hourly_tasks()
+    # Make sure prices go into the time-series collection; MongoDB expires
+    # old ticks itself, so no cleanup job is needed
+    try:
+        setup_database()
+    except Exception as e:
+        logger.error(f"Error setting up database: {str(e)}")
     
-    # Schedule hourly tasks
-    schedule.every().hour.at(":00").do(run_hourly_tasks)
-    logger.info("Scheduled hourly tasks")
+    if SCHEDULER_METRICS_PORT:
+        try:
+            start_http_server(SCHEDULER_METRICS_PORT)
+        except OSError as e:
+            logger.error(f"Error serving metrics on port {SCHEDULER_METRICS_PORT}: {str(e)}")
     
-    # Schedule daily tasks at midnight
-    schedule.every().day.at("00:00").do(run_daily_tasks)
-    logger.info("Scheduled daily tasks")
+    executor = build_executor()
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
     
+    executor.start()
     logger.info("Scheduler started successfully")
-    
-    while True:
-        try:
-            schedule.run_pending()
-            time.sleep(60)  # Check every minute
-        except Exception as e:
-            logger.error(f"Error in scheduler: {str(e)}")
-            time.sleep(60)  # Wait a minute before retrying
+    try:
+        while not stopped.wait(60):
+            executor.publish_stats()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info("Stopping scheduler...")
+        executor.stop(wait=False)
+        flush_prices()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+import logging
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SQLite file shared by every worker process on the node; empty disables it
+SHARED_CACHE_PATH = os.getenv('SHARED_CACHE_PATH', os.path.join(os.path.dirname(__file__), 'data', 'cache', 'shared.sqlite'))
+# Seconds a worker may hold a key's refresh lease before another takes over
+SHARED_CACHE_LEASE_SECONDS = float(os.getenv('SHARED_CACHE_LEASE_SECONDS', '10'))
+# Seconds between checks while another worker refreshes a key
+SHARED_CACHE_POLL_INTERVAL = 0.05
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)',
+    'CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)',
+]
+
+
+class SharedCache:
+    """TTL cache in a SQLite file shared by the worker processes of a node
+
+    Every write is a single statement, so readers in other processes see
+    either the old or the new value, never part of one. When a key is
+    missing or expired, workers race for the key's lease; only the winner
+    calls the loader and publishes the result, while the others poll for it.
+    A lease expires after lease_seconds so a crashed worker cannot block a
+    key, and the upstream is called once per key and TTL however many
+    workers are running.
+    """
+
+    def __init__(self, path=SHARED_CACHE_PATH, lease_seconds=SHARED_CACHE_LEASE_SECONDS,
+                 poll_interval=SHARED_CACHE_POLL_INTERVAL, clock=time.time):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._clock = clock
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.loads = 0
+        self.waits = 0
+
+    def _conn(self):
+        """Return this thread's connection, opening a new one after a fork"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        for statement in SCHEMA:
+            conn.execute(statement)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _owner(self):
+        return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+    def get(self, key):
+        """Return (value, expires_at) of key, expired or not, or None"""
+        row = self._conn().execute('SELECT value, expires_at FROM entries WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, key, value, ttl):
+        """Publish value under key for ttl seconds"""
+        self._conn().execute(
+            'INSERT OR REPLACE INTO entries (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, json.dumps(value), self._clock() + ttl)
+        )
+
+    def try_lease(self, key):
+        """Take the refresh lease of key unless another live worker holds it"""
+        now = self._clock()
+        cursor = self._conn().execute(
+            'INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at '
+            'WHERE leases.expires_at <= ?',
+            (key, self._owner(), now + self.lease_seconds, now)
+        )
+        return cursor.rowcount == 1
+
+    def release_lease(self, key):
+        self._conn().execute('DELETE FROM leases WHERE key = ? AND owner = ?', (key, self._owner()))
+
+    def take_token(self, key, rate, burst):
+        """Take a token from the bucket key shared by every worker
+
+        Returns 0 on success or the seconds until a token is available. The
+        read and the write happen in one immediate transaction, so processes
+        taking tokens at the same time never spend the same one.
+        """
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = self._clock()
+            row = conn.execute('SELECT tokens, updated_at FROM buckets WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                tokens = float(burst)
+            else:
+                tokens = min(burst, row[0] + max(0.0, now - row[1]) * rate)
+                now = max(now, row[1])
+            delay = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not delay:
+                tokens -= 1
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return delay
+
+    def get_or_load(self, key, loader, ttl):
+        """Return (value, seconds it stays fresh) of key, refreshing it through one worker"""
+        give_up = time.monotonic() + self.lease_seconds
+        while True:
+            entry = self.get(key)
+            now = self._clock()
+            if entry is not None and entry[1] > now:
+                self._count('hits')
+                return entry[0], entry[1] - now
+
+            if self.try_lease(key):
+                try:
+                    # Another worker may have published while we raced for the lease
+                    entry = self.get(key)
+                    now = self._clock()
+                    if entry is not None and entry[1] > now:
+                        self._count('hits')
+                        return entry[0], entry[1] - now
+                    value = loader()
+                    self.put(key, value, ttl)
+                    self._count('loads')
+                    return value, ttl
+                finally:
+                    self.release_lease(key)
+
+            if time.monotonic() >= give_up:
+                raise TimeoutError(f"Timed out waiting for another worker to refresh {key}")
+            self._count('waits')
+            time.sleep(self.poll_interval)
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def stats(self):
+        """Return this process's hit/load/wait counters"""
+        with self._stats_lock:
+            return {'path': self.path, 'hits': self.hits, 'loads': self.loads, 'waits': self.waits}
+
+
+shared_cache = SharedCache() if SHARED_CACHE_PATH else None
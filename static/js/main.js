@@ -2,6 +2,11 @@
 let marketChart = null;
 let currentTimeframe = '1d';
 let priceChart = null;
+let priceStream = null;
+let historySymbol = null;
+
+// Latest streamed quotes, keyed by asset type and symbol
+const streamedQuotes = { stock: {}, crypto: {} };
 
 // Initialize tabs
 function initializeTabs() {
@@ -41,6 +46,143 @@ async function updateWatchlists() {
     await updateCryptoWatchlist();
 }
 
+// Render a list of assets into a watchlist container
+function renderWatchlist(containerId, assets) {
+    const watchlist = document.getElementById(containerId);
+    if (!watchlist) return;
+
+    let html = '';
+    assets.forEach(asset => {
+        const changeColor = asset.change >= 0 ? 'green' : 'red';
+        html += `
+            <div class="watchlist-item" data-symbol="${asset.symbol}">
+                <div class="d-flex justify-content-between">
+                    <strong>${asset.symbol}</strong>
+                    <span>$${asset.price.toFixed(2)}</span>
+                </div>
+                <div class="price-info" style="color: ${changeColor}">
+                    ${(asset.change * 100).toFixed(2)}%
+                </div>
+            </div>
+        `;
+    });
+    watchlist.innerHTML = html;
+}
+
+// Subscribe to streamed price updates, falling back to polling
+function startPriceStream() {
+    if (!window.EventSource) {
+        setInterval(updateWatchlists, 60000); // Update watchlists every minute
+        return;
+    }
+
+    // The browser reconnects on its own and resumes with Last-Event-ID
+    priceStream = new EventSource('/api/stream/prices');
+
+    const applyQuotes = (event, replace) => {
+        const quotes = JSON.parse(event.data);
+        if (replace) {
+            streamedQuotes.stock = {};
+            streamedQuotes.crypto = {};
+        }
+        quotes.forEach(quote => {
+            if (streamedQuotes[quote.type]) {
+                streamedQuotes[quote.type][quote.symbol] = quote;
+            }
+        });
+        renderWatchlist('stocks-watchlist', Object.values(streamedQuotes.stock));
+        renderWatchlist('crypto-watchlist', Object.values(streamedQuotes.crypto));
+    };
+
+    priceStream.addEventListener('snapshot', event => applyQuotes(event, true));
+    priceStream.addEventListener('prices', event => applyQuotes(event, false));
+    priceStream.onerror = error => {
+        console.error('Price stream interrupted, reconnecting:', error);
+    };
+}
+
+// Decode the columnar time-series body served by /api/historical
+// Layout: 'SSC1', uint32 count, int64 first timestamp, float64 prices, int32 deltas
+function decodeColumns(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== 'SSC1') {
+        throw new Error('Unexpected time-series encoding');
+    }
+    const count = view.getUint32(4, true);
+    const prices = new Float64Array(buffer, 16, count);
+    const deltas = new Int32Array(buffer, 16 + 8 * count, Math.max(count - 1, 0));
+    const timestamps = new Array(count);
+    let ts = Number(view.getBigInt64(8, true));
+    for (let i = 0; i < count; i++) {
+        if (i > 0) ts += deltas[i - 1];
+        timestamps[i] = new Date(ts * 1000);
+    }
+    return { timestamps, prices };
+}
+
+// Fetch a symbol's price history in the columnar encoding
+async function fetchHistorical(symbol, timeframe = currentTimeframe, maxPoints = null) {
+    const params = new URLSearchParams({ timeframe, format: 'columns' });
+    if (maxPoints) params.set('max_points', maxPoints);
+    const response = await fetch(`/api/historical/${encodeURIComponent(symbol)}?${params}`);
+    if (!response.ok) {
+        throw new Error(`Failed to fetch history for ${symbol}`);
+    }
+    return decodeColumns(await response.arrayBuffer());
+}
+
+// Chart a symbol's price history, decoded from the columnar encoding
+async function showPriceHistory(symbol, timeframe = currentTimeframe) {
+    const card = document.getElementById('history-card');
+    if (!card) return;
+    historySymbol = symbol;
+    currentTimeframe = timeframe;
+    card.style.display = '';
+    document.getElementById('history-symbol').textContent = symbol;
+    document.querySelectorAll('.timeframe-btn').forEach(btn => {
+        btn.classList.toggle('active', btn.getAttribute('data-timeframe') === timeframe);
+    });
+
+    const chartDiv = document.getElementById('price-chart');
+    try {
+        // No more points than the chart has pixels to draw them on
+        const { timestamps, prices } = await fetchHistorical(symbol, timeframe, chartDiv.clientWidth || null);
+        if (symbol !== historySymbol || timeframe !== currentTimeframe) return;  // superseded
+        const layout = {
+            height: 280,
+            margin: { t: 10, l: 50, r: 10, b: 30 },
+            xaxis: { showgrid: false, zeroline: false },
+            yaxis: { showgrid: true, zeroline: false, tickprefix: '$' },
+            paper_bgcolor: 'rgba(0,0,0,0)',
+            plot_bgcolor: 'rgba(0,0,0,0)',
+            font: { size: 10 }
+        };
+        await Plotly.react('price-chart', [{ x: timestamps, y: prices, type: 'scatter', mode: 'lines', name: symbol }], layout);
+    } catch (error) {
+        console.error(`Error loading history for ${symbol}:`, error);
+        Plotly.purge(chartDiv);
+        chartDiv.innerHTML = '<div class="error">Failed to load price history</div>';
+    }
+}
+
+// Open the history chart from the watchlists and switch its timeframe
+function initializePriceHistory() {
+    ['stocks-watchlist', 'crypto-watchlist'].forEach(id => {
+        const watchlist = document.getElementById(id);
+        if (!watchlist) return;
+        watchlist.addEventListener('click', event => {
+            const item = event.target.closest('.watchlist-item');
+            if (item) showPriceHistory(item.getAttribute('data-symbol'));
+        });
+    });
+    document.querySelectorAll('.timeframe-btn').forEach(button => {
+        button.addEventListener('click', () => {
+            if (historySymbol) showPriceHistory(historySymbol, button.getAttribute('data-timeframe'));
+        });
+    });
+}
+
 // Update stocks watchlist
 async function updateStocksWatchlist() {
     try {
@@ -49,22 +191,7 @@ async function updateStocksWatchlist() {
         
         const watchlist = document.getElementById('stocks-watchlist');
         if (watchlist && stocks && !stocks.error) {
-            let html = '';
-            stocks.forEach(stock => {
-                const changeColor = stock.change >= 0 ? 'green' : 'red';
-                html += `
-                    <div class="watchlist-item">
-                        <div class="d-flex justify-content-between">
-                            <strong>${stock.symbol}</strong>
-                            <span>$${stock.price.toFixed(2)}</span>
-                        </div>
-                        <div class="price-info" style="color: ${changeColor}">
-                            ${(stock.change * 100).toFixed(2)}%
-                        </div>
-                    </div>
-                `;
-            });
-            watchlist.innerHTML = html;
+            renderWatchlist('stocks-watchlist', stocks);
         } else if (stocks.error) {
             watchlist.innerHTML = '<div class="error">Failed to load stocks</div>';
         }
@@ -85,22 +212,7 @@ async function updateCryptoWatchlist() {
         
         const watchlist = document.getElementById('crypto-watchlist');
         if (watchlist && cryptos && !cryptos.error) {
-            let html = '';
-            cryptos.forEach(crypto => {
-                const changeColor = crypto.change >= 0 ? 'green' : 'red';
-                html += `
-                    <div class="watchlist-item">
-                        <div class="d-flex justify-content-between">
-                            <strong>${crypto.symbol}</strong>
-                            <span>$${crypto.price.toFixed(2)}</span>
-                        </div>
-                        <div class="price-info" style="color: ${changeColor}">
-                            ${(crypto.change * 100).toFixed(2)}%
-                        </div>
-                    </div>
-                `;
-            });
-            watchlist.innerHTML = html;
+            renderWatchlist('crypto-watchlist', cryptos);
         } else if (cryptos.error) {
             watchlist.innerHTML = '<div class="error">Failed to load cryptocurrencies</div>';
         }
@@ -113,6 +225,42 @@ async function updateCryptoWatchlist() {
     }
 }
 
+// Render one draw of /api/lottery/latest
+function drawSection(className, title, draw, ballLabel, ballKey) {
+    if (!draw) return '';
+    return `
+        <div class="draw-section ${className}">
+            <h4>${title} (${draw.draw_date})</h4>
+            <div class="numbers">${draw.winning_numbers.join(' ')}</div>
+            <div class="special-ball">${ballLabel}: ${draw[ballKey]}</div>
+        </div>
+    `;
+}
+
+// Render one game's card; a game with no archived draws yet gets a placeholder
+function lotteryCard(title, latest, ballLabel, ballKey) {
+    if (!latest) {
+        return `
+            <div class="lottery-card">
+                <h2>${title}</h2>
+                <div class="error">Results not available yet</div>
+            </div>
+        `;
+    }
+    return `
+        <div class="lottery-card">
+            <h2>${title}</h2>
+            <div class="lottery-info">
+                ${drawSection('old-draw', 'Previous Draw', latest.previous, ballLabel, ballKey)}
+                ${drawSection('latest-draw', 'Latest Draw', latest, ballLabel, ballKey)}
+                <div class="draw-section next-draw">
+                    <h4>Next Draw (${latest.next_draw_date})</h4>
+                </div>
+            </div>
+        </div>
+    `;
+}
+
 // Update lottery data
 async function updateLotteryData() {
     try {
@@ -127,45 +275,8 @@ async function updateLotteryData() {
             } else {
                 lotteryResults.innerHTML = `
                     <div class="lottery-section">
-                        <div class="lottery-card">
-                            <h2>Powerball</h2>
-                            <div class="lottery-info">
-                                <div class="draw-section old-draw">
-                                    <h4>Previous Draw (${data.powerball.old_draw_date})</h4>
-                                    <div class="numbers">${data.powerball.old_numbers}</div>
-                                    <div class="special-ball">Powerball: ${data.powerball.old_powerball}</div>
-                                </div>
-                                <div class="draw-section latest-draw">
-                                    <h4>Latest Draw (${data.powerball.latest_draw_date})</h4>
-                                    <div class="numbers">${data.powerball.latest_numbers}</div>
-                                    <div class="special-ball">Powerball: ${data.powerball.latest_powerball}</div>
-                                </div>
-                                <div class="draw-section next-draw">
-                                    <h4>Next Draw (${data.powerball.next_draw_date})</h4>
-                                    <div class="estimated-jackpot">Estimated Jackpot: ${data.powerball.estimated_jackpot}</div>
-                                </div>
-                            </div>
-                        </div>
-                        
-                        <div class="lottery-card">
-                            <h2>Mega Millions</h2>
-                            <div class="lottery-info">
-                                <div class="draw-section old-draw">
-                                    <h4>Previous Draw (${data.mega_millions.old_draw_date})</h4>
-                                    <div class="numbers">${data.mega_millions.old_numbers}</div>
-                                    <div class="special-ball">Mega Ball: ${data.mega_millions.old_mega_ball}</div>
-                                </div>
-                                <div class="draw-section latest-draw">
-                                    <h4>Latest Draw (${data.mega_millions.latest_draw_date})</h4>
-                                    <div class="numbers">${data.mega_millions.latest_numbers}</div>
-                                    <div class="special-ball">Mega Ball: ${data.mega_millions.latest_mega_ball}</div>
-                                </div>
-                                <div class="draw-section next-draw">
-                                    <h4>Next Draw (${data.mega_millions.next_draw_date})</h4>
-                                    <div class="estimated-jackpot">Estimated Jackpot: ${data.mega_millions.estimated_jackpot}</div>
-                                </div>
-                            </div>
-                        </div>
+                        ${lotteryCard('Powerball', data.powerball, 'Powerball', 'powerball')}
+                        ${lotteryCard('Mega Millions', data.mega_millions, 'Mega Ball', 'mega_ball')}
                     </div>
                 `;
             }
@@ -256,6 +367,7 @@ async function updateGraphs() {
 document.addEventListener('DOMContentLoaded', () => {
     // Initialize tabs
     initializeTabs();
+    initializePriceHistory();
 
     // Initial updates
     updateWatchlists();
@@ -263,7 +375,7 @@ document.addEventListener('DOMContentLoaded', () => {
     updateLotteryData();
 
     // Set up periodic updates
-    setInterval(updateWatchlists, 60000); // Update watchlists every minute
+    startPriceStream();
     setInterval(updateGraphs, 3600000);   // Update graphs every hour
     setInterval(updateLotteryData, 3600000); // Update lottery every hour
 });
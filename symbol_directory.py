@@ -0,0 +1,244 @@
+import os
+import re
+import csv
+import time
+import threading
+import logging
+from bisect import bisect_left
+
+from quote_service import asset_class
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# CSV listing of tradable symbols with symbol,name[,type] columns
+SYMBOL_LISTING_PATH = os.getenv('SYMBOL_LISTING_PATH', os.path.join(os.path.dirname(__file__), 'data', 'symbols.csv'))
+# Seconds between checks of the listing file for changes
+SYMBOL_LISTING_CHECK_INTERVAL = float(os.getenv('SYMBOL_LISTING_CHECK_INTERVAL', '30'))
+SEARCH_DEFAULT_LIMIT = 10
+SEARCH_MAX_LIMIT = 50
+# Shortest name token considered for typo matching
+FUZZY_MIN_LENGTH = 4
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def deletions(word):
+    """Every string one deleted character away from word"""
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def prefix_range(keys, prefix):
+    """Return the [start, end) slice of sorted keys that start with prefix"""
+    start = bisect_left(keys, prefix)
+    return start, bisect_left(keys, prefix + '\uffff', start)
+
+
+class SymbolIndex:
+    """Immutable search index over one set of (symbol, name) entries
+
+    Symbols sit in a sorted array searched by bisection for prefixes. Name
+    tokens (and the parts of dashed symbols) map to entry ids through a
+    sorted token array, so a prefix of a word in the name also hits. Typos
+    are matched through a deletion index: two words within one edit share a
+    single-deletion variant.
+    """
+
+    def __init__(self, entries):
+        # Shorter symbols first so primary listings outrank derivatives
+        entries = sorted({symbol: name for symbol, name in entries}.items(),
+                         key=lambda entry: (len(entry[0]), entry[0]))
+        self.entries = [{'symbol': symbol, 'name': name} for symbol, name in entries]
+        self.symbol_ids = {symbol: i for i, (symbol, _) in enumerate(entries)}
+        self.symbols = sorted(self.symbol_ids)
+
+        postings = {}
+        name_tokens = set()
+        self.entry_tokens = []
+        for i, (symbol, name) in enumerate(entries):
+            words = tokenize(name)
+            name_tokens.update(words)
+            tokens = tuple(dict.fromkeys(words + tokenize(symbol.replace('-', ' '))))
+            self.entry_tokens.append(tokens)
+            for token in tokens:
+                postings.setdefault(token, []).append(i)
+        self.tokens = sorted(postings)
+        self.postings = [postings[token] for token in self.tokens]
+
+        # Symbols get their typo matches from variants of the query instead
+        self.fuzzy = {}
+        for token in name_tokens:
+            if len(token) >= FUZZY_MIN_LENGTH:
+                for variant in deletions(token) | {token}:
+                    self.fuzzy.setdefault(variant, []).append(token)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def search(self, query, limit=SEARCH_DEFAULT_LIMIT):
+        """Return up to limit entries ranked by how query matches them
+
+        Order: exact symbol, symbol prefix, then name word matches (whole
+        words before prefixes). Only when none of those match are symbols
+        and words one typo away returned.
+        """
+        words = tokenize(query)
+        if not words or limit <= 0:
+            return []
+
+        ids = {}  # insertion-ordered set of matched entry ids
+
+        def take(candidates):
+            for i in candidates:
+                ids.setdefault(i)
+                if len(ids) >= limit:
+                    return True
+            return False
+
+        symbol = query.strip().upper()
+        exact = self.symbol_ids.get(symbol)
+        if exact is not None and take([exact]):
+            return self._results(ids)
+
+        start, end = prefix_range(self.symbols, symbol)
+        if take(self.symbol_ids[s] for s in self.symbols[start:min(end, start + limit)]):
+            return self._results(ids)
+
+        if take(self._word_matches(words)):
+            return self._results(ids)
+
+        if not ids:
+            self._take_fuzzy(symbol, words, take)
+        return self._results(ids)
+
+    def _word_matches(self, words):
+        """Entries with a name word starting with every query word, rarest word first"""
+        ranges = [prefix_range(self.tokens, word) for word in words]
+        sizes = [sum(len(self.postings[t]) for t in range(start, end)) for start, end in ranges]
+        if not all(sizes):
+            return
+        lead = min(range(len(words)), key=sizes.__getitem__)
+        others = [word for position, word in enumerate(words) if position != lead]
+
+        start, end = ranges[lead]
+        for t in range(start, end):
+            for i in self.postings[t]:
+                tokens = self.entry_tokens[i]
+                if all(any(token.startswith(word) for token in tokens) for word in others):
+                    yield i
+
+    def _take_fuzzy(self, symbol, words, take):
+        # Symbols that the query reaches with one deletion or swap
+        variants = deletions(symbol) | {symbol[:i] + symbol[i + 1] + symbol[i] + symbol[i + 2:]
+                                        for i in range(len(symbol) - 1)}
+        if take(self.symbol_ids[v] for v in sorted(variants) if v in self.symbol_ids):
+            return
+
+        # Name words within one edit of the last query word
+        word = words[-1]
+        if len(word) < FUZZY_MIN_LENGTH:
+            return
+        tokens = set()
+        for variant in deletions(word) | {word}:
+            tokens.update(self.fuzzy.get(variant, ()))
+        for token in sorted(tokens):
+            start, end = prefix_range(self.tokens, token)
+            if start < end and self.tokens[start] == token and take(self.postings[start]):
+                return
+
+    def _results(self, ids):
+        return [self.entries[i] for i in ids]
+
+
+def load_listing(path):
+    """Read (symbol, name, type) rows from a CSV listing file"""
+    rows = []
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            symbol = (row.get('symbol') or '').strip().upper()
+            if not symbol:
+                continue
+            name = (row.get('name') or '').strip() or symbol
+            rows.append((symbol, name, (row.get('type') or '').strip() or asset_class(symbol)))
+    return rows
+
+
+def build_indexes(rows):
+    """Build one SymbolIndex per asset type"""
+    grouped = {}
+    for symbol, name, asset_type in rows:
+        grouped.setdefault(asset_type, []).append((symbol, name))
+    return {asset_type: SymbolIndex(entries) for asset_type, entries in grouped.items()}
+
+
+class SymbolDirectory:
+    """Serves symbol searches from indexes built off the listing file
+
+    The first search loads the listing synchronously. After that the file's
+    modification time is checked at most every check_interval seconds and a
+    changed file is re-indexed on a background thread while searches keep
+    using the previous indexes.
+    """
+
+    def __init__(self, path=SYMBOL_LISTING_PATH, check_interval=SYMBOL_LISTING_CHECK_INTERVAL):
+        self.path = path
+        self.check_interval = check_interval
+        self._indexes = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._rebuilding = False
+        self._lock = threading.Lock()
+
+    def search(self, query, asset_type, limit=SEARCH_DEFAULT_LIMIT):
+        index = self.indexes().get(asset_type)
+        if index is None:
+            return []
+        return index.search(query, max(1, min(limit, SEARCH_MAX_LIMIT)))
+
+    def indexes(self):
+        """Return the current {asset type: SymbolIndex}, scheduling a rebuild if the file changed"""
+        now = time.monotonic()
+        if self._indexes is not None and now - self._checked_at < self.check_interval:
+            return self._indexes
+
+        with self._lock:
+            if self._indexes is not None and now - self._checked_at < self.check_interval:
+                return self._indexes
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                if self._indexes is None:
+                    logger.error(f"Symbol listing {self.path} not found")
+                    self._indexes = {}
+                return self._indexes
+
+            if mtime != self._mtime:
+                if self._indexes is None:
+                    self._rebuild(mtime)
+                elif not self._rebuilding:
+                    self._rebuilding = True
+                    threading.Thread(target=self._rebuild, args=(mtime,), daemon=True).start()
+            return self._indexes
+
+    def _rebuild(self, mtime):
+        try:
+            started = time.perf_counter()
+            indexes = build_indexes(load_listing(self.path))
+            self._indexes, self._mtime = indexes, mtime
+            count = sum(len(index) for index in indexes.values())
+            logger.info(f"Indexed {count} symbols in {time.perf_counter() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Error indexing symbol listing {self.path}: {str(e)}")
+            if self._indexes is None:
+                self._indexes = {}
+        finally:
+            self._rebuilding = False
+
+
+symbol_directory = SymbolDirectory()
@@ -0,0 +1,48 @@
+import time
+import unittest
+
+from benchmark import summarize, find_regressions, synthetic_fixtures, ReplayTicker, bench_startup
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_summarize_percentiles(self):
+        stats = summarize([i / 1000 for i in range(1, 101)], 2.0)
+        self.assertEqual(stats['count'], 100)
+        self.assertAlmostEqual(stats['p50_ms'], 50.5)
+        self.assertAlmostEqual(stats['p99_ms'], 99.01)
+        self.assertEqual(stats['per_second'], 50)
+
+    def test_replayed_history_ends_now(self):
+        """Test replayed bars are shifted to end at the current interval"""
+        fixtures = synthetic_fixtures(['AAPL'])
+        fixtures['history']['AAPL']['5m']['bars'] = [[bar[0] - 86400 * 30, *bar[1:]]
+                                                      for bar in fixtures['history']['AAPL']['5m']['bars']]
+        frame = ReplayTicker(fixtures, 'AAPL').history(period='1d', interval='5m')
+        self.assertEqual(len(frame), 288)
+        self.assertLess(time.time() - frame.index[-1].timestamp(), 300)
+        self.assertEqual(list(frame.columns), ['Open', 'High', 'Low', 'Close', 'Volume'])
+
+    def test_replayed_history_since_start(self):
+        ticker = ReplayTicker(synthetic_fixtures(['AAPL']), 'AAPL')
+        last = ticker.history(period='1d', interval='5m').index[-1].timestamp()
+        self.assertEqual(len(ticker.history(interval='5m', start=last - 600)), 3)
+
+    def test_unknown_symbol_has_no_price(self):
+        self.assertEqual(ReplayTicker(synthetic_fixtures(['AAPL']), 'NOPE').fast_info.last_price, 0)
+
+    def test_find_regressions(self):
+        """Test only p95 growth beyond the tolerance is reported"""
+        baseline = {'routes': {'/a': {'8': {'p95_ms': 10}}}, 'jobs': {'collect': {'p95_ms': 100}}}
+        results = {'routes': {'/a': {'8': {'p95_ms': 14}}}, 'jobs': {'collect': {'p95_ms': 110}}}
+        self.assertEqual(find_regressions(results, baseline, 0.25), ['/a @8: p95 10ms -> 14ms'])
+        self.assertEqual(find_regressions(results, baseline, 0.5), [])
+
+    def test_worker_starts_without_market_data_libraries(self):
+        """Test importing the app and serving a page loads neither yfinance nor pandas"""
+        result = bench_startup(1)
+        self.assertEqual(result['heavy_modules'], [])
+        self.assertGreater(result['ready_ms'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from chart_renderer import performance_frame, frame_digest, render_charts
+
+
+def price_rows(symbols, points=48, offset=0.0):
+    start = datetime(2024, 12, 6)
+    rows = []
+    for i in range(points):
+        for n, symbol in enumerate(symbols):
+            rows.append({'timestamp': start + timedelta(minutes=30 * i), 'symbol': symbol,
+                         'price': 100.0 + n + i + offset})
+    return rows
+
+
+class TestPerformanceFrame(unittest.TestCase):
+    def test_duplicate_timestamps(self):
+        """Test duplicate ticks keep the last price instead of failing the pivot"""
+        rows = price_rows(['AAPL'], points=2)
+        rows.append(dict(rows[-1], price=150.0))
+        frame = performance_frame(rows)
+        self.assertEqual(len(frame), 2)
+        self.assertAlmostEqual(frame['AAPL'].iloc[-1], 50.0)
+
+    def test_late_symbol_uses_its_first_price(self):
+        """Test a symbol without a tick at the first timestamp starts at 0%"""
+        rows = price_rows(['AAPL'], points=3) + price_rows(['MSFT'], points=3)[1:]
+        frame = performance_frame(rows)
+        self.assertAlmostEqual(frame['MSFT'].dropna().iloc[0], 0.0)
+
+    def test_digest_follows_data(self):
+        """Test the digest changes with prices and titles only"""
+        frame = performance_frame(price_rows(['AAPL', 'MSFT']))
+        same = performance_frame(price_rows(['AAPL', 'MSFT']))
+        moved = performance_frame(price_rows(['AAPL', 'MSFT'], offset=1.0))
+        self.assertEqual(frame_digest(frame, 't'), frame_digest(same, 't'))
+        self.assertNotEqual(frame_digest(frame, 't'), frame_digest(moved, 't'))
+        self.assertNotEqual(frame_digest(frame, 't'), frame_digest(frame, 'u'))
+
+
+class TestRenderCharts(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.state = os.path.join(self.directory, 'state', 'render_state.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def chart(self, name, offset=0.0):
+        return {'path': os.path.join(self.directory, f'{name}.png'), 'title': name,
+                'frame': performance_frame(price_rows(['AAPL', 'MSFT'], offset=offset))}
+
+    def test_unchanged_charts_are_skipped(self):
+        """Test only charts whose data changed are redrawn"""
+        charts = [self.chart('a'), self.chart('b')]
+        results = render_charts(charts, self.state, workers=2)
+        self.assertEqual(set(results.values()), {'rendered'})
+        with open(charts[0]['path'], 'rb') as f:
+            self.assertEqual(f.read(8), b'\x89PNG\r\n\x1a\n')
+        mtime = os.stat(charts[0]['path']).st_mtime_ns
+
+        results = render_charts([self.chart('a'), self.chart('b', offset=1.0)], self.state, workers=2)
+        self.assertEqual(results[charts[0]['path']], 'unchanged')
+        self.assertEqual(results[charts[1]['path']], 'rendered')
+        self.assertEqual(os.stat(charts[0]['path']).st_mtime_ns, mtime)
+        self.assertEqual([name for name in os.listdir(self.directory) if name.endswith('.tmp')], [])
+
+    def test_missing_output_is_redrawn(self):
+        """Test a deleted PNG is rendered again even if its data did not change"""
+        chart = self.chart('a')
+        render_charts([chart], self.state)
+        os.remove(chart['path'])
+        self.assertEqual(render_charts([chart], self.state)[chart['path']], 'rendered')
+
+    def test_empty_series(self):
+        """Test a chart without data leaves no file behind"""
+        chart = {'path': os.path.join(self.directory, 'empty.png'), 'title': 'empty', 'frame': performance_frame([])}
+        self.assertEqual(render_charts([chart], self.state)[chart['path']], 'empty')
+        self.assertFalse(os.path.exists(chart['path']))
+
+if __name__ == '__main__':
+    unittest.main()
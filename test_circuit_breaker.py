@@ -0,0 +1,48 @@
+import time
+import unittest
+
+from circuit_breaker import CLOSED, OPEN, HALF_OPEN, CircuitBreaker, CircuitOpenError
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def test_opens_after_consecutive_failures(self):
+        """Test the breaker opens at the threshold and a success resets the count"""
+        breaker = CircuitBreaker('test', failure_threshold=3, reset_timeout=60)
+        breaker.record_failure()
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CLOSED)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.stats()['rejected'], 1)
+
+    def test_half_open_admits_one_probe(self):
+        """Test only one caller probes after the reset timeout and its outcome decides the state"""
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+        breaker.record_failure()
+        self.assertEqual(breaker.state, OPEN)
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, CLOSED)
+
+    def test_call(self):
+        """Test call() records outcomes and refuses while open"""
+        breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=60)
+        self.assertEqual(breaker.call(lambda: 1), 1)
+        with self.assertRaises(ZeroDivisionError):
+            breaker.call(lambda: 1 / 0)
+        with self.assertRaises(CircuitOpenError):
+            breaker.call(lambda: 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+
+from downsample import lttb_indices, downsample_trace
+
+
+class TestLTTB(unittest.TestCase):
+    def setUp(self):
+        self.x = np.arange(1000, dtype='f8')
+        self.y = np.sin(self.x / 50.0)
+
+    def test_short_series_unchanged(self):
+        """Test series already within max_points are returned whole"""
+        self.assertEqual(lttb_indices(self.x[:10], self.y[:10], 20).tolist(), list(range(10)))
+        self.assertEqual(lttb_indices(self.x, self.y, None).tolist(), list(range(1000)))
+
+    def test_point_count_and_edges(self):
+        """Test exactly max_points sorted, unique indices including both ends"""
+        for max_points in (3, 10, 99, 500, 999):
+            keep = lttb_indices(self.x, self.y, max_points)
+            self.assertEqual(len(keep), max_points)
+            self.assertEqual(keep[0], 0)
+            self.assertEqual(keep[-1], 999)
+            self.assertTrue(np.all(np.diff(keep) > 0))
+
+    def test_keeps_spikes(self):
+        """Test a single outlier survives heavy downsampling"""
+        y = np.zeros(1000)
+        y[637] = 25.0
+        self.assertIn(637, lttb_indices(self.x, y, 20).tolist())
+
+    def test_trace_with_labels(self):
+        """Test non-numeric x values are downsampled by position"""
+        x = [f"{i // 60:02d}:{i % 60:02d}" for i in range(300)]
+        y = list(np.cos(np.arange(300) / 20.0))
+        new_x, new_y = downsample_trace(x, y, 50)
+        self.assertEqual(len(new_x), 50)
+        self.assertEqual((new_x[0], new_x[-1]), (x[0], x[-1]))
+        self.assertEqual([y[x.index(label)] for label in new_x], new_y)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import time
+import unittest
+
+from fanout import Deadline, gather
+
+
+class TestGather(unittest.TestCase):
+    def test_runs_concurrently(self):
+        """Test calls overlap instead of adding up"""
+        started = time.monotonic()
+        results, errors = gather({name: lambda name=name: time.sleep(0.2) or name for name in 'abcd'}, Deadline(2))
+        self.assertLess(time.monotonic() - started, 0.6)
+        self.assertEqual(results, {name: name for name in 'abcd'})
+        self.assertEqual(errors, {})
+
+    def test_partial_results_at_deadline(self):
+        """Test slow calls are reported without holding back the fast ones"""
+        started = time.monotonic()
+        results, errors = gather({
+            'fast': lambda: 1,
+            'slow': lambda: time.sleep(1) or 2,
+            'broken': lambda: 1 / 0
+        }, Deadline(0.2))
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual(results, {'fast': 1})
+        self.assertEqual(errors['slow'], 'request deadline exceeded')
+        self.assertIn('division', errors['broken'])
+
+    def test_nested_deadline_finishes_first(self):
+        """Test a nested call returns its partial results before the gather gives up"""
+        deadline = Deadline(0.3)
+
+        def nested():
+            results, errors = gather({'fast': lambda: 1, 'slow': lambda: time.sleep(1)}, deadline.nested())
+            return results
+
+        results, errors = gather({'nested': nested}, deadline)
+        self.assertEqual(results, {'nested': {'fast': 1}})
+
+    def test_deadline(self):
+        """Test the remaining budget counts down to zero"""
+        deadline = Deadline(0.05)
+        self.assertFalse(deadline.expired)
+        self.assertLessEqual(deadline.remaining(), 0.05)
+        time.sleep(0.06)
+        self.assertTrue(deadline.expired)
+        self.assertEqual(deadline.remaining(), 0.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from graph_snapshots import SnapshotReader, publish_snapshot
+
+
+class TestDashboardSnapshots(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'snapshots', 'dashboard_graphs.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_missing_snapshot(self):
+        """Test the reader reports no snapshot before one is published"""
+        self.assertIsNone(SnapshotReader(self.path, check_interval=0).current())
+
+    def test_publish_and_read(self):
+        """Test a published payload is served with its version"""
+        version = publish_snapshot({'stocks': {'data': [1]}}, self.path)
+        body, etag = SnapshotReader(self.path, check_interval=0).current()
+        self.assertEqual(etag, version)
+        self.assertEqual(json.loads(body), {'stocks': {'data': [1]}})
+
+    def test_version_follows_content(self):
+        """Test identical payloads keep their version and new ones change it"""
+        first = publish_snapshot({'a': 1}, self.path)
+        self.assertEqual(publish_snapshot({'a': 1}, self.path), first)
+        self.assertNotEqual(publish_snapshot({'a': 2}, self.path), first)
+
+    def test_reader_picks_up_new_version(self):
+        """Test the in-memory copy is replaced when the file changes"""
+        reader = SnapshotReader(self.path, check_interval=0)
+        publish_snapshot({'a': 1}, self.path)
+        first = reader.current()[1]
+        first_mtime = os.stat(self.path).st_mtime_ns
+        version = publish_snapshot({'a': 2}, self.path)
+        os.utime(self.path, ns=(first_mtime, first_mtime + 1))  # make sure the mtime differs on coarse filesystems
+        self.assertNotEqual(first, version)
+        self.assertEqual(reader.current()[1], version)
+
+    def test_expired_snapshot_counts_as_missing(self):
+        """Test a snapshot nobody has republished within max_age is not served as current"""
+        reader = SnapshotReader(self.path, check_interval=0, max_age=600)
+        version = publish_snapshot({'a': 1}, self.path)
+        self.assertEqual(reader.current()[1], version)
+        published = time.time() - 601
+        os.utime(self.path, (published, published))
+        self.assertIsNone(reader.current())
+        self.assertEqual(reader.current(fresh=False)[1], version)
+
+    def test_rebuild_is_single_flight(self):
+        """Test concurrent requests finding no snapshot build it once between them"""
+        reader = SnapshotReader(self.path, check_interval=60)
+        builds = []
+
+        def build():
+            builds.append(1)
+            time.sleep(0.1)
+            return {'stocks': {'data': [1]}, 'crypto': {'data': []}}
+
+        threads = [threading.Thread(target=reader.rebuild_if_stale, args=(build,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(builds), 1)
+        self.assertIsNotNone(reader.current())
+        self.assertFalse(reader.rebuild_if_stale(build))
+
+    def test_rebuild_without_data_publishes_nothing(self):
+        reader = SnapshotReader(self.path, check_interval=0)
+        self.assertFalse(reader.rebuild_if_stale(lambda: {'stocks': {'data': []}, 'crypto': {'data': []}}))
+        self.assertIsNone(reader.current(fresh=False))
+
+if __name__ == '__main__':
+    unittest.main()
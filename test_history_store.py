@@ -0,0 +1,172 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+
+import app as web
+from circuit_breaker import CircuitBreaker, CircuitOpenError, OPEN
+from fanout import Deadline
+from history_store import HistoryStore, format_timestamps
+
+
+class FakeUpstream:
+    """Serves 5m bars up to `now` and records every request"""
+
+    def __init__(self, now):
+        self.now = now
+        self.calls = []
+
+    def __call__(self, symbol, interval, period=None, start=None):
+        self.calls.append({'period': period, 'start': start})
+        step = 300
+        first = self.now - 86400 if start is None else start
+        first = first - first % step + (step if first % step else 0)
+        ts = np.arange(first, self.now, step)
+        index = pd.to_datetime(ts, unit='s', utc=True).tz_convert('America/New_York')
+        close = ts / 1000.0
+        return pd.DataFrame({'Open': close, 'High': close, 'Low': close, 'Close': close, 'Volume': 1.0}, index=index)
+
+
+class TestHistoryStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.upstream = FakeUpstream(int(time.time()))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_repeated_loads_stay_local(self):
+        """Test loads inside the refresh window do not touch upstream"""
+        store = HistoryStore(self.directory, self.upstream, refresh_seconds=60)
+        first, tz = store.get('AAPL', '5m', '1d')
+        second, _ = store.get('AAPL', '5m', '1d')
+        self.assertEqual(len(self.upstream.calls), 1)
+        self.assertEqual(tz, 'America/New_York')
+        np.testing.assert_array_equal(first, second)
+
+    def test_refresh_fetches_only_new_bars(self):
+        """Test a refresh asks upstream only for bars after the last stored one"""
+        store = HistoryStore(self.directory, self.upstream, refresh_seconds=0)
+        bars, _ = store.get('AAPL', '5m', '1d')
+        self.upstream.now += 900
+        bars, _ = store.get('AAPL', '5m', '1d')
+
+        last_call = self.upstream.calls[-1]
+        self.assertIsNone(last_call['period'])
+        self.assertGreater(last_call['start'], self.upstream.now - 86400)
+        self.assertTrue(np.all(np.diff(bars['ts']) == 300), "Bars should be contiguous without duplicates")
+
+    def test_forming_bar_is_not_persisted(self):
+        """Test only closed bars are written to disk"""
+        store = HistoryStore(self.directory, self.upstream, refresh_seconds=60)
+        bars, _ = store.get('AAPL', '5m', '1d')
+
+        reloaded = HistoryStore(self.directory, self.upstream, refresh_seconds=60)
+        stored = reloaded._load('AAPL', '5m').bars
+        self.assertTrue(np.all(stored['ts'] + 300 <= time.time()))
+        self.assertLessEqual(len(stored), len(bars))
+
+    def test_reload_from_disk(self):
+        """Test a new process serves stored bars without a full backfill"""
+        HistoryStore(self.directory, self.upstream, refresh_seconds=60).get('AAPL', '5m', '1d')
+        calls = len(self.upstream.calls)
+
+        store = HistoryStore(self.directory, self.upstream, refresh_seconds=60)
+        bars, _ = store.get('AAPL', '5m', '1d')
+        self.assertEqual(len(self.upstream.calls), calls + 1)
+        self.assertIsNotNone(self.upstream.calls[-1]['start'], "Should only fetch the missing tail")
+        self.assertGreater(len(bars), 200)
+
+    def test_longer_period_triggers_backfill(self):
+        """Test asking for more history than is stored fetches the full period"""
+        store = HistoryStore(self.directory, self.upstream, refresh_seconds=60)
+        store.get('AAPL', '5m', '1d')
+        store.get('AAPL', '5m', '5d')
+        self.assertEqual(self.upstream.calls[-1]['period'], '5d')
+
+    def test_format_timestamps(self):
+        """Test timestamps are rendered in the exchange timezone"""
+        self.assertEqual(format_timestamps(np.array([0]), 'America/New_York'), ['1969-12-31 19:00:00'])
+
+    def test_upstream_failure_serves_stored_bars(self):
+        """Test a failing or circuit-broken upstream keeps serving the stored series"""
+        breaker = CircuitBreaker('test-history', failure_threshold=1, reset_timeout=60)
+        store = HistoryStore(self.directory, self.upstream, refresh_seconds=0, breaker=breaker)
+        stored, _ = store.get('AAPL', '5m', '1d')
+
+        def failing(*args, **kwargs):
+            raise RuntimeError('rate limited')
+
+        store._fetch = failing
+        bars, _ = store.get('AAPL', '5m', '1d')
+        np.testing.assert_array_equal(bars, stored)
+        self.assertEqual(breaker.state, OPEN)
+
+        # While open, unknown series fail fast and known ones are served
+        with self.assertRaises(CircuitOpenError):
+            store.get('MSFT', '5m', '1d')
+        bars, _ = store.get('AAPL', '5m', '1d')
+        self.assertEqual(len(bars), len(stored))
+
+    def test_invalid_symbols_are_rejected(self):
+        """Test symbols outside the ticker pattern never reach upstream or disk"""
+        store = HistoryStore(self.directory, self.upstream)
+        for symbol in ('../etc', 'A' * 16, 'AAPL/X', ''):
+            with self.assertRaises(ValueError):
+                store.get(symbol, '5m', '1d')
+        self.assertEqual(self.upstream.calls, [])
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_symbols_are_case_insensitive(self):
+        """Test a lower case symbol is served the same series as its ticker"""
+        store = HistoryStore(self.directory, self.upstream, refresh_seconds=60)
+        bars, _ = store.get('AAPL', '5m', '1d')
+        lower, _ = store.get(' aapl ', '5m', '1d')
+        np.testing.assert_array_equal(lower, bars)
+        self.assertEqual(len(self.upstream.calls), 1)
+
+    def test_series_in_memory_are_bounded(self):
+        """Test the least recently used series is dropped once the bound is reached"""
+        store = HistoryStore(self.directory, self.upstream, refresh_seconds=60, max_series=2)
+        store.get('AAPL', '5m', '1d')
+        store.get('MSFT', '5m', '1d')
+        store.get('AAPL', '5m', '1d')
+        store.get('NVDA', '5m', '1d')
+        self.assertEqual(list(store._series), [('AAPL', '5m'), ('NVDA', '5m')])
+        # A dropped series is read back from its file and only topped up
+        store.get('MSFT', '5m', '1d')
+        self.assertIsNotNone(self.upstream.calls[-1]['start'])
+
+    def test_unknown_symbol_writes_no_files(self):
+        store = HistoryStore(self.directory, lambda *args, **kwargs: pd.DataFrame(), refresh_seconds=60)
+        bars, _ = store.get('NOSUCH', '5m', '1d')
+        self.assertEqual(len(bars), 0)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_endpoint_answers_by_the_deadline(self):
+        """Test a backfill slower than the request deadline gets a 504 instead of holding the request"""
+        def slow_upstream(*args, **kwargs):
+            time.sleep(0.5)
+            return self.upstream(*args, **kwargs)
+        store = HistoryStore(self.directory, slow_upstream)
+        client = web.app.test_client()
+        with patch.object(web, 'history_store', store), patch.object(web, 'Deadline', lambda: Deadline(0.1)):
+            started = time.monotonic()
+            response = client.get('/api/historical/AAPL')
+            self.assertLess(time.monotonic() - started, 0.4)
+            self.assertEqual(response.status_code, 504)
+            self.assertEqual(response.headers['X-Partial'], 'AAPL')
+            # The backfill carries on in the background and serves the next request
+            time.sleep(0.6)
+            upper = client.get('/api/historical/AAPL')
+            lower = client.get('/api/historical/aapl')
+            self.assertEqual(lower.status_code, 200)
+            self.assertEqual(lower.get_json(), upper.get_json())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from job_executor import JobExecutor, Job, MISFIRE_CATCH_UP, MISFIRE_SKIP, read_job_stats
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestJobExecutor(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clock = FakeClock()
+        self.executor = JobExecutor(max_workers=4, stats_path=os.path.join(self.directory, 'jobs.json'),
+                                    clock=self.clock)
+
+    def tearDown(self):
+        self.executor.stop()
+        shutil.rmtree(self.directory)
+
+    def settle(self):
+        """Wait for every started run to finish and publish its stats"""
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            stats = self.executor.stats()
+            published = (read_job_stats(self.executor.stats_path) or {}).get('jobs', {})
+            if not any(job['running'] for job in stats.values()) and all(
+                    published.get(name, {}).get('runs', 0) == job['runs'] for name, job in stats.items()):
+                return
+            time.sleep(0.01)
+
+    def test_slots_align_to_the_clock(self):
+        """Test runs land on multiples of the interval plus the offset"""
+        job = Job('j', lambda: None, 60, offset=5)
+        job.schedule_after(1000.0)
+        self.assertEqual(job.next_run, 1025.0)
+        job.schedule_after(1025.0)
+        self.assertEqual(job.next_run, 1085.0)
+
+    def test_jobs_run_concurrently(self):
+        """Test a slow job does not hold back the others"""
+        release = threading.Event()
+        ran = []
+        self.executor.add_job('slow', lambda: release.wait(5), 10, run_immediately=True)
+        self.executor.add_job('fast', lambda: ran.append(1), 10, run_immediately=True)
+        self.executor.run_pending()
+        deadline = time.monotonic() + 2
+        while not ran and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(ran, [1])
+        self.assertTrue(self.executor.stats()['slow']['running'])
+        release.set()
+
+    def test_no_overlap_then_coalesce(self):
+        """Test a due job waits for its running instance and then runs once for all missed slots"""
+        release = threading.Event()
+        runs = []
+        self.executor.add_job('j', lambda: runs.append(1) or release.wait(5), 10, run_immediately=True)
+        self.executor.run_pending()
+        for _ in range(3):
+            self.clock.now += 10
+            self.executor.run_pending()
+        self.assertEqual(len(runs), 1)
+
+        release.set()
+        self.settle()
+        self.executor.run_pending()
+        self.settle()
+        stats = self.executor.stats()['j']
+        self.assertEqual(stats['runs'], 2)
+        self.assertEqual(stats['missed'], 2)
+
+    def test_catch_up_runs_every_slot(self):
+        """Test catch_up runs once per missed slot"""
+        runs = []
+        self.executor.add_job('j', lambda: runs.append(1), 10, misfire=MISFIRE_CATCH_UP)
+        self.clock.now += 45
+        for _ in range(6):
+            self.executor.run_pending()
+            self.settle()
+        self.assertEqual(len(runs), 4)
+
+    def test_skip_drops_late_runs(self):
+        """Test skip only runs within the grace period of the slot"""
+        runs = []
+        self.executor.add_job('j', lambda: runs.append(1), 10, misfire=MISFIRE_SKIP, grace=2)
+        self.clock.now += 25
+        self.executor.run_pending()
+        self.settle()
+        self.assertEqual(runs, [])
+        self.assertEqual(self.executor.stats()['j']['missed'], 2)
+        self.clock.now += 5
+        self.executor.run_pending()
+        self.settle()
+        self.assertEqual(runs, [1])
+
+    def test_timeout_and_failure_stats(self):
+        """Test timeouts, failures and durations are recorded and published"""
+        release = threading.Event()
+        self.executor.add_job('stuck', lambda: release.wait(5), 10, timeout=3, run_immediately=True)
+        self.executor.add_job('broken', lambda: 1 / 0, 10, run_immediately=True)
+        self.executor.run_pending()
+        self.clock.now += 4
+        self.executor.run_pending()
+        release.set()
+        self.settle()
+
+        stats = read_job_stats(self.executor.stats_path)['jobs']
+        self.assertEqual(stats['stuck']['timeouts'], 1)
+        self.assertEqual(stats['broken']['failures'], 1)
+        self.assertIn('division', stats['broken']['last_error'])
+        self.assertIsNotNone(stats['stuck']['avg_seconds'])
+
+    def test_hung_job_is_not_started_again(self):
+        """Test no new run starts while the previous one is past its timeout, even with catch_up"""
+        release = threading.Event()
+        runs = []
+        self.executor.add_job('stuck', lambda: runs.append(1) or release.wait(5), 10, timeout=3,
+                              misfire=MISFIRE_CATCH_UP, run_immediately=True)
+        self.executor.run_pending()
+        for _ in range(3):
+            self.clock.now += 10
+            self.executor.run_pending()
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(self.executor.stats()['stuck']['overlaps'], 3)
+
+        # Once the hung run returns the job is back on its schedule
+        release.set()
+        self.settle()
+        self.clock.now += 10
+        self.executor.run_pending()
+        self.settle()
+        self.assertEqual(len(runs), 2)
+
+    def test_pool_has_a_thread_per_job(self):
+        """Test by default every job gets a thread, so hung jobs cannot starve the rest"""
+        executor = JobExecutor(max_workers=0, stats_path=os.path.join(self.directory, 'auto.json'), clock=self.clock)
+        release = threading.Event()
+        started = threading.Semaphore(0)
+        for i in range(6):
+            executor.add_job(f'j{i}', lambda: started.release() or release.wait(5), 10, run_immediately=True)
+        executor.run_pending()
+        try:
+            for _ in range(6):
+                self.assertTrue(started.acquire(timeout=2))
+        finally:
+            release.set()
+            executor.stop()
+
+if __name__ == '__main__':
+    unittest.main()
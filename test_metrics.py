@@ -0,0 +1,159 @@
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from urllib.request import urlopen
+
+from metrics import (
+    Registry, Counter, Histogram, MongoCommandMetrics, MONGO_LATENCY, MONGO_ERRORS, UPSTREAM_ERRORS, UPSTREAM_LATENCY,
+    timed, start_http_server, upstream_call
+)
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+
+    def test_counter_renders_per_label_set(self):
+        """Test each label combination is its own series"""
+        counter = Counter('requests_total', 'Requests', ('route', 'status'), registry=self.registry)
+        counter.labels('/a', '200').inc()
+        counter.labels('/a', '200').inc(2)
+        counter.labels('/a', '500').inc()
+        text = self.registry.render()
+        self.assertIn('# TYPE requests_total counter', text)
+        self.assertIn('requests_total{route="/a",status="200"} 3', text)
+        self.assertIn('requests_total{route="/a",status="500"} 1', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test buckets count every observation up to their bound"""
+        histogram = Histogram('latency_seconds', 'Latency', ('route',), buckets=(0.1, 1), registry=self.registry)
+        for value in (0.05, 0.1, 0.5, 3):
+            histogram.labels('/a').observe(value)
+        text = self.registry.render()
+        self.assertIn('latency_seconds_bucket{route="/a",le="0.1"} 2', text)
+        self.assertIn('latency_seconds_bucket{route="/a",le="1"} 3', text)
+        self.assertIn('latency_seconds_bucket{route="/a",le="+Inf"} 4', text)
+        self.assertIn('latency_seconds_count{route="/a"} 4', text)
+        self.assertIn('latency_seconds_sum{route="/a"} 3.65', text)
+
+    def test_timed_counts_errors(self):
+        """Test a block that raises is both timed and counted as an error"""
+        histogram = Histogram('call_seconds', 'Calls', ('symbol',), registry=self.registry)
+        errors = Counter('call_errors_total', 'Errors', ('symbol',), registry=self.registry)
+        with self.assertRaises(ValueError):
+            with timed(histogram, errors, 'AAPL'):
+                raise ValueError("no price")
+        text = self.registry.render()
+        self.assertIn('call_seconds_count{symbol="AAPL"} 1', text)
+        self.assertIn('call_errors_total{symbol="AAPL"} 1', text)
+
+    def test_label_values_are_escaped(self):
+        """Test quotes and backslashes in label values keep the output parseable"""
+        counter = Counter('odd_total', 'Odd', ('value',), registry=self.registry)
+        counter.labels('a"b\\c').inc()
+        self.assertIn('odd_total{value="a\\"b\\\\c"} 1', self.registry.render())
+
+    def test_wrong_label_count_is_rejected(self):
+        counter = Counter('x_total', 'X', ('a', 'b'), registry=self.registry)
+        with self.assertRaises(ValueError):
+            counter.labels('only-one')
+
+    def test_failing_collector_does_not_break_scrape(self):
+        """Test an erroring collector is skipped and the rest still render"""
+        Counter('ok_total', 'Ok', registry=self.registry).labels().inc()
+
+        def broken():
+            raise RuntimeError("stats unavailable")
+        self.registry.add_collector(broken)
+        self.registry.add_collector(lambda: [('up', 'gauge', 'Up', [('up', [], 1)])])
+        text = self.registry.render()
+        self.assertIn('ok_total 1', text)
+        self.assertIn('up 1', text)
+
+    def test_mongo_listener_labels_by_collection(self):
+        """Test command events are recorded under their client, command and collection"""
+        listener = MongoCommandMetrics('test')
+        started = SimpleNamespace(command_name='find', command={'find': 'prices'}, connection_id=('h', 1), request_id=7)
+        listener.started(started)
+        listener.failed(SimpleNamespace(command_name='find', connection_id=('h', 1), request_id=7, duration_micros=2500))
+        labels = ('test', 'find', 'prices')
+        self.assertEqual(MONGO_ERRORS.labels(*labels).samples('x', [])[0][2], 1)
+        self.assertEqual(MONGO_LATENCY.labels(*labels).samples('x', [])[-1][2], 1)
+
+    def test_upstream_symbols_outside_the_watchlists_share_a_label(self):
+        """Test arbitrary looked up symbols cannot grow the upstream series"""
+        for symbol in ('AAPL', 'ZZZZ1', 'ZZZZ2', '^GSPC'):
+            with self.assertRaises(RuntimeError):
+                with upstream_call('label-test', symbol):
+                    raise RuntimeError("unavailable")
+        symbols = [values[2] for values in UPSTREAM_LATENCY._children if values[1] == 'label-test']
+        self.assertEqual(sorted(symbols), ['AAPL', '^GSPC', 'other'])
+        self.assertEqual(UPSTREAM_ERRORS.labels('yfinance', 'label-test', 'other').samples('x', [])[0][2], 2)
+
+    def test_http_server_serves_metrics(self):
+        """Test the standalone server exposes the registry at /metrics"""
+        Counter('served_total', 'Served', registry=self.registry).labels().inc()
+        server = start_http_server(0, host='127.0.0.1', registry=self.registry)
+        try:
+            with urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+                self.assertIn('text/plain', response.headers['Content-Type'])
+                self.assertIn('served_total 1', response.read().decode())
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class TestSharedRegistry(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.registry = Registry()
+        self.requests = Counter('requests_total', 'Requests', ('route',), registry=self.registry)
+        self.registry.add_collector(lambda: [('workers_busy', 'gauge', 'Busy', [('workers_busy', [], 1)])])
+        self.registry.share(self.directory, flush_interval=3600)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def fork(self, work):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                work()
+                self.registry.flush()
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        return pid
+
+    def test_counters_are_summed_across_processes(self):
+        """Test a scrape of one process counts what a forked worker did"""
+        self.requests.labels('/a').inc(2)
+        self.fork(lambda: self.requests.labels('/a').inc(3))
+        self.assertIn('requests_total{route="/a"} 5', self.registry.render())
+
+    def test_forked_worker_starts_from_zero(self):
+        """Test a worker does not report the counts it inherited a second time"""
+        self.requests.labels('/a').inc(2)
+        self.fork(lambda: None)
+        self.assertIn('requests_total{route="/a"} 2', self.registry.render())
+
+    def test_gauges_are_per_live_process(self):
+        """Test gauges carry a pid label and exited workers drop out"""
+        child = self.fork(lambda: None)
+        text = self.registry.render()
+        self.assertIn(f'workers_busy{{pid="{os.getpid()}"}} 1', text)
+        self.assertNotIn(f'pid="{child}"', text)
+
+    def test_files_of_exited_servers_are_removed(self):
+        """Test a new server does not sum in the counts of a previous one"""
+        stale = os.path.join(self.directory, '999999999-999999999.json')
+        with open(stale, 'w') as f:
+            f.write('{}')
+        Registry().share(self.directory, flush_interval=3600)
+        self.assertFalse(os.path.exists(stale))
+
+
+if __name__ == '__main__':
+    unittest.main()
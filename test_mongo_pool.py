@@ -0,0 +1,104 @@
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import pymongo
+
+import mongo_pool
+import mongo_standin
+from metrics import MongoPoolMetrics, MONGO_POOL_WAIT
+
+
+def pool_event(address=('db', 27017), **fields):
+    return SimpleNamespace(address=address, **fields)
+
+
+class TestClientOptions(unittest.TestCase):
+    def test_srv_uri_uses_certifi(self):
+        """Test Atlas URIs get the CA bundle and local ones run without TLS"""
+        self.assertIn('tlsCAFile', mongo_pool.client_options('mongodb+srv://cluster.example.net/stockstream'))
+        self.assertIn('tlsCAFile', mongo_pool.client_options('mongodb://db:27017/?tls=true'))
+        self.assertNotIn('tlsCAFile', mongo_pool.client_options('mongodb://localhost:27017'))
+
+    def test_pool_and_concern_settings(self):
+        with patch.object(mongo_pool, 'MONGO_MAX_POOL_SIZE', 7), \
+                patch.object(mongo_pool, 'MONGO_WAIT_QUEUE_TIMEOUT', 0.5), \
+                patch.object(mongo_pool, 'MONGO_WRITE_CONCERN', '1'):
+            options = mongo_pool.client_options('mongodb://localhost')
+        self.assertEqual(options['maxPoolSize'], 7)
+        self.assertEqual(options['waitQueueTimeoutMS'], 500)
+        self.assertEqual(options['w'], 1)
+        self.assertEqual(mongo_pool.client_options('mongodb://localhost')['w'], mongo_pool.MONGO_WRITE_CONCERN)
+
+
+class TestSharedClient(unittest.TestCase):
+    def setUp(self):
+        patches = [
+            patch.object(pymongo, 'MongoClient', mongo_standin.MemoryClient),
+            patch.object(mongo_pool, 'MONGODB_URI', 'memory://test-pool'),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        mongo_pool.close_client()
+        self.addCleanup(mongo_pool.close_client)
+        self.addCleanup(mongo_standin.reset, 'memory://test-pool')
+
+    def test_one_client_per_process(self):
+        """Test every caller shares the same client and database"""
+        self.assertIs(mongo_pool.get_client(), mongo_pool.get_client())
+        mongo_pool.get_collection().insert_one({'price': 1.0})
+        self.assertEqual(mongo_pool.get_db()[mongo_pool.PRICES_COLLECTION].count_documents({}), 1)
+
+    def test_new_client_after_fork(self):
+        """Test a forked process does not reuse its parent's pool"""
+        parent = mongo_pool.get_client()
+        with patch('mongo_pool.os.getpid', return_value=-1):
+            self.assertIsNot(mongo_pool.get_client(), parent)
+
+    def test_missing_uri_is_rejected(self):
+        with patch.object(mongo_pool, 'MONGODB_URI', ''):
+            with self.assertRaises(ValueError):
+                mongo_pool.get_client()
+
+
+class TestPoolMetrics(unittest.TestCase):
+    def setUp(self):
+        self.listener = MongoPoolMetrics()
+
+    def test_tracks_connections_and_waits(self):
+        """Test checkouts count as in use until checked in, with their wait recorded"""
+        address = ('pool-test', 27017)
+        waits = MONGO_POOL_WAIT.labels('pool-test:27017')
+        before = waits.samples('x', [])[-1][2]
+        self.listener.pool_created(pool_event(address))
+        self.listener.connection_created(pool_event(address, connection_id=1))
+        self.listener.connection_check_out_started(pool_event(address))
+        self.listener.connection_checked_out(pool_event(address, connection_id=1))
+
+        stats = self.listener.stats()['pool-test:27017']
+        self.assertEqual((stats['open'], stats['in_use'], stats['checkouts']), (1, 1, 1))
+        self.assertGreaterEqual(stats['max_wait_seconds'], 0)
+        self.assertEqual(waits.samples('x', [])[-1][2], before + 1)
+
+        self.listener.connection_checked_in(pool_event(address, connection_id=1))
+        self.listener.connection_closed(pool_event(address, connection_id=1, reason='idle'))
+        stats = self.listener.stats()['pool-test:27017']
+        self.assertEqual((stats['open'], stats['in_use']), (0, 0))
+
+    def test_counts_failed_checkouts(self):
+        """Test a checkout that times out in the wait queue is counted as a failure"""
+        self.listener.connection_check_out_started(pool_event())
+        self.listener.connection_check_out_failed(pool_event(reason='timeout'))
+        stats = self.listener.stats()['db:27017']
+        self.assertEqual((stats['failures'], stats['checkouts'], stats['in_use']), (1, 0, 0))
+
+    def test_real_client_accepts_listener(self):
+        """Test pymongo accepts the listener and the configured pool options"""
+        client = pymongo.MongoClient('mongodb://localhost:1', connect=False,
+                                     event_listeners=[self.listener], **mongo_pool.client_options('mongodb://localhost:1'))
+        client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
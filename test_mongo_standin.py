@@ -0,0 +1,53 @@
+import unittest
+from datetime import datetime, timedelta
+
+from mongo_standin import MemoryClient, reset, matches, project
+from price_repository import latest_prices, symbol_series, last_price, PRICE_PROJECTION
+
+
+class TestMongoStandin(unittest.TestCase):
+    def setUp(self):
+        reset('memory://test')
+        self.db = MemoryClient('memory://test').stockstream
+        self.base = datetime(2024, 1, 1)
+        self.db.stock_crypto_prices.insert_many([
+            {'timestamp': self.base + timedelta(minutes=i), 'meta': {'symbol': symbol, 'type': kind},
+             'price': 100.0 + i, 'volume': 10}
+            for i in range(5) for symbol, kind in (('AAPL', 'stock'), ('BTC-USD', 'crypto'))
+        ])
+
+    def tearDown(self):
+        reset('memory://test')
+
+    def test_filters_on_dotted_fields_and_ranges(self):
+        doc = {'meta': {'type': 'stock'}, 'timestamp': 5}
+        self.assertTrue(matches(doc, {'meta.type': 'stock', 'timestamp': {'$gte': 5, '$lt': 6}}))
+        self.assertFalse(matches(doc, {'timestamp': {'$gt': 5}}))
+        self.assertFalse(matches(doc, {'meta.type': 'crypto'}))
+
+    def test_projection_aliases(self):
+        """Test '$path' projections flatten meta fields the way the server does"""
+        doc = {'_id': 1, 'meta': {'symbol': 'AAPL', 'type': 'stock'}, 'price': 1.0, 'timestamp': 2}
+        self.assertEqual(project(doc, PRICE_PROJECTION),
+                         {'symbol': 'AAPL', 'type': 'stock', 'price': 1.0, 'timestamp': 2})
+
+    def test_repository_queries(self):
+        """Test the price repository queries return what they would on MongoDB"""
+        collection = self.db.stock_crypto_prices
+        latest = latest_prices(collection, 'stock', self.base, limit=2)
+        self.assertEqual([row['price'] for row in latest], [104.0, 103.0])
+        self.assertTrue(all(row['symbol'] == 'AAPL' and '_id' not in row for row in latest))
+
+        series = symbol_series(collection, 'BTC-USD', self.base + timedelta(minutes=1), self.base + timedelta(minutes=3))
+        self.assertEqual([row['price'] for row in series], [101.0, 102.0])
+        self.assertEqual(last_price(collection, 'AAPL', self.base)['price'], 104.0)
+        self.assertIsNone(last_price(collection, 'MSFT', self.base))
+
+    def test_clients_with_one_uri_share_data(self):
+        other = MemoryClient('memory://test', tlsCAFile='ignored').stockstream
+        self.assertEqual(other.stock_crypto_prices.count_documents({'meta.symbol': 'AAPL'}), 5)
+        self.assertEqual(MemoryClient('memory://elsewhere').stockstream.stock_crypto_prices.count_documents({}), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
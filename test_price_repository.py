@@ -0,0 +1,170 @@
+import os
+import unittest
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+
+import price_repository
+from price_repository import (
+    INDEXES, ROLLUP_INDEXES, ensure_indexes, latest_prices_query, type_series_query,
+    symbol_series_query, last_price_query, rollup_series_query
+)
+
+MONGODB_TEST_URI = os.getenv('MONGODB_TEST_URI')
+
+
+class RecordingCursor:
+    """Captures the find/sort/limit calls a query builds"""
+
+    def __init__(self, filter, projection):
+        self.filter = filter
+        self.projection = projection
+        self.sort_key = None
+        self.limit_value = None
+
+    def sort(self, key, direction):
+        self.sort_key = (key, direction)
+        return self
+
+    def limit(self, value):
+        self.limit_value = value
+        return self
+
+
+class RecordingCollection:
+    def find(self, filter, projection):
+        return RecordingCursor(filter, projection)
+
+
+def build_queries(collection):
+    """Return every repository query, built against collection"""
+    since = datetime.utcnow() - timedelta(hours=24)
+    return {
+        'latest_prices': latest_prices_query(collection, 'stock', since, 5),
+        'type_series': type_series_query(collection, 'crypto', since),
+        'symbol_series': symbol_series_query(collection, 'AAPL', since, datetime.utcnow()),
+        'last_price': last_price_query(collection, 'BTC-USD', since),
+    }
+
+
+def build_rollup_queries(collection):
+    """Return every rollup query, built against collection"""
+    since = datetime.utcnow() - timedelta(days=7)
+    return {
+        'rollup_series': rollup_series_query(collection, 'AAPL', since, datetime.utcnow()),
+    }
+
+
+def plan_stages(explain):
+    """Collect every stage name in an explain() document, including pipeline stages"""
+    stages = []
+    if isinstance(explain, dict):
+        if isinstance(explain.get('stage'), str):
+            stages.append(explain['stage'])
+        for key, value in explain.items():
+            if key.startswith('$'):
+                stages.append(key)
+            stages.extend(plan_stages(value))
+    elif isinstance(explain, list):
+        for item in explain:
+            stages.extend(plan_stages(item))
+    return stages
+
+
+class TestQueryShapes(unittest.TestCase):
+    def test_queries_match_an_index(self):
+        """Test each query filters on an index's leading field and sorts on its second"""
+        index_prefixes = {(keys[0][0], keys[1][0]) for keys in INDEXES}
+        for name, cursor in build_queries(RecordingCollection()).items():
+            equality = [field for field, value in cursor.filter.items() if not isinstance(value, dict)]
+            self.assertEqual(len(equality), 1, f"{name} should have one equality field")
+            self.assertIn('timestamp', cursor.filter, f"{name} should bound the time range")
+            self.assertIn((equality[0], cursor.sort_key[0]), index_prefixes, f"{name} has no supporting index")
+
+        rollup_prefixes = {(keys[0][0], keys[1][0]) for keys in ROLLUP_INDEXES}
+        for name, cursor in build_rollup_queries(RecordingCollection()).items():
+            equality = [field for field, value in cursor.filter.items() if not isinstance(value, dict)]
+            self.assertIn((equality[0], cursor.sort_key[0]), rollup_prefixes, f"{name} has no supporting index")
+
+    def test_projection_excludes_id(self):
+        """Test every query returns projected, JSON-serializable fields"""
+        for name, cursor in build_queries(RecordingCollection()).items():
+            self.assertEqual(cursor.projection['_id'], 0, f"{name} should not return _id")
+            self.assertEqual(cursor.projection['symbol'], '$meta.symbol')
+        for name, cursor in build_rollup_queries(RecordingCollection()).items():
+            self.assertEqual(cursor.projection['_id'], 0, f"{name} should not return _id")
+
+    def test_plan_stages(self):
+        """Test stage collection walks nested plans and aggregation stages"""
+        explain = {'stages': [{'$cursor': {'queryPlanner': {'winningPlan': {
+            'stage': 'FETCH', 'inputStage': {'stage': 'IXSCAN'}}}}}, {'$_internalUnpackBucket': {}}]}
+        self.assertEqual(plan_stages(explain), ['$cursor', 'FETCH', 'IXSCAN', '$_internalUnpackBucket'])
+
+
+@unittest.skipUnless(MONGODB_TEST_URI, "set MONGODB_TEST_URI to run query-plan tests")
+class TestQueryPlans(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.client = MongoClient(MONGODB_TEST_URI)
+        cls.db = cls.client['stockstream_test']
+        cls.db.drop_collection('stock_crypto_prices')
+        cls.collection = cls.db.create_collection(
+            'stock_crypto_prices',
+            timeseries={'timeField': 'timestamp', 'metaField': 'meta', 'granularity': 'seconds'}
+        )
+        ensure_indexes(cls.collection)
+
+        now = datetime.utcnow()
+        docs = []
+        for minutes in range(0, 48 * 60, 15):
+            for symbol, asset_type in (('AAPL', 'stock'), ('MSFT', 'stock'), ('BTC-USD', 'crypto')):
+                docs.append({
+                    'timestamp': now - timedelta(minutes=minutes),
+                    'meta': {'symbol': symbol, 'type': asset_type},
+                    'price': 100.0 + minutes,
+                    'volume': 1.0
+                })
+        cls.collection.insert_many(docs)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.db.drop_collection('stock_crypto_prices')
+        cls.client.close()
+
+    def test_queries_use_index_scan_without_blocking_sort(self):
+        """Test each query is an index scan with no in-memory SORT stage"""
+        for name, cursor in build_queries(self.collection).items():
+            stages = plan_stages(cursor.explain())
+            self.assertIn('IXSCAN', stages, f"{name} should use an index: {stages}")
+            self.assertNotIn('COLLSCAN', stages, f"{name} should not scan the collection: {stages}")
+            # $_internalBoundedSort streams buckets already in index order and is allowed
+            self.assertNotIn('SORT', stages, f"{name} should not sort in memory: {stages}")
+            self.assertNotIn('$sort', stages, f"{name} should not sort in memory: {stages}")
+
+    def test_rollup_query_uses_index_scan(self):
+        """Test the rollup range query is an index scan with no in-memory SORT stage"""
+        rollups = self.db['price_rollups_test']
+        rollups.drop()
+        for keys in ROLLUP_INDEXES:
+            rollups.create_index(keys)
+        now = datetime.utcnow()
+        rollups.insert_many([
+            {'symbol': symbol, 'timestamp': now - timedelta(hours=hours), 'close': 1.0}
+            for hours in range(24 * 14) for symbol in ('AAPL', 'MSFT')
+        ])
+        for name, cursor in build_rollup_queries(rollups).items():
+            stages = plan_stages(cursor.explain())
+            self.assertIn('IXSCAN', stages, f"{name} should use an index: {stages}")
+            self.assertNotIn('SORT', stages, f"{name} should not sort in memory: {stages}")
+        rollups.drop()
+
+    def test_results_are_serializable(self):
+        """Test results are flat documents without _id"""
+        since = datetime.utcnow() - timedelta(hours=24)
+        rows = price_repository.latest_prices(self.collection, 'stock', since, limit=5)
+        self.assertEqual(len(rows), 5)
+        self.assertTrue(all('_id' not in row and row['type'] == 'stock' for row in rows))
+        self.assertEqual(rows, sorted(rows, key=lambda row: row['timestamp'], reverse=True))
+
+if __name__ == '__main__':
+    unittest.main()
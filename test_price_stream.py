@@ -0,0 +1,91 @@
+import json
+import unittest
+
+from price_stream import PriceBroadcaster
+
+
+class FakeQuotes:
+    """Stands in for quote_service.get_quotes with settable prices"""
+
+    def __init__(self):
+        self.prices = {'AAPL': 100.0, 'BTC-USD': 50000.0}
+        self.calls = 0
+
+    def __call__(self, symbols):
+        self.calls += 1
+        quotes = {s: {'price': self.prices[s], 'change': 0.5} for s in symbols}
+        return quotes, {}
+
+
+def parse(message):
+    """Return (event id, event name, data) of an SSE message"""
+    fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+    return int(fields['id']), fields['event'], json.loads(fields['data'])
+
+
+class TestPriceBroadcaster(unittest.TestCase):
+    def setUp(self):
+        self.quotes = FakeQuotes()
+        self.broadcaster = PriceBroadcaster(['AAPL', 'BTC-USD'], fetch=self.quotes,
+                                            interval=3600, heartbeat=0.05)
+
+    def test_only_changed_quotes_are_published(self):
+        """Test unchanged prices produce no event"""
+        self.assertEqual(len(self.broadcaster.poll_once()), 2)
+        self.assertEqual(self.broadcaster.poll_once(), [])
+        self.quotes.prices['AAPL'] = 101.0
+        changed = self.broadcaster.poll_once()
+        self.assertEqual([q['symbol'] for q in changed], ['AAPL'])
+        self.assertEqual(changed[0]['type'], 'stock')
+
+    def test_resume_from_last_event_id(self):
+        """Test a reconnecting client receives only the events it missed"""
+        self.broadcaster.poll_once()
+        self.quotes.prices['AAPL'] = 101.0
+        self.broadcaster.poll_once()
+        self.quotes.prices['BTC-USD'] = 51000.0
+        self.broadcaster.poll_once()
+
+        missed = self.broadcaster.events_since(1)
+        self.assertEqual([event_id for event_id, _ in missed], [2, 3])
+        self.assertEqual(self.broadcaster.events_since(3), [])
+
+    def test_unknown_event_id_needs_snapshot(self):
+        """Test ids older than the history or from a previous process get a snapshot"""
+        broadcaster = PriceBroadcaster(['AAPL'], fetch=self.quotes, history=1)
+        broadcaster.poll_once()
+        self.quotes.prices['AAPL'] = 101.0
+        broadcaster.poll_once()
+        self.assertIsNone(broadcaster.events_since(0))
+        self.assertIsNone(broadcaster.events_since(99))
+        self.assertIsNone(broadcaster.events_since(None))
+
+    def test_stream_sends_snapshot_then_heartbeat(self):
+        """Test a new subscriber gets a snapshot followed by heartbeats"""
+        self.broadcaster.poll_once()
+        self.broadcaster._subscribe = lambda: None
+        self.broadcaster._unsubscribe = lambda: None
+        stream = self.broadcaster.stream()
+        self.assertTrue(next(stream).startswith('retry:'))
+        event_id, event, data = parse(next(stream))
+        self.assertEqual((event_id, event), (1, 'snapshot'))
+        self.assertEqual(len(data), 2)
+        self.assertEqual(next(stream), ': heartbeat\n\n')
+        stream.close()
+
+    def test_stream_resumes_with_last_event_id(self):
+        """Test the stream replays missed events for a Last-Event-ID"""
+        self.broadcaster.poll_once()
+        self.quotes.prices['AAPL'] = 101.0
+        self.broadcaster.poll_once()
+        self.broadcaster._subscribe = lambda: None
+        self.broadcaster._unsubscribe = lambda: None
+        stream = self.broadcaster.stream('1')
+        next(stream)
+        event_id, event, data = parse(next(stream))
+        self.assertEqual((event_id, event), (2, 'prices'))
+        self.assertEqual(data[0]['price'], 101.0)
+        stream.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import profiling
+from profiling import Trace, begin, finish, span, traced, should_profile, prune
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_breakdown_counts_concurrent_spans_once(self):
+        """Test overlapping spans of one kind count their union, the rest is app time"""
+        trace = Trace('GET /x')
+        start = trace.started
+        trace.add_span('upstream', 'fast_info AAPL', start + 0.0, 0.4)
+        trace.add_span('upstream', 'fast_info MSFT', start + 0.1, 0.4)
+        trace.add_span('mongo', 'find prices', start + 0.6, 0.2)
+        trace.seconds = 1.0
+        breakdown = trace.breakdown()
+        self.assertAlmostEqual(breakdown['upstream'], 0.5)
+        self.assertAlmostEqual(breakdown['mongo'], 0.2)
+        self.assertAlmostEqual(breakdown['app'], 0.3)
+
+    def test_spans_follow_fanout_threads(self):
+        """Test spans recorded on a traced worker thread land in the request's trace"""
+        trace = begin('GET /x')
+        try:
+            def call():
+                with span('upstream', 'fast_info AAPL'):
+                    time.sleep(0.01)
+            with ThreadPoolExecutor(max_workers=1) as executor:
+                executor.submit(traced(call)).result()
+                executor.submit(call).result()
+        finally:
+            finish(trace, self.directory, slow_seconds=0)
+        self.assertEqual([s[:2] for s in trace.spans], [('upstream', 'fast_info AAPL')])
+        self.assertIsNone(profiling.current_trace())
+
+    def test_should_profile(self):
+        self.assertTrue(should_profile({'X-Profile': 'secret'}, token='secret'))
+        self.assertFalse(should_profile({'X-Profile': 'wrong'}, token='secret'))
+        self.assertFalse(should_profile({'X-Profile': ''}, token=''))
+        self.assertTrue(should_profile({}, token='', sample_rate=1.0))
+        self.assertFalse(should_profile({}, token='', sample_rate=0))
+
+    def test_profiled_request_is_sampled(self):
+        """Test the sampler captures the stacks of a profiled request's threads"""
+        trace = begin('GET /slow', profile=True)
+        busy_wait(0.2)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(traced(busy_wait), 0.2).result()
+        finish(trace, self.directory, slow_seconds=0)
+        profiling._writer.submit(lambda: None).result()
+
+        stacks = trace.folded_profile()
+        self.assertIn('busy_wait (test_profiling.py', stacks)
+        self.assertTrue(any('_worker' in line and 'busy_wait' in line for line in stacks.splitlines()),
+                        "Fan-out threads of the request should be sampled too")
+        files = os.listdir(self.directory)
+        self.assertEqual(sorted(name.split('.', 1)[1] for name in files),
+                         ['profile.folded', 'spans.folded', 'spans.json'])
+
+    def test_only_slow_requests_are_written(self):
+        fast = begin('GET /fast')
+        self.assertFalse(finish(fast, self.directory, slow_seconds=10))
+        slow = begin('GET /api/historical/<symbol>')
+        with span('mongo', 'find prices'):
+            time.sleep(0.02)
+        self.assertTrue(finish(slow, self.directory, slow_seconds=0.01))
+        profiling._writer.submit(lambda: None).result()
+
+        names = os.listdir(self.directory)
+        self.assertEqual(len(names), 2)
+        with open(os.path.join(self.directory, next(n for n in names if n.endswith('.json')))) as f:
+            report = json.load(f)
+        self.assertEqual(report['request'], 'GET /api/historical/<symbol>')
+        self.assertEqual(report['spans'][0]['kind'], 'mongo')
+        folded = slow.folded_spans()
+        self.assertIn('GET /api/historical/<symbol>;mongo;find prices ', folded)
+
+    def test_prune_keeps_newest(self):
+        for i in range(5):
+            path = os.path.join(self.directory, f"{i}.spans.json")
+            open(path, 'w').close()
+            os.utime(path, (i, i))
+        prune(self.directory, keep=2)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['3.spans.json', '4.spans.json'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,229 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import app as web
+
+from circuit_breaker import CircuitBreaker, OPEN
+from quote_service import QuoteCache, asset_class, fetch_batch
+
+
+class TestQuoteCache(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def fake_fetch(self, symbol):
+        self.calls.append(symbol)
+        return {'symbol': symbol, 'price': 100.0, 'change': 1.5}
+
+    def test_asset_class(self):
+        """Test symbol classification used for TTL selection"""
+        self.assertEqual(asset_class('^GSPC'), 'index')
+        self.assertEqual(asset_class('BTC-USD'), 'crypto')
+        self.assertEqual(asset_class('AAPL'), 'stock')
+
+    def test_hit_after_miss(self):
+        """Test a second lookup within the TTL is served from the cache"""
+        cache = QuoteCache(self.fake_fetch, {'stock': 60}, 10)
+        cache.get('AAPL')
+        cache.get('AAPL')
+        self.assertEqual(self.calls, ['AAPL'], "Should fetch upstream only once")
+        stats = cache.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+
+    def test_expired_entry_is_refetched(self):
+        """Test an entry older than its asset-class TTL is fetched again"""
+        cache = QuoteCache(self.fake_fetch, {'stock': 0}, 10)
+        cache.get('AAPL')
+        cache.get('AAPL')
+        self.assertEqual(len(self.calls), 2, "Expired quote should be refetched")
+
+    def test_fetch_supplied_ttl(self):
+        """Test a (quote, ttl) fetch result expires after the given TTL"""
+        cache = QuoteCache(lambda symbol: ({'symbol': symbol, 'price': 1.0}, 0), {'stock': 60}, 10)
+        cache.get('AAPL')
+        self.assertIsNone(cache.peek('AAPL'), "Should expire with the TTL from the fetch")
+        self.assertEqual(cache.get('AAPL')['price'], 1.0)
+
+    def test_lru_eviction(self):
+        """Test the least recently used symbol is evicted when full"""
+        cache = QuoteCache(self.fake_fetch, {'stock': 60}, 2)
+        cache.get('AAPL')
+        cache.get('MSFT')
+        cache.get('AAPL')
+        cache.get('NVDA')
+        self.assertEqual(cache.stats()['evictions'], 1)
+        cache.get('AAPL')
+        cache.get('MSFT')
+        self.assertEqual(self.calls, ['AAPL', 'MSFT', 'NVDA', 'MSFT'], "MSFT should have been evicted")
+
+    def test_single_flight(self):
+        """Test concurrent misses for one symbol cause a single upstream fetch"""
+        release = threading.Event()
+
+        def slow_fetch(symbol):
+            self.calls.append(symbol)
+            release.wait(5)
+            return {'symbol': symbol, 'price': 100.0, 'change': 0}
+
+        cache = QuoteCache(slow_fetch, {'stock': 60}, 10)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get('AAPL'))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.calls, ['AAPL'], "Concurrent requests should share one fetch")
+        self.assertEqual(len(results), 8)
+        self.assertEqual(cache.stats()['coalesced'], 7)
+
+    def test_failed_fetch_is_not_cached(self):
+        """Test upstream errors propagate and leave no cache entry behind"""
+        def failing_fetch(symbol):
+            raise RuntimeError('upstream down')
+
+        cache = QuoteCache(failing_fetch, {'stock': 60}, 10)
+        with self.assertRaises(RuntimeError):
+            cache.get('AAPL')
+        self.assertEqual(cache.stats()['size'], 0)
+
+class TestFetchBatch(unittest.TestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=8)
+
+    def tearDown(self):
+        self.executor.shutdown(wait=False)
+
+    def test_partial_failure(self):
+        """Test failing symbols are reported without dropping the others"""
+        def fetch(symbol):
+            if symbol == 'BAD':
+                raise ValueError('no data')
+            return {'symbol': symbol, 'price': 1.0, 'change': 0}
+
+        cache = QuoteCache(fetch, {'stock': 60}, 10)
+        quotes, errors = fetch_batch(cache, self.executor, ['AAPL', 'BAD', 'MSFT'])
+        self.assertEqual(list(quotes), ['AAPL', 'MSFT'], "Should keep request order")
+        self.assertEqual(errors, {'BAD': 'no data'})
+
+    def test_fetches_run_concurrently(self):
+        """Test a batch costs roughly one upstream round trip"""
+        def fetch(symbol):
+            time.sleep(0.2)
+            return {'symbol': symbol, 'price': 1.0, 'change': 0}
+
+        cache = QuoteCache(fetch, {'stock': 60}, 10)
+        started = time.monotonic()
+        quotes, errors = fetch_batch(cache, self.executor, [f'S{i}' for i in range(8)])
+        self.assertEqual(len(quotes), 8)
+        self.assertLess(time.monotonic() - started, 0.6, "Fetches should overlap")
+
+    def test_per_symbol_timeout(self):
+        """Test a slow symbol times out while fast ones are returned"""
+        def fetch(symbol):
+            if symbol == 'SLOW':
+                time.sleep(1)
+            return {'symbol': symbol, 'price': 1.0, 'change': 0}
+
+        cache = QuoteCache(fetch, {'stock': 60}, 10)
+        started = time.monotonic()
+        quotes, errors = fetch_batch(cache, self.executor, ['AAPL', 'SLOW'], timeout=0.2, deadline=5)
+        self.assertLess(time.monotonic() - started, 0.8)
+        self.assertIn('AAPL', quotes)
+        self.assertIn('timed out', errors['SLOW'])
+
+    def test_overall_deadline(self):
+        """Test symbols still queued at the deadline are reported"""
+        def fetch(symbol):
+            time.sleep(0.3)
+            return {'symbol': symbol, 'price': 1.0, 'change': 0}
+
+        executor = ThreadPoolExecutor(max_workers=1)
+        cache = QuoteCache(fetch, {'stock': 60}, 10)
+        quotes, errors = fetch_batch(cache, executor, ['A', 'B', 'C'], timeout=5, deadline=0.45)
+        executor.shutdown(wait=False)
+        self.assertEqual(list(quotes), ['A'])
+        self.assertIn('deadline', errors['C'])
+
+    def test_failed_symbol_served_stale(self):
+        """Test a symbol upstream cannot answer falls back to its last quote, tagged with its age"""
+        up = {'value': True}
+
+        def fetch(symbol):
+            if not up['value']:
+                raise RuntimeError('rate limited')
+            return {'symbol': symbol, 'price': 1.0, 'change': 0}
+
+        cache = QuoteCache(fetch, {'stock': 0}, 10)
+        fetch_batch(cache, self.executor, ['AAPL'])
+        up['value'] = False
+        quotes, errors = fetch_batch(cache, self.executor, ['AAPL', 'MSFT'], serve_stale=True)
+        self.assertEqual(errors, {'MSFT': 'rate limited'})
+        self.assertTrue(quotes['AAPL']['stale'])
+        self.assertGreaterEqual(quotes['AAPL']['age'], 0)
+
+        # Without serve_stale (the collector) a failure stays a failure
+        quotes, errors = fetch_batch(cache, self.executor, ['AAPL'])
+        self.assertEqual((quotes, errors), ({}, {'AAPL': 'rate limited'}))
+
+    def test_open_breaker_skips_upstream(self):
+        """Test an open breaker answers from the last known quotes without waiting"""
+        up = {'value': True}
+
+        def fetch(symbol):
+            if not up['value']:
+                time.sleep(0.3)
+                raise RuntimeError('timeout')
+            return {'symbol': symbol, 'price': 1.0, 'change': 0}
+
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=0.2)
+        cache = QuoteCache(fetch, {'stock': 0}, 10)
+        fetch_batch(cache, self.executor, ['AAPL', 'MSFT'], breaker=breaker)
+        up['value'] = False
+        fetch_batch(cache, self.executor, ['AAPL', 'MSFT'], breaker=breaker)
+        self.assertEqual(breaker.state, OPEN)
+
+        started = time.monotonic()
+        quotes, errors = fetch_batch(cache, self.executor, ['AAPL', 'MSFT', 'NVDA'], breaker=breaker, serve_stale=True)
+        self.assertLess(time.monotonic() - started, 0.1)
+        self.assertEqual(list(quotes), ['AAPL', 'MSFT'])
+        self.assertIn('circuit is open', errors['NVDA'])
+
+        # After the reset timeout one background probe closes the breaker again
+        up['value'] = True
+        time.sleep(0.25)
+        quotes, errors = fetch_batch(cache, self.executor, ['AAPL'], breaker=breaker, serve_stale=True)
+        self.assertTrue(quotes['AAPL']['stale'])
+        deadline = time.monotonic() + 2
+        while breaker.state != 'closed' and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(breaker.state, 'closed')
+
+class TestStaleQuotesInResponses(unittest.TestCase):
+    def stale_quotes(self, symbols, *args, **kwargs):
+        return {symbol: {'symbol': symbol, 'price': 1.0, 'change': 0.5, 'stale': True, 'age': 42}
+                for symbol in symbols}, {}
+
+    def test_every_quote_route_marks_stale_prices(self):
+        """Test items built from a stale quote carry its staleness and age"""
+        client = web.app.test_client()
+        with patch.object(web, 'get_quotes', self.stale_quotes), \
+                patch.object(web, 'get_prices_collection', lambda: None), \
+                patch.object(web, 'latest_prices', lambda *args, **kwargs: []):
+            items = (client.get('/api/market/movers').get_json()
+                     + client.get('/stocks').get_json()
+                     + client.get('/crypto').get_json()
+                     + list(client.get('/api/dashboard/summary').get_json()['market_indices'].values()))
+        self.assertTrue(items)
+        for item in items:
+            self.assertEqual((item['stale'], item['age']), (True, 42))
+
+
+if __name__ == '__main__':
+    unittest.main()
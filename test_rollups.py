@@ -0,0 +1,97 @@
+import unittest
+from collections import defaultdict
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import rollups
+from rollups import RESOLUTIONS, floor_time, rollup_pipeline, rollup_window, run_rollups, select_resolution
+
+MINUTE, HOUR, DAY = RESOLUTIONS
+
+
+class RecordingCollection:
+    """Collection that keeps rollup state and records the windows aggregated"""
+
+    def __init__(self):
+        self.docs = {}
+        self.oldest = None
+        self.windows = []
+
+    def find_one(self, filter, projection=None, sort=None):
+        if sort:
+            return {'timestamp': self.oldest} if self.oldest else None
+        return self.docs.get(filter['_id'])
+
+    def update_one(self, filter, update, upsert=False):
+        self.docs.setdefault(filter['_id'], {}).update(update['$set'])
+
+    def aggregate(self, pipeline, **options):
+        match = pipeline[0]['$match']['timestamp']
+        self.windows.append((match['$gte'], match['$lt']))
+
+
+class TestRollups(unittest.TestCase):
+    def setUp(self):
+        self.now = datetime(2024, 12, 6, 15, 37, 12)
+
+    def test_floor_time(self):
+        """Test bucket boundaries are aligned to the epoch"""
+        self.assertEqual(floor_time(self.now, 60), datetime(2024, 12, 6, 15, 37))
+        self.assertEqual(floor_time(self.now, 3600), datetime(2024, 12, 6, 15, 0))
+        self.assertEqual(floor_time(self.now, 86400), datetime(2024, 12, 6))
+
+    def test_window_covers_only_closed_buckets(self):
+        """Test the current, still open bucket is never rolled up"""
+        watermark = datetime(2024, 12, 6, 15, 30)
+        self.assertEqual(rollup_window(MINUTE, watermark, self.now, self.now),
+                         (watermark, datetime(2024, 12, 6, 15, 37)))
+        self.assertIsNone(rollup_window(HOUR, datetime(2024, 12, 6, 15), self.now, self.now))
+
+    def test_window_waits_for_finer_resolution(self):
+        """Test an hour is only rolled up once every minute in it has been"""
+        minute_watermark = datetime(2024, 12, 6, 14, 59)
+        self.assertIsNone(rollup_window(HOUR, datetime(2024, 12, 6, 14), minute_watermark, self.now))
+        self.assertIsNone(rollup_window(HOUR, datetime(2024, 12, 6, 14), None, self.now))
+
+    def test_late_tick_is_rolled_up(self):
+        """Test a tick flushed after its minute closed still falls in a later window"""
+        db = defaultdict(RecordingCollection)
+        raw = db[rollups.RAW_COLLECTION]
+        raw.oldest = datetime(2024, 12, 6, 15, 30, 5)
+        late = datetime(2024, 12, 6, 15, 36, 30)
+        with patch.object(rollups, 'ROLLUP_GRACE_SECONDS', 125):
+            run_rollups(db, now=self.now)
+            # The late tick reaches MongoDB at 15:38:10, after the first run
+            self.assertLessEqual(raw.windows[-1][1], late)
+            run_rollups(db, now=datetime(2024, 12, 6, 15, 39, 40))
+        self.assertTrue(any(start <= late < end for start, end in raw.windows))
+        self.assertEqual(raw.windows[-1][1], datetime(2024, 12, 6, 15, 37))
+
+    def test_select_resolution_bounds_points(self):
+        """Test longer ranges move to coarser buckets"""
+        self.assertEqual(select_resolution(self.now - timedelta(hours=6), self.now, self.now)['name'], '1m')
+        self.assertEqual(select_resolution(self.now - timedelta(days=7), self.now, self.now)['name'], '1h')
+        self.assertEqual(select_resolution(self.now - timedelta(days=366), self.now, self.now)['name'], '1d')
+        self.assertEqual(select_resolution(self.now - timedelta(days=3650), self.now, self.now)['name'], '1d')
+
+    def test_select_resolution_respects_retention(self):
+        """Test a resolution that has expired the start of the range is skipped"""
+        start = self.now - timedelta(days=30)
+        chosen = select_resolution(start, start + timedelta(hours=1), self.now)
+        self.assertEqual(chosen['name'], '1h')
+
+    def test_pipeline_shape(self):
+        """Test raw ticks and rollups are grouped by symbol and bucket and merged idempotently"""
+        start, end = datetime(2024, 12, 6, 14), datetime(2024, 12, 6, 15)
+        raw = rollup_pipeline(MINUTE, True, start, end)
+        self.assertEqual(raw[0], {'$match': {'timestamp': {'$gte': start, '$lt': end}}})
+        self.assertEqual(raw[2]['$group']['_id']['symbol'], '$meta.symbol')
+        self.assertEqual(raw[-1]['$merge']['into'], 'price_rollups_1m')
+        self.assertEqual(raw[-1]['$merge']['whenMatched'], 'replace')
+
+        derived = rollup_pipeline(DAY, False, start, end)
+        self.assertEqual(derived[2]['$group']['high'], {'$max': '$high'})
+        self.assertEqual(derived[2]['$group']['count'], {'$sum': '$count'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from shared_cache import SharedCache
+
+
+def _load_once(path, counter_path, results):
+    """Worker process: read key 'quote:AAPL', counting upstream loads in a file"""
+    def loader():
+        with open(counter_path, 'a') as f:
+            f.write('x')
+        time.sleep(0.3)
+        return {'symbol': 'AAPL', 'price': 100.0}
+
+    value, _ = SharedCache(path, poll_interval=0.01).get_or_load('quote:AAPL', loader, 60)
+    results.put(value['price'])
+
+
+def _frozen_clock():
+    return 1000.0
+
+
+def _take_tokens(path, results):
+    """Worker process: try for 5 tokens of a bucket whose clock never advances"""
+    cache = SharedCache(path, clock=_frozen_clock)
+    results.put(sum(cache.take_token('upstream', 5, 6) == 0 for _ in range(5)))
+
+
+class TestSharedCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'shared.sqlite')
+        self.now = 1000.0
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def clock(self):
+        return self.now
+
+    def test_put_and_get_round_trip(self):
+        """Test a published value is returned with its expiry"""
+        cache = SharedCache(self.path, clock=self.clock)
+        cache.put('quote:AAPL', {'price': 1.5}, 30)
+        self.assertEqual(cache.get('quote:AAPL'), ({'price': 1.5}, 1030.0))
+        self.assertIsNone(cache.get('quote:MSFT'))
+
+    def test_fresh_entry_is_not_reloaded(self):
+        """Test get_or_load serves a fresh entry and reports its remaining TTL"""
+        cache = SharedCache(self.path, clock=self.clock)
+        cache.put('quote:AAPL', {'price': 1.5}, 30)
+        self.now += 10
+        value, ttl = cache.get_or_load('quote:AAPL', lambda: self.fail("should not load"), 30)
+        self.assertEqual(value, {'price': 1.5})
+        self.assertEqual(ttl, 20)
+
+    def test_expired_entry_is_reloaded(self):
+        """Test an entry past its TTL is loaded again"""
+        cache = SharedCache(self.path, clock=self.clock)
+        cache.put('quote:AAPL', {'price': 1.5}, 30)
+        self.now += 31
+        value, ttl = cache.get_or_load('quote:AAPL', lambda: {'price': 2.0}, 30)
+        self.assertEqual(value, {'price': 2.0})
+        self.assertEqual(ttl, 30)
+        self.assertEqual(cache.stats()['loads'], 1)
+
+    def test_lease_is_exclusive_until_it_expires(self):
+        """Test only one owner holds a lease and a lapsed lease can be taken over"""
+        first = SharedCache(self.path, lease_seconds=10, clock=self.clock)
+        second = SharedCache(self.path, lease_seconds=10, clock=self.clock)
+        self.assertTrue(first.try_lease('quote:AAPL'))
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            # Owners are per thread, so take the second lease from another one
+            self.assertFalse(pool.submit(second.try_lease, 'quote:AAPL').result())
+            self.now += 11
+            self.assertTrue(pool.submit(second.try_lease, 'quote:AAPL').result(),
+                            "An expired lease should be taken over")
+
+    def test_failed_load_releases_the_lease(self):
+        """Test a loader error propagates and does not leave the key locked"""
+        cache = SharedCache(self.path, clock=self.clock)
+
+        def failing():
+            raise ValueError("upstream down")
+        with self.assertRaises(ValueError):
+            cache.get_or_load('quote:AAPL', failing, 30)
+        self.assertTrue(cache.try_lease('quote:AAPL'))
+
+    def test_concurrent_threads_load_once(self):
+        """Test concurrent misses in one process call the loader once"""
+        cache = SharedCache(self.path, poll_interval=0.01)
+        calls = []
+
+        def loader():
+            calls.append(1)
+            time.sleep(0.2)
+            return {'price': 3.0}
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            values = list(pool.map(lambda _: cache.get_or_load('quote:AAPL', loader, 60)[0], range(8)))
+        self.assertEqual(len(calls), 1, "Only the lease holder should load")
+        self.assertEqual(values, [{'price': 3.0}] * 8)
+
+    def test_worker_processes_load_once(self):
+        """Test concurrent misses across processes call the upstream once"""
+        counter_path = os.path.join(self.tmpdir, 'loads')
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        workers = [context.Process(target=_load_once, args=(self.path, counter_path, results)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(30)
+        self.assertEqual(sorted(results.get(timeout=5) for _ in workers), [100.0] * 4)
+        with open(counter_path) as f:
+            self.assertEqual(f.read(), 'x', "Only one worker should call the upstream")
+
+    def test_token_bucket_refills_at_the_rate(self):
+        cache = SharedCache(self.path, clock=self.clock)
+        self.assertEqual([cache.take_token('upstream', 2, 2) for _ in range(2)], [0, 0])
+        self.assertAlmostEqual(cache.take_token('upstream', 2, 2), 0.5)
+        self.now += 0.5
+        # Another process's connection sees the same bucket
+        self.assertEqual(SharedCache(self.path, clock=self.clock).take_token('upstream', 2, 2), 0)
+        self.assertGreater(cache.take_token('upstream', 2, 2), 0)
+
+    def test_worker_processes_share_the_bucket(self):
+        """Test processes taking tokens together get no more than one burst between them"""
+        context = multiprocessing.get_context('spawn')
+        results = context.Queue()
+        workers = [context.Process(target=_take_tokens, args=(self.path, results)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(30)
+        self.assertEqual(sum(results.get(timeout=5) for _ in workers), 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import random
+import shutil
+import string
+import tempfile
+import time
+import unittest
+
+from symbol_directory import SymbolIndex, SymbolDirectory
+
+ENTRIES = [
+    ('AAPL', 'Apple Inc.'),
+    ('AAP', 'Advance Auto Parts Inc.'),
+    ('MSFT', 'Microsoft Corporation'),
+    ('BAC', 'Bank of America Corporation'),
+    ('BK', 'Bank of New York Mellon Corporation'),
+    ('AMZN', 'Amazon.com Inc.'),
+]
+
+
+class TestSymbolIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = SymbolIndex(ENTRIES)
+
+    def symbols(self, query, limit=10):
+        return [entry['symbol'] for entry in self.index.search(query, limit)]
+
+    def test_exact_symbol_ranks_first(self):
+        """Test an exact symbol beats longer symbols sharing its prefix"""
+        self.assertEqual(self.symbols('aap'), ['AAP', 'AAPL'])
+        self.assertEqual(self.symbols('AAPL'), ['AAPL'])
+
+    def test_name_words(self):
+        """Test name words match by prefix and every query word must match"""
+        self.assertEqual(self.symbols('micro'), ['MSFT'])
+        self.assertEqual(self.symbols('bank'), ['BK', 'BAC'])
+        self.assertEqual(self.symbols('bank of am'), ['BAC'])
+
+    def test_typos(self):
+        """Test symbols and name words one edit away still match"""
+        self.assertEqual(self.symbols('APPL'), ['AAPL'])
+        self.assertEqual(self.symbols('microsft'), ['MSFT'])
+        self.assertEqual(self.symbols('amazn'), ['AMZN'])
+
+    def test_limit(self):
+        """Test results stop at the limit"""
+        self.assertEqual(len(self.symbols('a', limit=2)), 2)
+        self.assertEqual(self.symbols('zzzz'), [])
+
+    def test_large_listing_latency(self):
+        """Test searches over 100k symbols stay fast"""
+        rng = random.Random(7)
+        words = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(20000)]
+        entries = {}
+        while len(entries) < 100000:
+            symbol = ''.join(rng.choices(string.ascii_uppercase, k=rng.randint(1, 5)))
+            entries[symbol] = ' '.join(rng.choices(words, k=3)).title() + ' Inc.'
+        index = SymbolIndex(entries.items())
+
+        queries = [symbol[:rng.randint(1, len(symbol))] for symbol in rng.sample(list(entries), 500)]
+        queries += [word[:rng.randint(2, len(word))] for word in rng.sample(words, 500)]
+        timings = []
+        for query in queries:
+            started = time.perf_counter()
+            results = index.search(query, 10)
+            timings.append(time.perf_counter() - started)
+            self.assertTrue(results, query)
+        timings.sort()
+        # Sub-millisecond on a quiet machine; leave room for slow CI runners
+        self.assertLess(timings[int(len(timings) * 0.99)], 0.01)
+
+
+class TestSymbolDirectory(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'symbols.csv')
+        self.write('symbol,name,type\nAAPL,Apple Inc.,stock\nBTC-USD,Bitcoin,\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, content):
+        with open(self.path, 'w') as f:
+            f.write(content)
+
+    def test_types_and_rebuild(self):
+        """Test symbols are split by asset type and a changed file is re-indexed"""
+        directory = SymbolDirectory(self.path, check_interval=0)
+        self.assertEqual(directory.search('btc', 'crypto'), [{'symbol': 'BTC-USD', 'name': 'Bitcoin'}])
+        self.assertEqual(directory.search('btc', 'stock'), [])
+
+        self.write('symbol,name,type\nAAPL,Apple Inc.,stock\nMSFT,Microsoft Corporation,stock\n')
+        os.utime(self.path, ns=(time.time_ns(), time.time_ns() + 10**9))
+        deadline = time.monotonic() + 5
+        while not directory.search('msft', 'stock') and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(directory.search('msft', 'stock')[0]['symbol'], 'MSFT')
+
+    def test_missing_listing(self):
+        """Test a missing listing file yields no results instead of errors"""
+        directory = SymbolDirectory(os.path.join(self.directory, 'missing.csv'), check_interval=0)
+        self.assertEqual(directory.search('aapl', 'stock'), [])
+
+if __name__ == '__main__':
+    unittest.main()
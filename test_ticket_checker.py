@@ -0,0 +1,179 @@
+import time
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+import app as web
+from circuit_breaker import CircuitBreaker
+from lottery import LotteryArchive, DRAW_DTYPE
+from ticket_checker import DrawIndex, FrequencyStats, TicketChecker, encode_numbers, popcount
+
+
+def make_draws(rows):
+    """Build a DRAW_DTYPE array from (numbers, special) pairs, one draw every other day"""
+    draws = np.zeros(len(rows), dtype=DRAW_DTYPE)
+    for i, (numbers, special) in enumerate(rows):
+        draws[i] = (19000 + 2 * i, sorted(numbers), special, 0)
+    return draws
+
+
+def random_draws(rng, count, main_max=70, special_max=25):
+    numbers = np.sort(np.argsort(rng.random((count, main_max)), axis=1)[:, :5] + 1, axis=1)
+    return make_draws(list(zip(numbers.tolist(), rng.integers(1, special_max + 1, count).tolist())))
+
+
+class TestDrawIndex(unittest.TestCase):
+    def test_bitsets_cover_high_numbers(self):
+        """Test numbers above 64 land in the second word and still count as matches"""
+        low, high = encode_numbers([[1, 64, 65, 70, 75]])
+        self.assertEqual(int(popcount(low)[0]), 2)
+        self.assertEqual(int(popcount(high)[0]), 3)
+        with self.assertRaises(ValueError):
+            encode_numbers([[0, 1, 2, 3, 4]])
+
+    def test_scores_per_tier(self):
+        index = DrawIndex()
+        index.update(make_draws([
+            ([1, 2, 3, 4, 5], 6),     # 5+1
+            ([1, 2, 3, 4, 66], 9),    # 4
+            ([1, 2, 3, 40, 41], 6),   # 3+1
+            ([10, 11, 12, 13, 14], 6),  # 0+1
+            ([1, 2, 20, 21, 22], 7),  # 2, no prize
+        ]))
+        counts = index.score([[1, 2, 3, 4, 5]], [6])[0]
+        self.assertEqual(counts[5 * 2 + 1], 1)
+        self.assertEqual(counts[4 * 2], 1)
+        self.assertEqual(counts[3 * 2 + 1], 1)
+        self.assertEqual(counts[0 * 2 + 1], 1)
+        self.assertEqual(counts.sum(), 4)
+
+    def test_matches_brute_force(self):
+        """Test the vectorized pass agrees with counting set intersections"""
+        rng = np.random.default_rng(7)
+        draws = random_draws(rng, 300)
+        tickets = random_draws(rng, 40)
+        index = DrawIndex()
+        index.update(draws[:120])
+        index.update(draws)
+        counts = index.score(tickets['numbers'], tickets['special'])
+        for ticket, row in zip(tickets, counts):
+            expected = np.zeros(12, dtype=np.int64)
+            for draw in draws:
+                main = len(set(ticket['numbers'].tolist()) & set(draw['numbers'].tolist()))
+                matched = int(ticket['special'] == draw['special'])
+                if main >= 3 or matched:
+                    expected[main * 2 + matched] += 1
+            np.testing.assert_array_equal(row, expected)
+
+    def test_snapshot_is_not_moved_by_updates(self):
+        """Test a snapshot keeps scoring the draws it was taken with while the index grows"""
+        draws = random_draws(np.random.default_rng(5), 60)
+        index = DrawIndex()
+        index.update(draws[:40])
+        snapshot = index.snapshot()
+        index.update(draws)
+        self.assertEqual((len(snapshot), len(index)), (40, 60))
+        expected = DrawIndex()
+        expected.update(draws[:40])
+        tickets = draws[35:45]
+        np.testing.assert_array_equal(snapshot.score(tickets['numbers'], tickets['special']),
+                                      expected.score(tickets['numbers'], tickets['special']))
+
+    def test_ten_thousand_tickets_against_thirty_years(self):
+        """Test scoring stays fast at 10,000 tickets against ~4,700 draws"""
+        rng = np.random.default_rng(1)
+        index = DrawIndex()
+        index.update(random_draws(rng, 30 * 156))
+        tickets = random_draws(rng, 10000)
+        started = time.perf_counter()
+        counts = index.score(tickets['numbers'], tickets['special'])
+        elapsed = time.perf_counter() - started
+        self.assertEqual(counts.shape, (10000, 12))
+        # Around a quarter of a second on a quiet machine; leave room for slow CI runners
+        self.assertLess(elapsed, 2)
+
+
+class TestFrequencyStats(unittest.TestCase):
+    def test_incremental_matches_full_count(self):
+        """Test updating draw by draw gives the same counts as one update"""
+        draws = random_draws(np.random.default_rng(3), 250)
+        incremental = FrequencyStats(window=50)
+        for end in (1, 40, 41, 120, 250):
+            incremental.update(draws[:end])
+        full = FrequencyStats(window=50)
+        full.update(draws)
+        for name in ('main', 'special', 'recent_main', 'recent_special', 'last_main', 'last_special'):
+            np.testing.assert_array_equal(getattr(incremental, name), getattr(full, name), name)
+        np.testing.assert_array_equal(full.recent_main, np.bincount(draws['numbers'][-50:].ravel(), minlength=76))
+
+    def test_hot_and_cold(self):
+        rows = [([1, 2, 3, 4, 5], 1)] * 3 + [([1, 2, 3, 4, 6], 2)]
+        stats = FrequencyStats(window=10)
+        stats.update(make_draws(rows))
+        report = stats.report(main_max=10, special_max=3, count=2)
+        self.assertEqual(report['main']['hot'], ['01', '02'])
+        self.assertEqual(report['main']['cold'], ['07', '08'])
+        self.assertEqual(report['main']['counts']['05'], 3)
+        self.assertEqual(report['main']['draws_since']['05'], 1)
+        self.assertEqual(report['main']['draws_since']['07'], 4)
+        self.assertEqual(report['special']['hot'][0], '01')
+
+
+class TestTicketChecker(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.rows = [
+            {'draw_date': '2024-12-02T00:00:00', 'winning_numbers': '01 02 03 04 05 06'},
+            {'draw_date': '2024-12-04T00:00:00', 'winning_numbers': '01 02 03 40 41 06'},
+        ]
+        archive = LotteryArchive(self.directory, fetch=lambda game, since=None: self.rows if since is None else [],
+                                 reload_seconds=0, breaker=CircuitBreaker('test-tickets'))
+        archive.refresh('powerball')
+        self.archive = archive
+        self.checker = TicketChecker(archive)
+
+    def test_check_reports_tiers_and_best(self):
+        result = self.checker.check('powerball', [{'numbers': [5, 4, 3, 2, 1], 'powerball': 6}])
+        self.assertEqual(result['draws_checked'], 2)
+        self.assertEqual(result['since'], '2024-12-02')
+        ticket = result['tickets'][0]
+        self.assertEqual(ticket['numbers'], ['01', '02', '03', '04', '05'])
+        self.assertEqual(ticket['tiers']['5+1'], 1)
+        self.assertEqual(ticket['tiers']['3+1'], 1)
+        self.assertEqual((ticket['wins'], ticket['best']), (2, '5+1'))
+
+    def test_follows_appended_draws(self):
+        """Test draws appended to the archive are picked up without re-encoding the rest"""
+        self.checker.frequencies('powerball')
+        self.archive._fetch = lambda game, since=None: [
+            {'draw_date': '2024-12-07T00:00:00', 'winning_numbers': '01 02 03 04 05 06'}]
+        self.archive.refresh('powerball')
+        result = self.checker.check('powerball', [{'numbers': [1, 2, 3, 4, 5], 'powerball': 6}])
+        self.assertEqual(result['tickets'][0]['tiers']['5+1'], 2)
+        self.assertEqual(self.checker.frequencies('powerball')['main']['counts']['01'], 3)
+
+    def test_invalid_tickets_are_rejected(self):
+        for ticket in ({'numbers': [1, 1, 2, 3, 4], 'powerball': 1},
+                       {'numbers': [1, 2, 3, 4, 70], 'powerball': 1},
+                       {'numbers': [1, 2, 3, 4, 5], 'powerball': 27},
+                       {'numbers': [1, 2, 3, 4], 'powerball': 1}):
+            with self.assertRaises(ValueError):
+                self.checker.check('powerball', [ticket])
+
+    def test_check_endpoint(self):
+        client = web.app.test_client()
+        with patch.object(web, 'ticket_checker', self.checker):
+            response = client.post('/api/lottery/check', json={
+                'game': 'powerball', 'tickets': [{'numbers': [1, 2, 3, 40, 41], 'powerball': 9}]})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()['tickets'][0]['tiers']['5'], 1)
+            response = client.post('/api/lottery/check', json={'game': 'powerball', 'tickets': [{'numbers': [1]}]})
+            self.assertEqual(response.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from shared_cache import SharedCache
+
+from upstream_gateway import (
+    TokenBucket, UpstreamGateway, PRIORITY_USER, PRIORITY_BACKGROUND, upstream_priority, with_priority,
+    current_priority
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_rate(self):
+        """Test the bucket allows a burst and then refills at the rate"""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=3, clock=clock)
+        self.assertEqual([bucket.take() for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.take(), 0.5)
+        clock.now += 0.5
+        self.assertEqual(bucket.take(), 0)
+        clock.now += 10
+        self.assertEqual([bucket.take() for _ in range(4)][:3], [0, 0, 0])
+
+
+class TestUpstreamGateway(unittest.TestCase):
+    def test_never_exceeds_rate(self):
+        """Test calls are spaced by the rate once the burst is spent"""
+        gateway = UpstreamGateway(rate=20, burst=2)
+        stamps = []
+        threads = [threading.Thread(target=gateway.call, args=(i, lambda: stamps.append(time.monotonic())))
+                   for i in range(8)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # 2 from the burst, then 6 at 20/s
+        self.assertGreaterEqual(time.monotonic() - started, 0.28)
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(gateway.stats()['calls'], 8)
+
+    def test_gateways_share_one_bucket(self):
+        """Test gateways on a shared cache (one per process) stay within the rate together"""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'shared.sqlite')
+        gateways = [UpstreamGateway(rate=20, burst=2, shared=SharedCache(path)) for _ in range(2)]
+        threads = [threading.Thread(target=gateways[i % 2].call, args=(i, lambda: None)) for i in range(8)]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # One burst of 2 for both, then 6 at 20/s; separate buckets would take 0.1s
+        self.assertGreaterEqual(time.monotonic() - started, 0.28)
+        self.assertEqual(sum(gateway.stats()['calls'] for gateway in gateways), 8)
+
+    def test_user_calls_jump_the_queue(self):
+        """Test queued user calls are granted before earlier background ones"""
+        gateway = UpstreamGateway(rate=20, burst=1)
+        order = []
+        gateway.call('warmup', lambda: None)
+
+        def run(key, priority):
+            gateway.call(key, lambda: order.append(key), priority)
+
+        threads = [threading.Thread(target=run, args=(f'bg{i}', PRIORITY_BACKGROUND)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.005)
+        user = threading.Thread(target=run, args=('user', PRIORITY_USER))
+        user.start()
+        for thread in threads + [user]:
+            thread.join()
+        self.assertLess(order.index('user'), 2, order)
+
+    def test_same_key_is_coalesced(self):
+        """Test concurrent calls for one key share one upstream call and its result"""
+        gateway = UpstreamGateway(rate=100, burst=1)
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return 'quote'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(gateway.call('AAPL', fetch))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, ['quote'] * 5)
+        self.assertEqual(gateway.stats()['coalesced'], 4)
+
+    def test_errors_reach_every_waiter(self):
+        """Test a failed call raises for the caller and the callers sharing it"""
+        gateway = UpstreamGateway(rate=100, burst=5)
+        with self.assertRaises(ZeroDivisionError):
+            gateway.call('x', lambda: 1 / 0)
+
+    def test_priority_follows_work_to_other_threads(self):
+        """Test with_priority carries the caller's priority onto a worker thread"""
+        seen = []
+        with upstream_priority(PRIORITY_BACKGROUND):
+            task = with_priority(lambda: seen.append(current_priority()))
+        thread = threading.Thread(target=task)
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, [PRIORITY_BACKGROUND])
+        self.assertEqual(current_priority(), PRIORITY_USER)
+
+if __name__ == '__main__':
+    unittest.main()
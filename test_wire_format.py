@@ -0,0 +1,47 @@
+import unittest
+
+import numpy as np
+from flask import Flask, request
+
+from wire_format import COLUMNS_MEDIA_TYPE, HEADER, encode_columns, decode_columns, wants_columns
+
+
+class TestColumnsEncoding(unittest.TestCase):
+    def test_round_trip(self):
+        """Test timestamps and prices decode exactly as encoded"""
+        ts = np.arange(1700000000, 1700000000 + 300 * 252, 300, dtype='i8')
+        prices = np.linspace(100.0, 250.0, len(ts))
+        body = encode_columns(ts, prices)
+        self.assertEqual(len(body), HEADER.size + 8 * len(ts) + 4 * (len(ts) - 1))
+        decoded_ts, decoded_prices = decode_columns(body)
+        np.testing.assert_array_equal(decoded_ts, ts)
+        np.testing.assert_array_equal(decoded_prices, prices)
+
+    def test_empty_and_single(self):
+        """Test series with zero or one point"""
+        for ts, prices in (([], []), ([1700000000], [1.5])):
+            decoded_ts, decoded_prices = decode_columns(encode_columns(ts, prices))
+            self.assertEqual(decoded_ts.tolist(), ts)
+            self.assertEqual(decoded_prices.tolist(), prices)
+
+    def test_rejects_other_bodies(self):
+        """Test a body without the magic prefix is refused"""
+        with self.assertRaises(ValueError):
+            decode_columns(b'{"timestamps": []}' + bytes(16))
+
+    def test_negotiation(self):
+        """Test the format parameter wins over the Accept header"""
+        app = Flask(__name__)
+        cases = [
+            ({'query_string': 'format=columns'}, True),
+            ({'query_string': 'format=json', 'headers': {'Accept': COLUMNS_MEDIA_TYPE}}, False),
+            ({'headers': {'Accept': COLUMNS_MEDIA_TYPE}}, True),
+            ({'headers': {'Accept': 'application/json'}}, False),
+            ({}, False),
+        ]
+        for kwargs, expected in cases:
+            with app.test_request_context('/', **kwargs):
+                self.assertEqual(wants_columns(request), expected, kwargs)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import time
+import unittest
+
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError, DocumentTooLarge
+
+from metrics import MONGO_WRITES_REJECTED
+from write_buffer import WriteBehindBuffer
+
+
+class FakeResult:
+    def __init__(self, inserted_ids):
+        self.inserted_ids = inserted_ids
+
+
+class FakeCollection:
+    """Records insert_many calls and fails the first `failures` of them"""
+
+    name = 'prices'
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = []
+        self.docs = {}
+
+    def insert_many(self, docs, ordered=True):
+        self.calls.append((len(docs), ordered))
+        for doc in docs:
+            doc.setdefault('_id', ObjectId())
+        if self.failures:
+            self.failures -= 1
+            raise AutoReconnect('connection reset')
+        errors = []
+        for i, doc in enumerate(docs):
+            if doc['_id'] in self.docs:
+                errors.append({'index': i, 'code': 11000})
+            elif 'invalid' in doc:
+                errors.append({'index': i, 'code': 121, 'errmsg': 'Document failed validation'})
+            else:
+                self.docs[doc['_id']] = doc
+        if errors:
+            raise BulkWriteError({'nInserted': len(docs) - len(errors), 'writeErrors': errors})
+        return FakeResult([doc['_id'] for doc in docs])
+
+
+class TestWriteBehindBuffer(unittest.TestCase):
+    def test_flushes_on_size(self):
+        """Test reaching max_size triggers one unordered bulk insert"""
+        collection = FakeCollection()
+        buffer = WriteBehindBuffer(collection, max_size=5, flush_interval=60)
+        for i in range(5):
+            buffer.add({'symbol': f'S{i}'})
+        deadline = time.monotonic() + 2
+        while buffer.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        buffer.close()
+        self.assertEqual(collection.calls, [(5, False)], "Should write all five documents in one call")
+
+    def test_flushes_on_interval(self):
+        """Test a partially filled buffer is flushed once flush_interval passes"""
+        collection = FakeCollection()
+        buffer = WriteBehindBuffer(collection, max_size=100, flush_interval=0.1)
+        buffer.add({'symbol': 'AAPL'})
+        time.sleep(0.4)
+        self.assertEqual(len(collection.docs), 1)
+        buffer.close()
+
+    def test_retries_with_backoff(self):
+        """Test transient errors are retried without duplicating documents"""
+        collection = FakeCollection(failures=2)
+        buffer = WriteBehindBuffer(collection, max_size=100, flush_interval=60, backoff=0.01)
+        buffer.extend([{'symbol': 'AAPL'}, {'symbol': 'MSFT'}])
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(len(collection.calls), 3)
+        self.assertEqual(len(collection.docs), 2)
+        buffer.close()
+
+    def test_duplicates_from_earlier_attempt_count_as_written(self):
+        """Test documents already inserted by a failed attempt are not retried"""
+        collection = FakeCollection()
+        doc = {'symbol': 'AAPL'}
+        collection.insert_many([doc])
+        buffer = WriteBehindBuffer(collection, max_size=100, flush_interval=60, backoff=0.01)
+        buffer.extend([doc, {'symbol': 'MSFT'}])
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(buffer.pending(), 0)
+        buffer.close()
+
+    def test_unwritten_documents_are_kept(self):
+        """Test documents are requeued when every retry fails"""
+        collection = FakeCollection(failures=10)
+        buffer = WriteBehindBuffer(collection, max_size=100, flush_interval=60, max_retries=1, backoff=0.01)
+        buffer.add({'symbol': 'AAPL'})
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(buffer.pending(), 1)
+
+    def test_rejected_documents_are_dropped(self):
+        """Test documents failing validation are counted and dropped, not retried"""
+        collection = FakeCollection()
+        buffer = WriteBehindBuffer(collection, max_size=100, flush_interval=60, backoff=0.01)
+        rejected = MONGO_WRITES_REJECTED.labels('prices', '121')
+        before = rejected.samples('x', [])[0][2]
+        buffer.extend([{'symbol': 'AAPL'}, {'symbol': 'MSFT', 'invalid': True}])
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(len(collection.calls), 1)
+        self.assertEqual(buffer.pending(), 0)
+        self.assertEqual(buffer.rejected, 1)
+        self.assertEqual(rejected.samples('x', [])[0][2] - before, 1)
+        buffer.close()
+
+    def test_permanent_errors_are_not_retried(self):
+        """Test a batch failing with a non-network error is dropped after one attempt"""
+        collection = FakeCollection()
+
+        def too_large(docs, ordered=True):
+            collection.calls.append((len(docs), ordered))
+            raise DocumentTooLarge('BSON document too large')
+        collection.insert_many = too_large
+        buffer = WriteBehindBuffer(collection, max_size=100, flush_interval=60, backoff=0.01)
+        buffer.add({'symbol': 'AAPL'})
+        self.assertEqual(buffer.flush(), 0)
+        self.assertEqual(len(collection.calls), 1)
+        self.assertEqual(buffer.pending(), 0)
+        self.assertEqual(buffer.rejected, 1)
+        buffer.close()
+
+    def test_close_flushes_remaining(self):
+        """Test shutdown writes everything still buffered"""
+        collection = FakeCollection()
+        buffer = WriteBehindBuffer(collection, max_size=100, flush_interval=60)
+        buffer.extend([{'symbol': 'AAPL'}, {'symbol': 'MSFT'}, {'symbol': 'NVDA'}])
+        buffer.close()
+        self.assertEqual(len(collection.docs), 3)
+        with self.assertRaises(RuntimeError):
+            buffer.add({'symbol': 'GOOGL'})
+
+if __name__ == '__main__':
+    unittest.main()
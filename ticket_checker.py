@@ -0,0 +1,284 @@
+import threading
+import logging
+
+import numpy as np
+
+from lottery import GAMES, lottery_archive, draw_date, format_lottery_number
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Most tickets scored in one request
+LOTTERY_MAX_TICKETS = 10000
+# Draws the hot and cold numbers are counted over
+HOT_COLD_WINDOW = 100
+# Hot and cold numbers reported per ball
+HOT_COLD_COUNT = 5
+# Bytes of the ticket x draw scratch arrays; small enough to stay in cache
+SCORE_CHUNK_BYTES = 1 << 21
+
+# Winning (main matches, special matched) combinations, best first; both
+# games pay on the same nine
+PRIZE_TIERS = [(5, 1), (5, 0), (4, 1), (4, 0), (3, 1), (3, 0), (2, 1), (1, 1), (0, 1)]
+# Highest main number any matrix of either game has used (Mega Millions 2013-2017)
+MAX_NUMBER = 75
+
+if hasattr(np, 'bitwise_count'):
+    popcount = np.bitwise_count
+else:
+    # numpy < 2: count the bits of each 16-bit quarter of the words
+    _POPCOUNT16 = np.array([bin(i).count('1') for i in range(1 << 16)], dtype=np.uint8)
+
+    def popcount(words, out=None):
+        counts = _POPCOUNT16[words.view(np.uint16)].reshape(words.shape + (4,)).sum(axis=-1, dtype=np.uint8)
+        if out is None:
+            return counts
+        out[...] = counts
+        return out
+
+
+def tier_name(main, special):
+    return f"{main}+1" if special else str(main)
+
+
+def encode_numbers(numbers):
+    """Return the (low, high) 64-bit bitsets of rows of main numbers (1..75)
+
+    Number k sets bit k-1 of the 128 bits, so the main matches of a ticket
+    and a draw are popcount(ticket & draw) over both words.
+    """
+    numbers = np.asarray(numbers, dtype=np.uint64).reshape(-1, 5)
+    if len(numbers) and (numbers.min() < 1 or numbers.max() > MAX_NUMBER):
+        raise ValueError(f"Main numbers must be between 1 and {MAX_NUMBER}")
+    bits = np.left_shift(np.uint64(1), (numbers - np.uint64(1)) % np.uint64(64))
+    low = np.bitwise_or.reduce(np.where(numbers <= 64, bits, np.uint64(0)), axis=1)
+    high = np.bitwise_or.reduce(np.where(numbers > 64, bits, np.uint64(0)), axis=1)
+    return low, high
+
+
+def parse_tickets(tickets, game):
+    """Validate tickets ({'numbers': [5 ints], <special>: int}) into main and special arrays"""
+    spec = GAMES[game]
+    special_field = spec['special']
+    if len(tickets) > LOTTERY_MAX_TICKETS:
+        raise ValueError(f"At most {LOTTERY_MAX_TICKETS} tickets can be checked at once")
+    numbers = np.empty((len(tickets), 5), dtype=np.int64)
+    special = np.empty(len(tickets), dtype=np.uint8)
+    for i, ticket in enumerate(tickets):
+        main = [int(n) for n in ticket['numbers']]
+        if len(main) != 5 or len(set(main)) != 5 or not all(1 <= n <= spec['main_max'] for n in main):
+            raise ValueError(f"A ticket needs 5 different main numbers between 1 and {spec['main_max']}")
+        ball = int(ticket[special_field])
+        if not 1 <= ball <= spec['special_max']:
+            raise ValueError(f"The {special_field} must be between 1 and {spec['special_max']}")
+        numbers[i] = main
+        special[i] = ball
+    return numbers, special
+
+
+class DrawIndex:
+    """Bitsets of a game's draws, extended as draws are appended to the archive"""
+
+    def __init__(self):
+        self.days = np.empty(0, dtype=np.int32)
+        self.low = np.empty(0, dtype=np.uint64)
+        self.high = np.empty(0, dtype=np.uint64)
+        self.special = np.empty(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.days)
+
+    def update(self, draws):
+        """Encode the draws past those already indexed"""
+        new = draws[len(self.days):]
+        if not len(new):
+            return 0
+        low, high = encode_numbers(new['numbers'])
+        self.days = np.concatenate([self.days, new['day']])
+        self.low = np.concatenate([self.low, low])
+        self.high = np.concatenate([self.high, high])
+        self.special = np.concatenate([self.special, new['special']])
+        return len(new)
+
+    def snapshot(self):
+        """Return an index of the draws indexed so far that later updates leave untouched
+
+        update() replaces the arrays rather than growing them in place, so
+        the snapshot shares them without copying.
+        """
+        snapshot = DrawIndex.__new__(DrawIndex)
+        snapshot.days, snapshot.low, snapshot.high, snapshot.special = self.days, self.low, self.high, self.special
+        return snapshot
+
+    def score(self, numbers, special):
+        """Count, per ticket, the draws falling in each (main, special) match combination
+
+        Returns an int64 array of shape (tickets, 12) indexed by main * 2 +
+        special matched. Tickets are scored in chunks against every draw at
+        once: AND the bitsets, popcount, compare the special balls. Only
+        pairs in a prize tier (3+ main matches or the special ball) are
+        histogrammed; the non-winning 0, 1 and 2 columns are left at zero.
+        """
+        low, high = encode_numbers(numbers)
+        special = np.asarray(special, dtype=np.uint8)
+        draws = len(self.days)
+        counts = np.zeros((len(low), 12), dtype=np.int64)
+        if not draws or not len(low):
+            return counts
+
+        chunk = max(1, SCORE_CHUNK_BYTES // (8 * draws))
+        words = np.empty((chunk, draws), dtype=np.uint64)
+        main = np.empty((chunk, draws), dtype=np.uint8)
+        extra = np.empty((chunk, draws), dtype=np.uint8)
+        matched = np.empty((chunk, draws), dtype=bool)
+        prize = np.empty((chunk, draws), dtype=bool)
+        draws_use_high = bool(self.high.any())
+
+        for start in range(0, len(low), chunk):
+            stop = min(start + chunk, len(low))
+            rows = stop - start
+            w, m, x, s, p = words[:rows], main[:rows], extra[:rows], matched[:rows], prize[:rows]
+            np.bitwise_and(low[start:stop, None], self.low, out=w)
+            popcount(w, out=m)
+            if draws_use_high and high[start:stop].any():
+                np.bitwise_and(high[start:stop, None], self.high, out=w)
+                popcount(w, out=x)
+                m += x
+            np.equal(special[start:stop, None], self.special, out=s)
+            np.greater_equal(m, 3, out=p)
+            p |= s
+            hits = np.flatnonzero(p)
+            codes = m.ravel()[hits].astype(np.intp) * 2 + s.ravel()[hits]
+            counts[start:stop] = np.bincount(hits // draws * 12 + codes, minlength=rows * 12).reshape(rows, 12)
+        return counts
+
+
+class FrequencyStats:
+    """How often each number has been drawn, all time and over the latest window
+
+    Updated incrementally: each update only counts the draws appended since
+    the last one, and takes those sliding out of the window back off.
+    """
+
+    def __init__(self, window=HOT_COLD_WINDOW):
+        self.window = window
+        self.seen = 0
+        self.main = np.zeros(MAX_NUMBER + 1, dtype=np.int64)
+        self.special = np.zeros(256, dtype=np.int64)
+        self.recent_main = np.zeros(MAX_NUMBER + 1, dtype=np.int64)
+        self.recent_special = np.zeros(256, dtype=np.int64)
+        self.last_main = np.full(MAX_NUMBER + 1, -1, dtype=np.int64)  # index of the last draw with the number
+        self.last_special = np.full(256, -1, dtype=np.int64)
+
+    def update(self, draws):
+        total = len(draws)
+        if total <= self.seen:
+            return 0
+        new = draws[self.seen:]
+        self.main += np.bincount(new['numbers'].ravel(), minlength=len(self.main))[:len(self.main)]
+        self.special += np.bincount(new['special'], minlength=256)
+
+        # Window counts: add the new draws still inside it, remove those that left
+        old_start = max(0, self.seen - self.window)
+        new_start = max(0, total - self.window)
+        entering = draws[max(self.seen, new_start):]
+        leaving = draws[old_start:min(new_start, self.seen)]
+        self.recent_main += np.bincount(entering['numbers'].ravel(), minlength=len(self.main))[:len(self.main)]
+        self.recent_special += np.bincount(entering['special'], minlength=256)
+        if len(leaving):
+            self.recent_main -= np.bincount(leaving['numbers'].ravel(), minlength=len(self.main))[:len(self.main)]
+            self.recent_special -= np.bincount(leaving['special'], minlength=256)
+
+        # Latest occurrence of each number
+        positions = np.arange(self.seen, total)
+        np.maximum.at(self.last_main, new['numbers'].ravel(), np.repeat(positions, 5))
+        np.maximum.at(self.last_special, new['special'], positions)
+        added = total - self.seen
+        self.seen = total
+        return added
+
+    def report(self, main_max, special_max, count=HOT_COLD_COUNT):
+        """Return counts, draws since last seen, and hot and cold numbers of the current matrix"""
+        def ball(all_time, recent, last, top):
+            numbers = np.arange(1, top + 1)
+            since = np.where(last[1:top + 1] >= 0, self.seen - 1 - last[1:top + 1], self.seen)
+            order = np.lexsort((numbers, -recent[1:top + 1]))
+            cold = np.lexsort((numbers, recent[1:top + 1]))
+            return {
+                'counts': {format_lottery_number(n): int(c) for n, c in zip(numbers, all_time[1:top + 1])},
+                'draws_since': {format_lottery_number(n): int(s) for n, s in zip(numbers, since)},
+                'hot': [format_lottery_number(n) for n in numbers[order[:count]]],
+                'cold': [format_lottery_number(n) for n in numbers[cold[:count]]],
+            }
+        return {
+            'draws': self.seen,
+            'window': min(self.window, self.seen),
+            'main': ball(self.main, self.recent_main, self.last_main, main_max),
+            'special': ball(self.special, self.recent_special, self.last_special, special_max),
+        }
+
+
+class _GameEngine:
+    def __init__(self):
+        self.index = DrawIndex()
+        self.frequencies = FrequencyStats()
+        self.lock = threading.Lock()
+
+
+class TicketChecker:
+    """Scores tickets against a game's full draw history and tracks number frequencies
+
+    Both the draw bitsets and the frequency counts follow the archive
+    incrementally, so a new draw costs one encode and one count update.
+    """
+
+    def __init__(self, archive=None):
+        self.archive = archive or lottery_archive
+        self._games = {game: _GameEngine() for game in GAMES}
+
+    def _sync(self, game):
+        """Catch the game up with its archive; returns the engine and a snapshot of its index
+
+        Scoring runs outside the lock, against the snapshot, so a concurrent
+        update cannot hand it arrays of different lengths.
+        """
+        engine = self._games[game]
+        draws = self.archive.draws(game)
+        with engine.lock:
+            if len(draws) > len(engine.index):
+                engine.index.update(draws)
+                engine.frequencies.update(draws)
+            return engine, engine.index.snapshot()
+
+    def check(self, game, tickets):
+        """Return each ticket's draw count per prize tier, total wins and best tier"""
+        numbers, special = parse_tickets(tickets, game)
+        _, index = self._sync(game)
+        counts = index.score(numbers, special)
+        results = []
+        for ticket, row in zip(tickets, counts):
+            tiers = {tier_name(main, matched): int(row[main * 2 + matched]) for main, matched in PRIZE_TIERS}
+            best = next((name for name, hits in tiers.items() if hits), None)
+            results.append({
+                'numbers': [format_lottery_number(n) for n in sorted(int(n) for n in ticket['numbers'])],
+                GAMES[game]['special']: format_lottery_number(int(ticket[GAMES[game]['special']])),
+                'tiers': tiers,
+                'wins': sum(tiers.values()),
+                'best': best,
+            })
+        return {
+            'game': game,
+            'draws_checked': len(index),
+            'since': draw_date(index.days[0]) if len(index) else None,
+            'tickets': results,
+        }
+
+    def frequencies(self, game):
+        engine, _ = self._sync(game)
+        spec = GAMES[game]
+        with engine.lock:
+            return engine.frequencies.report(spec['main_max'], spec['special_max'])
+
+
+ticket_checker = TicketChecker()
@@ -0,0 +1,251 @@
+import os
+import time
+import sqlite3
+import heapq
+import itertools
+import threading
+import functools
+import logging
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from profiling import span
+from shared_cache import shared_cache
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Sustained upstream calls per second and how many may go out back to back,
+# for the whole node: every process draws from one bucket in the shared cache
+UPSTREAM_RATE = float(os.getenv('UPSTREAM_RATE', '5'))
+UPSTREAM_BURST = int(os.getenv('UPSTREAM_BURST', '10'))
+
+# Lower runs first: user-facing requests before background collection
+PRIORITY_USER = 0
+PRIORITY_BACKGROUND = 1
+PRIORITY_NAMES = {PRIORITY_USER: 'user', PRIORITY_BACKGROUND: 'background'}
+
+_local = threading.local()
+
+
+def current_priority():
+    """Return the upstream priority of the calling thread (user by default)"""
+    return getattr(_local, 'priority', PRIORITY_USER)
+
+
+@contextmanager
+def upstream_priority(priority):
+    """Run the enclosed upstream calls at the given priority"""
+    previous = current_priority()
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def with_priority(fn, priority=None):
+    """Wrap fn to run at priority, by default the caller's, on another thread"""
+    priority = current_priority() if priority is None else priority
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with upstream_priority(priority):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+class TokenBucket:
+    """Allows `rate` operations per second on average and `burst` at once"""
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+
+    def take(self):
+        """Take a token; returns 0 on success or the seconds until one is available"""
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+
+class SharedTokenBucket:
+    """TokenBucket kept in a SharedCache, so every process on the node shares its budget
+
+    If the cache file cannot be used, each process falls back to a bucket of
+    its own at the full rate and logs why.
+    """
+
+    def __init__(self, cache, key, rate, burst, clock=time.monotonic):
+        self.cache = cache
+        self.key = key
+        self.rate = rate
+        self.burst = burst
+        self._fallback = TokenBucket(rate, burst, clock)
+
+    def take(self):
+        try:
+            return self.cache.take_token(self.key, self.rate, self.burst)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared token bucket unavailable, limiting this process alone: {str(e)}")
+            return self._fallback.take()
+
+
+class _Ticket:
+    def __init__(self, key, priority, seq, enqueued_at):
+        self.key = key
+        self.priority = priority
+        self.seq = seq
+        self.enqueued_at = enqueued_at
+        self.granted = threading.Event()
+        self.future = Future()
+
+
+class UpstreamGateway:
+    """Admits upstream calls through one token bucket in priority order
+
+    Callers are never rejected: each call waits in a priority queue until
+    the dispatcher grants it a token, then runs on the caller's own thread.
+    Calls with the same key that are queued or running at the same time
+    share one upstream call, and a higher-priority caller joining a queued
+    call raises the call's priority. Given a shared cache, the bucket is the
+    node-wide one in it, so the web workers and the scheduler together stay
+    within the rate.
+    """
+
+    def __init__(self, rate=UPSTREAM_RATE, burst=UPSTREAM_BURST, clock=time.monotonic, shared=None):
+        if shared is not None:
+            self._bucket = SharedTokenBucket(shared, 'upstream', rate, burst, clock)
+        else:
+            self._bucket = TokenBucket(rate, burst, clock)
+        self._clock = clock
+        self._queue = []  # (priority, seq, ticket); stale entries are skipped
+        self._tickets = {}  # key -> ticket queued or running
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._thread = None
+        self._pid = None
+        self.calls = 0
+        self.coalesced = 0
+        self.waits = {name: {'count': 0, 'total': 0.0, 'max': 0.0} for name in PRIORITY_NAMES.values()}
+
+    def call(self, key, fn, priority=None):
+        """Run fn once a token is granted, sharing the result with concurrent calls for key"""
+        priority = current_priority() if priority is None else priority
+        with self._lock:
+            self._ensure_thread()
+            ticket = self._tickets.get(key)
+            if ticket is not None:
+                self.coalesced += 1
+                self._raise_priority(ticket, priority)
+                leader = False
+            else:
+                ticket = _Ticket(key, priority, next(self._seq), self._clock())
+                self._tickets[key] = ticket
+                heapq.heappush(self._queue, (priority, ticket.seq, ticket))
+                self._ready.notify()
+                leader = True
+
+        if not leader:
+            with span('upstream_wait', key[0] if isinstance(key, tuple) else str(key)):
+                return ticket.future.result()
+
+        with span('upstream_wait', key[0] if isinstance(key, tuple) else str(key)):
+            ticket.granted.wait()
+        try:
+            result = fn()
+        except Exception as e:
+            ticket.future.set_exception(e)
+            raise
+        else:
+            ticket.future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._tickets.pop(key, None)
+
+    def prioritize(self, key, priority=None):
+        """Raise the priority of a queued call for key, if there is one"""
+        priority = current_priority() if priority is None else priority
+        with self._lock:
+            ticket = self._tickets.get(key)
+            if ticket is not None:
+                self._raise_priority(ticket, priority)
+
+    def _raise_priority(self, ticket, priority):
+        # The old heap entry goes stale and is dropped when it surfaces
+        if priority < ticket.priority and not ticket.granted.is_set():
+            ticket.priority = priority
+            heapq.heappush(self._queue, (priority, ticket.seq, ticket))
+            self._ready.notify()
+
+    def _ensure_thread(self):
+        # Started lazily and again after a fork, since threads do not survive one
+        if self._thread is None or self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._dispatch, name='upstream-gateway', daemon=True)
+            self._thread.start()
+
+    def _peek(self):
+        """Return the most urgent live ticket without removing it, or None"""
+        while self._queue:
+            priority, _, ticket = self._queue[0]
+            if priority == ticket.priority and not ticket.granted.is_set():
+                return ticket
+            heapq.heappop(self._queue)
+        return None
+
+    def _dispatch(self):
+        while True:
+            with self._lock:
+                while self._peek() is None:
+                    self._ready.wait()
+            # Outside the lock: a shared bucket may wait on other processes
+            delay = self._bucket.take()
+            if delay == 0:
+                with self._lock:
+                    # Only this thread removes live tickets, so one is still queued;
+                    # it may be a more urgent one that arrived meanwhile
+                    self._peek()
+                    _, _, ticket = heapq.heappop(self._queue)
+                    self._record_wait(ticket)
+                    ticket.granted.set()
+                continue
+            time.sleep(delay)
+
+    def _record_wait(self, ticket):
+        waited = self._clock() - ticket.enqueued_at
+        stats = self.waits[PRIORITY_NAMES.get(ticket.priority, 'background')]
+        stats['count'] += 1
+        stats['total'] += waited
+        stats['max'] = max(stats['max'], waited)
+        self.calls += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rate': self._bucket.rate,
+                'burst': self._bucket.burst,
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'queued': len(self._tickets) - sum(t.granted.is_set() for t in self._tickets.values()),
+                'waits': {
+                    name: {
+                        'count': wait['count'],
+                        'avg_seconds': round(wait['total'] / wait['count'], 4) if wait['count'] else 0,
+                        'max_seconds': round(wait['max'], 4)
+                    } for name, wait in self.waits.items()
+                }
+            }
+
+
+upstream_gateway = UpstreamGateway(shared=shared_cache)
@@ -0,0 +1,51 @@
+import struct
+
+import numpy as np
+
+# Media type of the columnar time-series encoding
+COLUMNS_MEDIA_TYPE = 'application/vnd.stockstream.columns'
+COLUMNS_MAGIC = b'SSC1'
+
+# magic, point count, first timestamp (epoch seconds)
+HEADER = struct.Struct('<4sIq')
+
+
+def wants_columns(request):
+    """Return True if the client asked for the columnar encoding
+
+    Either ?format=columns or an Accept header naming COLUMNS_MEDIA_TYPE
+    selects it; everything else keeps the JSON response.
+    """
+    requested = request.args.get('format')
+    if requested:
+        return requested == 'columns'
+    return request.accept_mimetypes[COLUMNS_MEDIA_TYPE] > request.accept_mimetypes['application/json']
+
+
+def encode_columns(ts, prices):
+    """Pack epoch-second timestamps and prices into one little-endian buffer
+
+    Layout: header, then count float64 prices, then count - 1 int32
+    timestamp deltas. The header is 16 bytes so the prices start 8-byte
+    aligned and can be viewed as a Float64Array without copying.
+    """
+    ts = np.asarray(ts, dtype='<i8')
+    prices = np.asarray(prices, dtype='<f8')
+    first = int(ts[0]) if len(ts) else 0
+    deltas = np.diff(ts).astype('<i4')
+    return HEADER.pack(COLUMNS_MAGIC, len(ts), first) + prices.tobytes() + deltas.tobytes()
+
+
+def decode_columns(body):
+    """Inverse of encode_columns; returns (timestamps, prices) arrays"""
+    magic, count, first = HEADER.unpack_from(body)
+    if magic != COLUMNS_MAGIC:
+        raise ValueError('Not a columnar time-series body')
+    prices = np.frombuffer(body, dtype='<f8', count=count, offset=HEADER.size)
+    deltas = np.frombuffer(body, dtype='<i4', count=max(count - 1, 0), offset=HEADER.size + 8 * count)
+    ts = np.empty(count, dtype='<i8')
+    if count:
+        ts[0] = first
+        np.cumsum(deltas, out=ts[1:])
+        ts[1:] += first
+    return ts, prices
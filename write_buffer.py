@@ -0,0 +1,215 @@
+import os
+import atexit
+import threading
+import time
+import logging
+
+from bson.errors import InvalidDocument
+from pymongo.errors import BulkWriteError, ConnectionFailure, ExecutionTimeout, PyMongoError, WTimeoutError
+
+from metrics import MONGO_WRITES_REJECTED
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Flush once this many documents are buffered...
+WRITE_BUFFER_MAX_SIZE = int(os.getenv('WRITE_BUFFER_MAX_SIZE', '500'))
+# ...or once the oldest buffered document is this many seconds old
+WRITE_BUFFER_FLUSH_INTERVAL = float(os.getenv('WRITE_BUFFER_FLUSH_INTERVAL', '5'))
+# Retry policy for failed flushes
+WRITE_BUFFER_MAX_RETRIES = int(os.getenv('WRITE_BUFFER_MAX_RETRIES', '5'))
+WRITE_BUFFER_BACKOFF = float(os.getenv('WRITE_BUFFER_BACKOFF', '0.5'))
+# Documents kept while MongoDB is unreachable before the oldest are dropped
+WRITE_BUFFER_MAX_PENDING = int(os.getenv('WRITE_BUFFER_MAX_PENDING', '100000'))
+
+DUPLICATE_KEY_ERROR = 11000
+# Server error codes that mean the write may succeed if tried again (network
+# errors, timeouts and primary elections); any other error is permanent
+TRANSIENT_ERROR_CODES = frozenset({
+    6, 7, 50, 89, 91, 189, 262, 9001, 10107, 11600, 11602, 13435, 13436
+})
+TRANSIENT_ERRORS = (ConnectionFailure, ExecutionTimeout, WTimeoutError)
+
+
+def is_transient(error):
+    """Return whether a failed write is worth retrying"""
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    if isinstance(error, PyMongoError) and error.has_error_label('RetryableWriteError'):
+        return True
+    return getattr(error, 'code', None) in TRANSIENT_ERROR_CODES
+
+
+class WriteBehindBuffer:
+    """Buffers documents and writes them to a collection with unordered insert_many
+
+    A background thread flushes the buffer when it reaches max_size documents
+    or when flush_interval seconds have passed since the first buffered
+    document. Writes that failed on a network error or timeout are retried
+    with exponential backoff and then kept for the next flush; documents
+    MongoDB rejects for any other reason (validation, size) are logged,
+    counted and dropped, since no retry can write them. On
+    collections with a unique _id index, documents already written by an
+    earlier attempt are recognised by their duplicate _id and not written
+    twice; time-series collections do not enforce _id uniqueness, so there a
+    retry after an ambiguous network error can store a tick twice.
+    """
+
+    def __init__(self, collection, max_size=WRITE_BUFFER_MAX_SIZE,
+                 flush_interval=WRITE_BUFFER_FLUSH_INTERVAL, max_retries=WRITE_BUFFER_MAX_RETRIES,
+                 backoff=WRITE_BUFFER_BACKOFF, max_pending=WRITE_BUFFER_MAX_PENDING):
+        self.collection = collection
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_pending = max_pending
+        self._docs = []
+        self._first_added = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self.written = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.flushes = 0
+
+    def add(self, doc):
+        """Queue a single document for writing"""
+        self.extend([doc])
+
+    def extend(self, docs):
+        """Queue several documents for writing"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Write buffer is closed")
+            if not self._docs:
+                self._first_added = time.monotonic()
+            self._docs.extend(docs)
+            self._trim()
+            self._ensure_thread()
+            if len(self._docs) >= self.max_size:
+                self._cond.notify()
+
+    def pending(self):
+        """Return the number of documents waiting to be written"""
+        with self._cond:
+            return len(self._docs)
+
+    def flush(self):
+        """Write every buffered document now; returns the number written"""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._docs = self._docs, []
+                self._first_added = None
+            if not batch:
+                return 0
+
+            written, failed = self._write(batch)
+            if failed:
+                # Keep what could not be written for the next flush
+                with self._cond:
+                    self._docs[:0] = failed
+                    self._first_added = time.monotonic()
+                    self._trim()
+            return written
+
+    def close(self):
+        """Stop the background thread and flush whatever is left"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+        if self.pending():
+            logger.error(f"Discarding {self.pending()} buffered documents on shutdown")
+
+    def _write(self, batch):
+        """Insert batch with retries; returns (written, documents still unwritten)"""
+        remaining = batch
+        written = 0
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = self.collection.insert_many(remaining, ordered=False)
+                written += len(result.inserted_ids)
+                remaining = []
+                break
+            except BulkWriteError as e:
+                details = e.details
+                written += details.get('nInserted', 0)
+                retry_indexes = set()
+                for error in details.get('writeErrors', []):
+                    code = error.get('code')
+                    if code == DUPLICATE_KEY_ERROR:
+                        # Already written by a previous attempt
+                        written += 1
+                    elif code in TRANSIENT_ERROR_CODES:
+                        retry_indexes.add(error['index'])
+                    else:
+                        self._reject(1, code, error.get('errmsg'))
+                remaining = [doc for i, doc in enumerate(remaining) if i in retry_indexes]
+                if not remaining:
+                    break
+                logger.error(f"Bulk write failed for {len(remaining)} documents (attempt {attempt + 1})")
+            except (PyMongoError, InvalidDocument) as e:
+                # DocumentTooLarge and other unencodable documents are InvalidDocument
+                if not is_transient(e):
+                    self._reject(len(remaining), getattr(e, 'code', None) or type(e).__name__, str(e))
+                    remaining = []
+                    break
+                logger.error(f"Error flushing {len(remaining)} documents (attempt {attempt + 1}): {str(e)}")
+
+            if attempt < self.max_retries:
+                time.sleep(min(self.backoff * 2 ** attempt, 30))
+
+        self.written += written
+        self.flushes += 1
+        return written, remaining
+
+    def _reject(self, count, code, message):
+        """Drop documents MongoDB will never accept"""
+        self.rejected += count
+        MONGO_WRITES_REJECTED.labels(self.collection.name, str(code)).inc(count)
+        logger.error(f"Dropping {count} documents rejected by MongoDB ({code}): {message}")
+
+    def _trim(self):
+        """Drop the oldest documents when the backlog exceeds max_pending"""
+        overflow = len(self._docs) - self.max_pending
+        if overflow > 0:
+            del self._docs[:overflow]
+            self.dropped += overflow
+            logger.error(f"Write buffer full, dropped {overflow} oldest documents")
+
+    def _ensure_thread(self):
+        """Start the flusher thread on first use (after any fork)"""
+        if self._thread is None:
+            atexit.register(self.close)
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """Background loop flushing on size or age"""
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if len(self._docs) >= self.max_size:
+                        break
+                    if self._docs:
+                        age = time.monotonic() - self._first_added
+                        if age >= self.flush_interval:
+                            break
+                        self._cond.wait(self.flush_interval - age)
+                    else:
+                        self._cond.wait()
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Error in write-behind flush: {str(e)}")